@@ -0,0 +1,254 @@
+"""
+Análise por pergunta e por dimensão sobre a matriz participantes × perguntas.
+
+A matriz é um bytes com um participante por linha e uma pergunta por
+coluna (valor de 1 a 5; 0 = sem resposta), o mesmo layout de
+resposta_compacta. Cada coluna é uma fatia da matriz (dados[i::largura])
+e as contas saem de bytes.count/translate, de somas de colunas inteiras
+(somar_colunas) e de map sobre as fatias, sem laço Python por resposta.
+"""
+import math
+from bisect import bisect_right
+from itertools import compress
+from operator import add, mul, truediv
+
+import pontuacao
+
+VALORES = (1, 2, 3, 4, 5)
+PERCENTIS = (10, 25, 50, 75, 90)
+
+# byte → 1 se houve resposta
+_RESPONDIDA = bytes([0] + [1] * 255)
+# byte → quadrado do valor (respostas vão até 5)
+_QUADRADO = bytes(v * v if v < 16 else 0 for v in range(256))
+
+
+class Matriz:
+    """
+    Participantes × perguntas; `perguntas` é o id de cada coluna.
+    `segmentos`, opcional, tem uma tupla de atributos (setor, turno...)
+    por linha, na ordem das linhas.
+    """
+    def __init__(self, perguntas, dados, segmentos=None):
+        self.perguntas = tuple(perguntas)
+        self.largura = len(self.perguntas)
+        self.dados = bytes(dados)
+        self.participantes = len(self.dados) // self.largura if self.largura else 0
+        self.segmentos = list(segmentos) if segmentos is not None else []
+
+    def coluna(self, i):
+        return self.dados[i::self.largura]
+
+
+def somar_colunas(colunas):
+    """
+    Soma byte a byte: participante i do resultado = soma das colunas na
+    posição i. Cada coluna vira um inteiro de um byte por participante e
+    a soma é feita de uma vez pelo int do Python. Uma soma acima de 255
+    invadiria o byte vizinho, então as colunas são somadas em grupos
+    cujos máximos somam até 255 (51 itens de valor 5) e os grupos são
+    juntados com map. Retorna bytes, ou lista de int com mais de um grupo.
+    """
+    n = len(colunas[0]) if colunas else 0
+    grupos = [[]]
+    limite = 0
+    for coluna in colunas:
+        maximo = max(coluna, default=0)
+        if grupos[-1] and limite + maximo > 255:
+            grupos.append([])
+            limite = 0
+        grupos[-1].append(coluna)
+        limite += maximo
+
+    total = None
+    for grupo in grupos:
+        soma = sum(int.from_bytes(coluna, "little") for coluna in grupo).to_bytes(n, "little")
+        total = soma if total is None else list(map(add, total, soma))
+    return total
+
+def _percentil(ordenados, p):
+    """Interpolação linear entre as posições vizinhas (como numpy.percentile)."""
+    posicao = (len(ordenados) - 1) * p / 100
+    abaixo = math.floor(posicao)
+    acima = min(abaixo + 1, len(ordenados) - 1)
+    return ordenados[abaixo] + (ordenados[acima] - ordenados[abaixo]) * (posicao - abaixo)
+
+def _variancia(soma, soma_quadrados, n):
+    """Variância amostral a partir da soma e da soma dos quadrados."""
+    return (soma_quadrados - soma * soma / n) / (n - 1)
+
+def resumo_perguntas(matriz):
+    """[{pergunta_id, respostas, media, distribuicao}] na ordem das colunas."""
+    resumo = []
+    for i, pergunta_id in enumerate(matriz.perguntas):
+        coluna = matriz.coluna(i)
+        distribuicao = [coluna.count(valor) for valor in VALORES]
+        respostas = sum(distribuicao)
+        resumo.append({
+            "pergunta_id": pergunta_id,
+            "respostas": respostas,
+            "media": round(sum(coluna) / respostas, 2) if respostas else None,
+            "distribuicao": distribuicao,
+        })
+    return resumo
+
+def alfa_cronbach(colunas):
+    """
+    Alfa de Cronbach dos itens de uma dimensão, só com os participantes
+    que responderam todos eles. None com menos de 2 itens ou 2 participantes.
+    """
+    k = len(colunas)
+    if k < 2:
+        return None
+    respondidas = somar_colunas([coluna.translate(_RESPONDIDA) for coluna in colunas])
+    completos = list(map(k.__eq__, respondidas))
+    colunas = [bytes(compress(coluna, completos)) for coluna in colunas]
+    n = len(colunas[0])
+    if n < 2:
+        return None
+
+    variancia_itens = sum(
+        _variancia(sum(coluna), sum(coluna.translate(_QUADRADO)), n) for coluna in colunas
+    )
+    totais = somar_colunas(colunas)
+    variancia_total = _variancia(sum(totais), sum(map(mul, totais, totais)), n)
+    if variancia_total == 0:
+        return None
+    return k / (k - 1) * (1 - variancia_itens / variancia_total)
+
+def resumo_dimensao(colunas):
+    """
+    Estatísticas das médias individuais de uma dimensão: média, desvio
+    padrão, percentis, fração de participantes em cada faixa de risco
+    e alfa de Cronbach.
+    """
+    somas = somar_colunas(colunas)
+    respondidas = somar_colunas([coluna.translate(_RESPONDIDA) for coluna in colunas])
+    # só quem respondeu algum item da dimensão (n > 0)
+    medias = sorted(map(truediv, compress(somas, respondidas), filter(None, respondidas)))
+    alfa = alfa_cronbach(colunas)
+
+    resumo = {
+        "itens": len(colunas),
+        "participantes": len(medias),
+        "media": None,
+        "desvio_padrao": None,
+        "percentis": {},
+        "faixas_risco": {},
+        "alfa_cronbach": round(alfa, 3) if alfa is not None else None,
+    }
+    if not medias:
+        return resumo
+
+    n = len(medias)
+    media = math.fsum(medias) / n
+    desvio = None
+    if n > 1:
+        variancia = _variancia(math.fsum(medias), math.fsum(map(mul, medias, medias)), n)
+        desvio = round(math.sqrt(max(variancia, 0)), 2)
+    baixo = bisect_right(medias, pontuacao.LIMITE_BAIXO_RISCO)
+    intermediario = bisect_right(medias, pontuacao.LIMITE_RISCO_INTERMEDIARIO) - baixo
+    resumo.update({
+        "media": round(media, 2),
+        "desvio_padrao": desvio,
+        "percentis": {f"p{p}": round(_percentil(medias, p), 2) for p in PERCENTIS},
+        "faixas_risco": {
+            "baixo": round(baixo / n, 3),
+            "intermediario": round(intermediario / n, 3),
+            "alto": round((n - baixo - intermediario) / n, 3),
+        },
+    })
+    return resumo
+
+def _media_individual(soma, n):
+    return soma / n if n else None
+
+def _suprimir(grupos, minimo):
+    """
+    Valores dos grupos que não podem aparecer: os com menos de `minimo`
+    participantes e, enquanto os suprimidos somarem menos de `minimo`,
+    também o menor dos visíveis (senão os suprimidos saem juntos do
+    total da empresa menos os outros).
+    """
+    suprimidos = {valor for valor, (n, _, _) in grupos.items() if n < minimo}
+    visiveis = sorted((valor for valor in grupos if valor not in suprimidos),
+                      key=lambda valor: grupos[valor][0], reverse=True)
+    ocultos = sum(grupos[valor][0] for valor in suprimidos)
+    while suprimidos and ocultos < minimo and visiveis:
+        valor = visiveis.pop()
+        suprimidos.add(valor)
+        ocultos += grupos[valor][0]
+    return suprimidos
+
+def medias_por_segmento(matriz, dimensoes, atributos, minimo):
+    """
+    Médias das dimensões em cada segmento (um valor de um atributo do
+    participante), com a mesma média de médias individuais da empresa.
+    As médias individuais saem de somar_colunas por dimensão e os
+    segmentos de todos os atributos são acumulados numa única passada
+    pelas linhas. Valor None é "não informado"; atributos que ninguém
+    informou ficam de fora.
+
+    dimensoes: [(nome, [índices de coluna])]; atributos: nomes na ordem
+    das tuplas de matriz.segmentos.
+    {atributo: {"segmentos": [{segmento, participantes, medias: {dimensao: média}}],
+                "suprimidos": n}}
+    """
+    individuais = []
+    for _, indices in dimensoes:
+        colunas = [matriz.coluna(i) for i in indices]
+        respondidas = somar_colunas([coluna.translate(_RESPONDIDA) for coluna in colunas])
+        individuais.append(list(map(_media_individual, somar_colunas(colunas), respondidas)))
+
+    # {valor: [participantes, [soma das médias], [participantes com média]]} por atributo
+    grupos = [{} for _ in atributos]
+    por_linha = zip(*individuais) if individuais else [()] * matriz.participantes
+    for segmento, medias in zip(matriz.segmentos, por_linha):
+        for por_valor, valor in zip(grupos, segmento):
+            grupo = por_valor.get(valor)
+            if grupo is None:
+                grupo = por_valor[valor] = [0, [0.0] * len(dimensoes), [0] * len(dimensoes)]
+            grupo[0] += 1
+            for d, media in enumerate(medias):
+                if media is not None:
+                    grupo[1][d] += media
+                    grupo[2][d] += 1
+
+    resultado = {}
+    for atributo, por_valor in zip(atributos, grupos):
+        if set(por_valor) <= {None}:
+            continue
+        suprimidos = _suprimir(por_valor, minimo)
+        # valores em ordem alfabética, "não informado" por último
+        ordem = sorted((valor for valor in por_valor if valor not in suprimidos),
+                       key=lambda valor: (valor is None, valor or ""))
+        resultado[atributo] = {
+            "segmentos": [
+                {
+                    "segmento": valor,
+                    "participantes": por_valor[valor][0],
+                    "medias": {
+                        nome: round(soma / n, 2)
+                        for (nome, _), soma, n in zip(dimensoes, *por_valor[valor][1:])
+                        if n
+                    },
+                }
+                for valor in ordem
+            ],
+            "suprimidos": len(suprimidos),
+        }
+    return resultado
+
+def analisar(matriz, dimensoes):
+    """
+    dimensoes: [(nome, [índices de coluna])].
+    {participantes, dimensoes: [{dimensao, ...resumo_dimensao}], perguntas: resumo_perguntas}
+    """
+    return {
+        "participantes": matriz.participantes,
+        "dimensoes": [
+            {"dimensao": nome, **resumo_dimensao([matriz.coluna(i) for i in indices])}
+            for nome, indices in dimensoes
+        ],
+        "perguntas": resumo_perguntas(matriz),
+    }
@@ -1,23 +1,406 @@
-from flask import Flask, render_template, request, redirect, url_for
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib.pagesizes import A4
-from datetime import datetime
+from flask import (
+    Flask, render_template, request, redirect, url_for, abort, jsonify, send_file,
+    Response, stream_with_context, g, has_request_context
+)
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from itertools import groupby
+from werkzeug.datastructures import MultiDict
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
+import atexit
+import click
+import collections
+import cProfile
+import csv
+import hashlib
+import io
+import json
+import multiprocessing
 import sqlite3
 import os
+import pathlib
 import re
+import shutil
+import threading
+import time
+import uuid
+import zipfile
+
+import analise
+import metricas
+import pontuacao
+from pontuacao import classificar_risco
 
 app = Flask(__name__)
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_NAME = os.path.join(BASE_DIR, "avaliacoes.db")
-PASTA_RELATORIOS = os.path.join(BASE_DIR, "relatorios")
+DB_NAME = os.environ.get("AVALIACOES_DB", os.path.join(BASE_DIR, "avaliacoes.db"))
+PASTA_RELATORIOS = os.environ.get("RELATORIOS_DIR", os.path.join(BASE_DIR, "relatorios"))
 os.makedirs(PASTA_RELATORIOS, exist_ok=True)
 
-empresa_id_atual = None
+# Processos que geram PDFs em segundo plano
+RELATORIO_WORKERS = int(os.environ.get("RELATORIO_WORKERS", "2"))
+# Um relatório "gerando" há mais que isso é considerado abandonado
+RELATORIO_TIMEOUT_MIN = int(os.environ.get("RELATORIO_TIMEOUT_MIN", "10"))
+# Limites dos PDFs soltos em PASTA_RELATORIOS; o que passa deles vai
+# para os arquivos zip mensais em PASTA_RELATORIOS/arquivo
+RELATORIOS_MAX_MB = float(os.environ.get("RELATORIOS_MAX_MB", "500"))
+RELATORIOS_MAX_DIAS = float(os.environ.get("RELATORIOS_MAX_DIAS", "90"))
+RELATORIOS_POR_EMPRESA = int(os.environ.get("RELATORIOS_POR_EMPRESA", "3"))
+# Zips mais velhos que isso (meses) são apagados (0 = guardar sempre)
+RELATORIOS_ARQUIVO_MAX_MESES = int(os.environ.get("RELATORIOS_ARQUIVO_MAX_MESES", "0"))
+# Download do PDF entregue ao servidor web (X-Sendfile) em vez do Python
+RELATORIOS_X_SENDFILE = os.environ.get("RELATORIOS_X_SENDFILE", "0") == "1"
+app.config["USE_X_SENDFILE"] = RELATORIOS_X_SENDFILE
+# Intervalo (s) entre verificações da versão das perguntas em controle
+VERSAO_PERGUNTAS_TTL = float(os.environ.get("VERSAO_PERGUNTAS_TTL", "5"))
+# Participantes por transação na importação em lote
+IMPORTACAO_LOTE = int(os.environ.get("IMPORTACAO_LOTE", "2000"))
+# Perfil cProfile das requisições mais lentas que isso (0 = desligado)
+PERFIL_LIMIAR_MS = float(os.environ.get("PERFIL_LIMIAR_MS", "0"))
+PASTA_PERFIS = os.environ.get("PERFIS_DIR", os.path.join(BASE_DIR, "perfis"))
+# Tokens de envio do questionário: validade e quantos ficam em memória
+TOKEN_ENVIO_TTL_HORAS = float(os.environ.get("TOKEN_ENVIO_TTL_HORAS", "24"))
+TOKENS_ENVIO_EM_MEMORIA = int(os.environ.get("TOKENS_ENVIO_EM_MEMORIA", "10000"))
+# Fila de envios com diário em disco e gravação em grupo (1 = ligada)
+FILA_ENVIOS = os.environ.get("FILA_ENVIOS", "0") == "1"
+ARQUIVO_FILA_ENVIOS = os.environ.get(
+    "FILA_ENVIOS_ARQUIVO", os.path.join(BASE_DIR, "fila_envios.jsonl")
+)
+# Máximo de envios por transação e espera (ms) para o lote juntar envios
+FILA_ENVIOS_LOTE = int(os.environ.get("FILA_ENVIOS_LOTE", "500"))
+FILA_ENVIOS_ESPERA_MS = float(os.environ.get("FILA_ENVIOS_ESPERA_MS", "10"))
+# Relatórios, exportação e análises leem uma cópia do banco (1 = ligado)
+LEITURA_SNAPSHOT = os.environ.get("LEITURA_SNAPSHOT", "0") == "1"
+ARQUIVO_SNAPSHOT = os.environ.get(
+    "SNAPSHOT_ARQUIVO", os.path.join(BASE_DIR, "avaliacoes_leitura.db")
+)
+# Idade (s) a partir da qual a cópia é refeita em segundo plano; 0 = nunca
+# (cópia mantida por fora: `flask atualizar-snapshot` no cron, ou uma réplica)
+SNAPSHOT_INTERVALO_S = float(os.environ.get("SNAPSHOT_INTERVALO_S", "60"))
+# Segmentos (setor, turno, cargo) com menos participantes que isso não aparecem
+SEGMENTO_MINIMO = int(os.environ.get("SEGMENTO_MINIMO", "5"))
+
+# =========================
+# MÉTRICAS (expostas em /metrics)
+# =========================
+METRICA_REQUISICOES = metricas.Contador(
+    "http_requisicoes_total", "Requisições atendidas", ("rota", "metodo", "status")
+)
+METRICA_REQUISICAO_SEGUNDOS = metricas.Histograma(
+    "http_requisicao_segundos", "Duração das requisições", ("rota", "metodo")
+)
+METRICA_SQL_SEGUNDOS = metricas.Histograma(
+    "sql_comando_segundos", "Duração de execute/executemany no SQLite", ("operacao", "tabela")
+)
+METRICA_ENVIOS_REPETIDOS = metricas.Contador(
+    "questionario_envios_repetidos_total", "Reenvios descartados pelo token de envio", ("origem",)
+)
+METRICA_FILA_LOTE = metricas.Histograma(
+    "fila_envios_lote", "Envios gravados por transação da fila de envios",
+    baldes=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+)
+METRICA_FILA_REJEITADOS = metricas.Contador(
+    "fila_envios_rejeitados_total", "Envios da fila que falharam ao gravar"
+)
+METRICA_SNAPSHOT_SEGUNDOS = metricas.Histograma(
+    "snapshot_copia_segundos", "Duração da cópia do banco usada nas leituras",
+    baldes=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+)
+METRICA_RELATORIO_SEGUNDOS = metricas.Histograma(
+    "relatorio_fase_segundos", "Duração das fases de gerar_pdf", ("fase",),
+    baldes=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+)
+# Mudanças no layout do PDF devem incrementar isto para invalidar o cache
+LAYOUT_RELATORIO = 5
+
+# =========================
+# CONEXÕES SQLITE
+# =========================
+SQLITE_JOURNAL_MODE = os.environ.get("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_CACHE_KB = int(os.environ.get("SQLITE_CACHE_KB", "16384"))
+
+_ROTULOS_SQL = {}
+_PADRAO_TABELA_SQL = re.compile(
+    r"\b(?:FROM|INTO|UPDATE|TABLE|ON)\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)", re.IGNORECASE
+)
+
+def _observar_sql(sql, duracao):
+    rotulos = _ROTULOS_SQL.get(sql)
+    if rotulos is None:
+        palavras = sql.split(None, 1)
+        tabela = _PADRAO_TABELA_SQL.search(sql)
+        rotulos = _ROTULOS_SQL[sql] = {
+            "operacao": palavras[0].upper() if palavras else "",
+            "tabela": tabela.group(1) if tabela else "",
+        }
+    METRICA_SQL_SEGUNDOS.observar(duracao, **rotulos)
+
+class CursorMedido(sqlite3.Cursor):
+    """Cursor que registra a duração de cada comando em METRICA_SQL_SEGUNDOS."""
+    def execute(self, sql, parametros=()):
+        inicio = time.perf_counter()
+        try:
+            return super().execute(sql, parametros)
+        finally:
+            _observar_sql(sql, time.perf_counter() - inicio)
+
+    def executemany(self, sql, parametros):
+        inicio = time.perf_counter()
+        try:
+            return super().executemany(sql, parametros)
+        finally:
+            _observar_sql(sql, time.perf_counter() - inicio)
+
+class ConexaoReutilizavel(sqlite3.Connection):
+    """
+    Conexão mantida por thread. close() apenas devolve a conexão;
+    uma transação esquecida aberta é desfeita quando o último
+    usuário da thread a devolve. Todos os comandos passam por
+    CursorMedido.
+    """
+    def cursor(self, factory=CursorMedido):
+        return super().cursor(factory)
+
+    def execute(self, sql, parametros=()):
+        return self.cursor().execute(sql, parametros)
+
+    def executemany(self, sql, parametros):
+        return self.cursor().executemany(sql, parametros)
+
+    def close(self):
+        _conexoes.emprestimos -= 1
+        if _conexoes.emprestimos == 0 and self.in_transaction:
+            self.rollback()
+
+    def fechar(self):
+        sqlite3.Connection.close(self)
+
+_conexoes = threading.local()
+_conexoes_lock = threading.Lock()
+# conexões herdadas num fork: nunca fechadas no processo filho
+_herdadas = []
+ESTATISTICAS_POOL = {"criadas": 0, "reutilizadas": 0, "abertas": 0}
+
+def _abrir_conexao():
+    conn = sqlite3.connect(
+        DB_NAME,
+        timeout=SQLITE_BUSY_TIMEOUT_MS / 1000,
+        factory=ConexaoReutilizavel
+    )
+    conn.execute(f"PRAGMA journal_mode = {SQLITE_JOURNAL_MODE}")
+    conn.execute(f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS}")
+    conn.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA cache_size = -{SQLITE_CACHE_KB}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    return conn
+
+def _descartar_conexao(conn):
+    with _conexoes_lock:
+        ESTATISTICAS_POOL["abertas"] -= 1
+    conn.fechar()
+
+class _Guardiao:
+    """Fecha a conexão da thread quando a thread termina."""
+    def __init__(self, conn):
+        self.conn = conn
+        self.pid = os.getpid()
+
+    def __del__(self):
+        if self.pid == os.getpid():
+            _descartar_conexao(self.conn)
 
 def conectar_db():
-    return sqlite3.connect(DB_NAME)
+    conn = getattr(_conexoes, "conn", None)
+
+    if conn is not None and (_conexoes.pid != os.getpid() or _conexoes.db != DB_NAME):
+        if _conexoes.pid != os.getpid():
+            _herdadas.append(_conexoes.guardiao)
+        _conexoes.guardiao = None
+        conn = None
+
+    if conn is None:
+        conn = _abrir_conexao()
+        _conexoes.conn = conn
+        _conexoes.pid = os.getpid()
+        _conexoes.db = DB_NAME
+        _conexoes.emprestimos = 0
+        _conexoes.guardiao = _Guardiao(conn)
+        with _conexoes_lock:
+            ESTATISTICAS_POOL["criadas"] += 1
+            ESTATISTICAS_POOL["abertas"] += 1
+    else:
+        with _conexoes_lock:
+            ESTATISTICAS_POOL["reutilizadas"] += 1
+
+    _conexoes.emprestimos += 1
+    return conn
+
+@app.teardown_request
+def devolver_conexao(_erro=None):
+    """Rede de segurança: requisição interrompida (ex.: abort) sem close()."""
+    conn = getattr(_conexoes, "conn", None)
+    if conn is not None and _conexoes.pid == os.getpid() and _conexoes.emprestimos:
+        _conexoes.emprestimos = 0
+        if conn.in_transaction:
+            conn.rollback()
+
+def estatisticas_pool():
+    with _conexoes_lock:
+        estatisticas = dict(ESTATISTICAS_POOL)
+    estatisticas.update(
+        journal_mode=SQLITE_JOURNAL_MODE,
+        synchronous=SQLITE_SYNCHRONOUS,
+        busy_timeout_ms=SQLITE_BUSY_TIMEOUT_MS,
+        cache_kb=SQLITE_CACHE_KB,
+        leitura=estado_snapshot(),
+    )
+    return estatisticas
+
+# =========================
+# LEITURA EM SNAPSHOT
+# com LEITURA_SNAPSHOT=1, relatórios, exportação e análises leem
+# uma cópia consistente do banco (API de backup do SQLite) em vez
+# do arquivo em que os questionários gravam. A cópia é trocada de
+# uma vez (os.replace) e aberta como imutável, sem locks; cada
+# thread reabre a sua quando o arquivo muda. O mtime do arquivo é
+# o instante dos dados, exposto em /metrics, /estatisticas/db e no
+# cabeçalho X-Dados-De das respostas que leram a cópia.
+# =========================
+_leitura = threading.local()
+_snapshot_lock = threading.Lock()
+
+class ConexaoLeitura(sqlite3.Connection):
+    """
+    Conexão de uma thread com o snapshot. close() não faz nada: ela fica
+    aberta até o arquivo mudar e é liberada quando perde a última
+    referência (um gerador de exportação pode ainda estar lendo nela).
+    """
+    def cursor(self, factory=CursorMedido):
+        return super().cursor(factory)
+
+    def execute(self, sql, parametros=()):
+        return self.cursor().execute(sql, parametros)
+
+    def close(self):
+        pass
+
+def atualizar_snapshot(esperar=True):
+    """
+    Copia o banco para ARQUIVO_SNAPSHOT numa única etapa do backup (em
+    WAL a cópia não bloqueia quem grava) e troca o arquivo. Retorna o
+    instante dos dados, ou None se outra thread já está copiando e
+    esperar=False.
+    """
+    if not _snapshot_lock.acquire(blocking=esperar):
+        return None
+    try:
+        instante = time.time()
+        inicio = time.perf_counter()
+        temporario = f"{ARQUIVO_SNAPSHOT}.{os.getpid()}.tmp"
+        origem = conectar_db()
+        destino = sqlite3.connect(temporario)
+        try:
+            origem.backup(destino)
+            destino.execute("PRAGMA journal_mode = DELETE")
+        finally:
+            destino.close()
+            origem.close()
+        os.utime(temporario, (instante, instante))
+        os.replace(temporario, ARQUIVO_SNAPSHOT)
+        METRICA_SNAPSHOT_SEGUNDOS.observar(time.perf_counter() - inicio)
+        return instante
+    finally:
+        _snapshot_lock.release()
+
+def _atualizar_snapshot_em_segundo_plano():
+    if _snapshot_lock.locked():
+        return
+
+    def atualizar():
+        try:
+            atualizar_snapshot(esperar=False)
+        except Exception:
+            app.logger.exception("falha ao atualizar o snapshot de leitura")
+
+    threading.Thread(target=atualizar, name="snapshot-leitura", daemon=True).start()
+
+def _abrir_snapshot():
+    conn = sqlite3.connect(
+        pathlib.Path(os.path.abspath(ARQUIVO_SNAPSHOT)).as_uri() + "?immutable=1",
+        uri=True,
+        factory=ConexaoLeitura
+    )
+    conn.execute(f"PRAGMA cache_size = -{SQLITE_CACHE_KB}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    return conn
+
+SQL_SNAPSHOT_EM_DIA = """
+    SELECT
+        (SELECT COUNT(*) FROM empresa WHERE id = ?),
+        (SELECT COALESCE(MAX(id), 0) FROM participante WHERE empresa_id = ?)
+"""
+
+def _snapshot_em_dia(conn, empresa_id):
+    """True se o snapshot já tem a empresa e todos os participantes dela."""
+    vivo = conectar_db()
+    try:
+        atual = vivo.execute(SQL_SNAPSHOT_EM_DIA, (empresa_id, empresa_id)).fetchone()
+    finally:
+        vivo.close()
+    return conn.execute(SQL_SNAPSHOT_EM_DIA, (empresa_id, empresa_id)).fetchone() == atual
+
+def conectar_leitura(empresa_id=None):
+    """
+    Conexão para consultas pesadas de leitura. Com LEITURA_SNAPSHOT, o
+    snapshot; sem ele, ou se o snapshot ainda não tem todos os
+    participantes de empresa_id, a conexão de sempre (conectar_db).
+    """
+    if not LEITURA_SNAPSHOT:
+        return conectar_db()
+
+    try:
+        info = os.stat(ARQUIVO_SNAPSHOT)
+    except FileNotFoundError:
+        atualizar_snapshot()
+        info = os.stat(ARQUIVO_SNAPSHOT)
+    if SNAPSHOT_INTERVALO_S and time.time() - info.st_mtime > SNAPSHOT_INTERVALO_S:
+        _atualizar_snapshot_em_segundo_plano()
+
+    identidade = (os.getpid(), info.st_ino, info.st_mtime_ns)
+    if getattr(_leitura, "identidade", None) != identidade:
+        _leitura.conn = _abrir_snapshot()
+        _leitura.identidade = identidade
+    conn = _leitura.conn
+
+    if empresa_id is not None and not _snapshot_em_dia(conn, empresa_id):
+        return conectar_db()
+    if has_request_context():
+        g.dados_de = datetime.fromtimestamp(info.st_mtime).strftime("%Y-%m-%d %H:%M:%S")
+    return conn
+
+def estado_snapshot():
+    """{snapshot, dados_de, defasagem_s} das leituras; defasagem_s None sem cópia."""
+    if not LEITURA_SNAPSHOT:
+        return {"snapshot": False, "dados_de": None, "defasagem_s": None}
+    try:
+        copiado = os.stat(ARQUIVO_SNAPSHOT).st_mtime
+    except FileNotFoundError:
+        return {"snapshot": True, "dados_de": None, "defasagem_s": None}
+    return {
+        "snapshot": True,
+        "dados_de": datetime.fromtimestamp(copiado).strftime("%Y-%m-%d %H:%M:%S"),
+        "defasagem_s": round(time.time() - copiado, 3),
+    }
+
+@app.cli.command("atualizar-snapshot")
+def atualizar_snapshot_cmd():
+    """Refaz agora a cópia do banco usada nas leituras (LEITURA_SNAPSHOT)."""
+    inicio = time.perf_counter()
+    atualizar_snapshot()
+    print(f"{ARQUIVO_SNAPSHOT} atualizado em {time.perf_counter() - inicio:.2f}s")
 
 def criar_tabelas():
     conn = conectar_db()
@@ -90,6 +473,27 @@ def criar_tabelas():
         )
     """)
 
+    # tokens de envio já consumidos (ver TOKENS DE ENVIO)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS token_envio (
+            token TEXT PRIMARY KEY,
+            empresa_id INTEGER NOT NULL,
+            participante_id INTEGER,
+            criado TEXT NOT NULL
+        )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_token_envio_criado ON token_envio (criado)")
+
+    # formato compacto (opcional): um BLOB por participante,
+    # ver RESPOSTAS COMPACTAS
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS resposta_compacta (
+            participante_id INTEGER PRIMARY KEY,
+            valores BLOB NOT NULL,
+            FOREIGN KEY (participante_id) REFERENCES participante(id)
+        )
+    """)
+
     # =========================
     # RELATÓRIOS GERADOS
     # =========================
@@ -106,6 +510,8 @@ def criar_tabelas():
     # =========================
     # EVENTOS CRÍTICOS
     # (sem pontuação COPSOQ)
+    # origem '' registra a própria resposta "Sim",
+    # com ou sem origem marcada
     # =========================
     c.execute("""
         CREATE TABLE IF NOT EXISTS evento_origem (
@@ -118,6 +524,90 @@ def criar_tabelas():
         )
     """)
 
+    # =========================
+    # AGREGADOS POR DIMENSÃO
+    # mantidos na mesma transação de cada submissão
+    # média da dimensão = soma_medias / participantes
+    # =========================
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS agregado_dimensao (
+            empresa_id INTEGER NOT NULL,
+            dimensao_id INTEGER NOT NULL,
+            participantes INTEGER NOT NULL DEFAULT 0,
+            soma_medias REAL NOT NULL DEFAULT 0,
+            soma_valores INTEGER NOT NULL DEFAULT 0,
+            respostas INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (empresa_id, dimensao_id),
+            FOREIGN KEY (empresa_id) REFERENCES empresa(id),
+            FOREIGN KEY (dimensao_id) REFERENCES dimensao(id)
+        )
+    """)
+
+    # respostas por valor (1 a 5) em cada dimensão: histogramas do relatório
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS agregado_distribuicao (
+            empresa_id INTEGER NOT NULL,
+            dimensao_id INTEGER NOT NULL,
+            valor INTEGER NOT NULL,
+            respostas INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (empresa_id, dimensao_id, valor),
+            FOREIGN KEY (empresa_id) REFERENCES empresa(id),
+            FOREIGN KEY (dimensao_id) REFERENCES dimensao(id)
+        )
+    """)
+
+    # participantes que relataram cada evento crítico, por origem;
+    # origem '' = participantes com o evento, qualquer origem
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS agregado_evento (
+            empresa_id INTEGER NOT NULL,
+            pergunta_id INTEGER NOT NULL,
+            origem TEXT NOT NULL,
+            participantes INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (empresa_id, pergunta_id, origem),
+            FOREIGN KEY (empresa_id) REFERENCES empresa(id),
+            FOREIGN KEY (pergunta_id) REFERENCES pergunta(id)
+        )
+    """)
+
+    # =========================
+    # AGREGADOS POR PERÍODO
+    # as mesmas somas de agregado_dimensao por rodada anual
+    # (pontuacao.periodo_de) e, em agregado_carteira, de
+    # todas as empresas juntas
+    # =========================
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS agregado_periodo (
+            empresa_id INTEGER NOT NULL,
+            periodo TEXT NOT NULL,
+            dimensao_id INTEGER NOT NULL,
+            participantes INTEGER NOT NULL DEFAULT 0,
+            soma_medias REAL NOT NULL DEFAULT 0,
+            soma_valores INTEGER NOT NULL DEFAULT 0,
+            respostas INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (empresa_id, periodo, dimensao_id),
+            FOREIGN KEY (empresa_id) REFERENCES empresa(id),
+            FOREIGN KEY (dimensao_id) REFERENCES dimensao(id)
+        )
+    """)
+    # ranking de um período: médias das empresas em ordem, por dimensão
+    c.execute("""
+        CREATE INDEX IF NOT EXISTS idx_agregado_periodo_media
+        ON agregado_periodo (periodo, dimensao_id, soma_medias / participantes)
+    """)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS agregado_carteira (
+            periodo TEXT NOT NULL,
+            dimensao_id INTEGER NOT NULL,
+            participantes INTEGER NOT NULL DEFAULT 0,
+            soma_medias REAL NOT NULL DEFAULT 0,
+            soma_valores INTEGER NOT NULL DEFAULT 0,
+            respostas INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (periodo, dimensao_id),
+            FOREIGN KEY (dimensao_id) REFERENCES dimensao(id)
+        )
+    """)
+
     conn.commit()
     conn.close()
 
@@ -261,6 +751,185 @@ def migrar_perguntas():
     conn.commit()
     conn.close()
 
+# =========================
+# MIGRAÇÕES VERSIONADAS
+# cada migração roda uma única vez, em ordem; a chave
+# fica registrada em controle (mesmo padrão de
+# 'perguntas_migradas')
+# =========================
+def migracao_agregados(c):
+    """Preenche agregado_dimensao a partir das respostas já existentes."""
+    reconstruir_agregados(c.connection)
+
+def migracao_relatorio_status(c):
+    """
+    relatorio passa a registrar a fila de geração:
+    pendente → gerando → concluido | erro
+    """
+    c.execute("ALTER TABLE relatorio ADD COLUMN status TEXT NOT NULL DEFAULT 'concluido'")
+    c.execute("ALTER TABLE relatorio ADD COLUMN iniciado TEXT")
+    c.execute("ALTER TABLE relatorio ADD COLUMN erro TEXT")
+
+def migracao_relatorio_impressao(c):
+    """Impressão digital das entradas do relatório, para reaproveitar PDFs."""
+    c.execute("ALTER TABLE relatorio ADD COLUMN impressao TEXT")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_relatorio_impressao ON relatorio (empresa_id, impressao)")
+
+def migracao_indices_v1(c):
+    """Índices das consultas quentes (ver CONSULTAS_QUENTES)."""
+    # COUNT(*) por empresa e junção participante → empresa
+    c.execute("CREATE INDEX IF NOT EXISTS idx_participante_empresa ON participante (empresa_id)")
+    # respostas de um participante, cobrindo pergunta e valor
+    c.execute("""
+        CREATE INDEX IF NOT EXISTS idx_resposta_participante
+        ON resposta (participante_id, pergunta_id, valor)
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_resposta_pergunta ON resposta (pergunta_id)")
+    c.execute("""
+        CREATE INDEX IF NOT EXISTS idx_evento_participante
+        ON evento_origem (participante_id, pergunta_id, origem)
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_relatorio_status ON relatorio (status)")
+
+def migracao_perguntas_versao(c):
+    """controle ganha valor/atualizado; registra a versão atual das perguntas."""
+    c.execute("ALTER TABLE controle ADD COLUMN valor TEXT")
+    c.execute("ALTER TABLE controle ADD COLUMN atualizado TEXT")
+    registrar_versao_perguntas(c)
+
+def migracao_agregado_distribuicao(c):
+    """Preenche agregado_distribuicao a partir das respostas já existentes."""
+    reconstruir_agregados(c.connection)
+
+def migracao_agregado_periodo(c):
+    """
+    Preenche agregado_periodo e agregado_carteira; índice do ranking
+    entre empresas em agregado_dimensao.
+    """
+    c.execute("""
+        CREATE INDEX IF NOT EXISTS idx_agregado_dimensao_media
+        ON agregado_dimensao (dimensao_id, soma_medias / participantes)
+    """)
+    reconstruir_agregados(c.connection)
+
+def migracao_agregado_evento(c):
+    """Preenche agregado_evento a partir de evento_origem."""
+    reconstruir_eventos(c)
+
+def migracao_descartar_estatisticas(c):
+    """
+    Apaga o sqlite_stat1 do ANALYZE que indices_v1 rodava: tirado uma vez,
+    com o banco pequeno da atualização, ele fazia o planejador preferir
+    SCAN nas consultas quentes. Sem estatísticas o planejador usa os
+    índices, como num banco novo (verificar-indices confere).
+    """
+    c.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'")
+    if c.fetchone():
+        c.execute("DELETE FROM sqlite_stat1")
+        # a conexão já carregou as estatísticas antigas; isso as recarrega
+        c.execute("ANALYZE sqlite_master")
+
+def migracao_participante_segmento(c):
+    """participante ganha os atributos opcionais dos resultados por segmento."""
+    for atributo in ATRIBUTOS_SEGMENTO:
+        c.execute(f"ALTER TABLE participante ADD COLUMN {atributo} TEXT")
+
+def migracao_relatorio_arquivo(c):
+    """
+    caminho_pdf passa a ser relativo a PASTA_RELATORIOS e nomeado pela
+    impressão (caminho_relatorio); os PDFs existentes são movidos.
+    relatorio ganha a coluna arquivo: o zip onde o PDF foi guardado
+    (concluido → arquivado → expirado, ver limpar_cache_relatorios).
+    """
+    c.execute("ALTER TABLE relatorio ADD COLUMN arquivo TEXT")
+    c.execute("SELECT id, caminho_pdf, impressao FROM relatorio WHERE caminho_pdf != ''")
+    novos = []
+    for relatorio_id, caminho, impressao in c.fetchall():
+        novo = caminho_relatorio(impressao) if impressao else os.path.basename(caminho)
+        destino = arquivo_local(novo)
+        # o caminho antigo pode ser de outro servidor: tenta também a pasta atual
+        for origem in (caminho, os.path.join(PASTA_RELATORIOS, os.path.basename(caminho))):
+            if origem != destino and os.path.exists(origem) and not os.path.exists(destino):
+                os.makedirs(os.path.dirname(destino), exist_ok=True)
+                os.replace(origem, destino)
+        novos.append((novo, relatorio_id))
+    c.executemany("UPDATE relatorio SET caminho_pdf = ? WHERE id = ?", novos)
+    # o arquivamento atualiza todos os pedidos de um mesmo PDF
+    c.execute("CREATE INDEX IF NOT EXISTS idx_relatorio_caminho ON relatorio (caminho_pdf)")
+
+MIGRACOES = [
+    ("agregados_construidos", migracao_agregados),
+    ("relatorio_status", migracao_relatorio_status),
+    ("relatorio_impressao", migracao_relatorio_impressao),
+    ("indices_v1", migracao_indices_v1),
+    ("controle_valor", migracao_perguntas_versao),
+    ("agregado_distribuicao", migracao_agregado_distribuicao),
+    ("agregado_periodo", migracao_agregado_periodo),
+    ("relatorio_arquivo", migracao_relatorio_arquivo),
+    ("agregado_evento", migracao_agregado_evento),
+    ("participante_segmento", migracao_participante_segmento),
+    ("estatisticas_descartadas", migracao_descartar_estatisticas),
+]
+
+def aplicar_migracoes():
+    conn = conectar_db()
+    c = conn.cursor()
+
+    for chave, migracao in MIGRACOES:
+        c.execute("SELECT 1 FROM controle WHERE chave = ?", (chave,))
+        if c.fetchone():
+            continue
+        migracao(c)
+        c.execute("INSERT INTO controle (chave) VALUES (?)", (chave,))
+        conn.commit()
+
+    conn.close()
+
+# =========================
+# VERSÃO DO ESQUEMA
+# com o banco em dia, a inicialização faz uma única consulta
+# em controle em vez de criar_tabelas/migrar_perguntas/
+# aplicar_migracoes. Incrementar VERSAO_ESQUEMA a cada mudança
+# em criar_tabelas ou migrar_perguntas; uma migração nova em
+# MIGRACOES já muda a assinatura sozinha.
+# =========================
+VERSAO_ESQUEMA = 2
+
+def assinatura_esquema():
+    return f"{VERSAO_ESQUEMA}.{len(MIGRACOES)}"
+
+def esquema_atualizado():
+    conn = conectar_db()
+    try:
+        row = conn.execute("SELECT valor FROM controle WHERE chave = 'versao_esquema'").fetchone()
+    except sqlite3.OperationalError:
+        # banco novo (sem controle) ou anterior a controle.valor
+        row = None
+    finally:
+        conn.close()
+    return row is not None and row[0] == assinatura_esquema()
+
+def preparar_banco():
+    """Cria e migra o banco se preciso. Retorna True se algo foi verificado/aplicado."""
+    if esquema_atualizado():
+        return False
+
+    criar_tabelas()
+    migrar_perguntas()
+    aplicar_migracoes()
+
+    conn = conectar_db()
+    with conn:
+        conn.execute("""
+            INSERT INTO controle (chave, valor, atualizado)
+            VALUES ('versao_esquema', ?, ?)
+            ON CONFLICT (chave) DO UPDATE SET
+                valor = excluded.valor,
+                atualizado = excluded.atualizado
+        """, (assinatura_esquema(), datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")))
+    conn.close()
+    return True
+
 ESCALAS = {
     "frequencia_crescente": [
         ("Nunca", 1),
@@ -344,212 +1013,1973 @@ ESCALAS = {
 ]
 }
 
-# FUNÇÕES AUXILIARES
-def nome_seguro(texto):
-    return re.sub(r"[^\w\-]", "_", texto.lower())
+# Valores aceitos por escala, para validar o formulário sem consultar o banco
+VALORES_ESCALA = {
+    escala: {valor for _, valor in opcoes}
+    for escala, opcoes in ESCALAS.items()
+}
+
+# Valores possíveis de uma resposta pontuada (eventos não vão para resposta)
+VALORES_RESPOSTA = (1, 2, 3, 4, 5)
+
+# Origens de um evento crítico (checkboxes origem_<id> do questionário)
+ORIGENS_EVENTO = ("colega", "gestor", "subordinado", "cliente")
+
+# Atributos opcionais do participante (colunas de participante e campos
+# do questionário), usados nos resultados por segmento
+ATRIBUTOS_SEGMENTO = ("setor", "turno", "cargo")
+TURNOS = ("manhã", "tarde", "noite", "integral", "revezamento")
+TAMANHO_SEGMENTO = 60
+
+# =========================
+# CATÁLOGO DE PERGUNTAS
+# carregado uma única vez por processo
+# (o conjunto só muda em migrar_perguntas)
+# =========================
+_catalogo = None
+
+def registrar_versao_perguntas(c):
+    """
+    Grava em controle ('perguntas_versao') o hash do conjunto de perguntas.
+    Deve ser chamada por qualquer rotina que altere a tabela pergunta.
+    """
+    c.execute("SELECT id, dimensao_id, texto, escala FROM pergunta ORDER BY id")
+    conteudo = json.dumps(c.fetchall(), ensure_ascii=False)
+    versao = hashlib.sha256(conteudo.encode("utf-8")).hexdigest()[:16]
+    c.execute("""
+        INSERT INTO controle (chave, valor, atualizado)
+        VALUES ('perguntas_versao', ?, ?)
+        ON CONFLICT (chave) DO UPDATE SET
+            valor = excluded.valor,
+            atualizado = excluded.atualizado
+        WHERE valor IS NOT excluded.valor
+    """, (versao, datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")))
+
+_versao_perguntas = {"valor": None, "atualizado": None, "verificado": float("-inf")}
+
+def versao_perguntas():
+    """
+    (versão, atualizado) do conjunto de perguntas. Consulta controle no
+    máximo a cada VERSAO_PERGUNTAS_TTL segundos; quando a versão muda,
+    descarta o catálogo e a página em memória.
+    """
+    global _versao_perguntas, _catalogo, _pagina_questionario
+    agora = time.monotonic()
+    if agora - _versao_perguntas["verificado"] < VERSAO_PERGUNTAS_TTL:
+        return _versao_perguntas["valor"], _versao_perguntas["atualizado"]
+
+    conn = conectar_db()
+    c = conn.cursor()
+    c.execute("SELECT valor, atualizado FROM controle WHERE chave = 'perguntas_versao'")
+    valor, atualizado = c.fetchone()
+    conn.close()
+
+    if valor != _versao_perguntas["valor"]:
+        _catalogo = None
+        _pagina_questionario = None
+    _versao_perguntas = {
+        "valor": valor,
+        "atualizado": datetime.strptime(atualizado, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc),
+        "verificado": agora,
+    }
+    return _versao_perguntas["valor"], _versao_perguntas["atualizado"]
 
-def calcular_medias_copsoq(respostas_por_dimensao):
-    resultados = {}
-    for dimensao, respostas in respostas_por_dimensao.items():
-        medias_individuais = [sum(r) / len(r) for r in respostas]
-        resultados[dimensao] = round(sum(medias_individuais) / len(medias_individuais), 2)
-    return resultados
-
-def classificar_risco(media):
-    if media <= 2.33:
-        return "🟢 Situação Favorável - Baixo/Nenhum risco - Condição psicossocial boa. Manter boas práticas."
-    elif media <= 3.66:
-        return "🟡 Risco Intermediário - Médio Risco - Moderado(pode indicar início de problemas. Monitorar, promover ações de suporte)."
+def carregar_catalogo():
+    """Retorna {pergunta_id: (dimensao_id, escala)}."""
+    global _catalogo
+    versao_perguntas()
+    if _catalogo is None:
+        conn = conectar_db()
+        c = conn.cursor()
+        c.execute("SELECT id, dimensao_id, escala FROM pergunta ORDER BY id")
+        _catalogo = {pid: (dimensao_id, escala) for pid, dimensao_id, escala in c.fetchall()}
+        conn.close()
+    return _catalogo
+
+def validar_respostas(form):
+    """
+    Converte o formulário em (respostas, eventos) usando apenas o catálogo
+    em memória. Levanta ValueError para pergunta ou valor inválido.
+
+    respostas: [(pergunta_id, valor)]   → tabela resposta
+    eventos:   [(pergunta_id, origem)]  → tabela evento_origem, com
+               (pergunta_id, '') para cada evento respondido "Sim"
+    """
+    catalogo = carregar_catalogo()
+    respostas = []
+    eventos = []
+
+    for campo, valor in form.items():
+        if not campo.startswith("pergunta_"):
+            continue
+
+        pergunta_id = int(campo.replace("pergunta_", ""))
+        resposta_valor = int(valor)
+
+        if pergunta_id not in catalogo:
+            raise ValueError(f"pergunta inexistente: {pergunta_id}")
+        escala = catalogo[pergunta_id][1]
+        if resposta_valor not in VALORES_ESCALA[escala]:
+            raise ValueError(f"valor fora da escala {escala}: {resposta_valor}")
+
+        # PERGUNTA NORMAL (COPSOQ)
+        if escala != "evento":
+            respostas.append((pergunta_id, resposta_valor))
+
+        # EVENTO (registro apenas); conta mesmo sem origem marcada
+        elif resposta_valor > 0:
+            eventos.append((pergunta_id, ""))
+            for origem in dict.fromkeys(form.getlist(f"origem_{pergunta_id}")):
+                if origem not in ORIGENS_EVENTO:
+                    raise ValueError(f"origem inválida: {origem}")
+                eventos.append((pergunta_id, origem))
+
+    return respostas, eventos
+
+def validar_segmento(form):
+    """
+    {setor, turno, cargo} do formulário; None onde o participante não
+    informou. Texto livre é normalizado (espaços, minúsculas) para que
+    "Produção" e " produção" sejam o mesmo segmento. Levanta ValueError
+    para turno fora de TURNOS, texto maior que TAMANHO_SEGMENTO ou com
+    <, > ou & (o texto vai para o PDF).
+    """
+    segmento = {}
+    for atributo in ATRIBUTOS_SEGMENTO:
+        valor = " ".join(form.get(atributo, "").split()).lower() or None
+        if valor is not None and len(valor) > TAMANHO_SEGMENTO:
+            raise ValueError(f"{atributo} com mais de {TAMANHO_SEGMENTO} caracteres")
+        if valor is not None and any(caractere in valor for caractere in "<>&"):
+            raise ValueError(f"{atributo} com caractere inválido (<, > ou &)")
+        segmento[atributo] = valor
+    if segmento["turno"] is not None and segmento["turno"] not in TURNOS:
+        raise ValueError(f"turno inválido: {segmento['turno']}")
+    return segmento
+
+def gravar_participantes(conn, empresa_id, submissoes, data=None):
+    """
+    Grava participantes já validados em inserções em lote.
+    submissoes: [(respostas, eventos)] como retornado por validar_respostas,
+    ou [(respostas, eventos, segmento)] com segmento de validar_segmento.
+    data: quando o envio foi recebido (padrão: agora).
+    Não faz commit — o chamador controla a transação.
+    """
+    c = conn.cursor()
+    data = data or datetime.now().strftime("%Y-%m-%d %H:%M")
+    layout = layout_compacto()
+    linhas_resposta = []
+    linhas_evento = []
+    ids = []
+
+    for respostas, eventos, *segmento in submissoes:
+        segmento = segmento[0] if segmento and segmento[0] else {}
+        c.execute(
+            "INSERT INTO participante (empresa_id, data, setor, turno, cargo) VALUES (?, ?, ?, ?, ?)",
+            (empresa_id, data, *(segmento.get(atributo) for atributo in ATRIBUTOS_SEGMENTO))
+        )
+        participante_id = c.lastrowid
+        ids.append(participante_id)
+        if layout:
+            linhas_resposta.append((participante_id, empacotar_respostas(respostas)))
+        else:
+            linhas_resposta.extend((participante_id, pid, valor) for pid, valor in respostas)
+        linhas_evento.extend((participante_id, pid, origem) for pid, origem in eventos)
+
+    if layout:
+        c.executemany(
+            "INSERT INTO resposta_compacta (participante_id, valores) VALUES (?, ?)",
+            linhas_resposta
+        )
     else:
-        return "🔴 Risco para a Saúde - Alto risco - Intervenção imediata, revisão organizacional. Alto risco psicossocial."
-
-def gerar_pdf(empresa, total, resultados, eventos):
-    nome = nome_seguro(empresa)
-    data = datetime.now().strftime("%Y%m%d_%H%M")
-    caminho = os.path.join(PASTA_RELATORIOS, f"relatorio_{nome}_{data}.pdf")
-
-    estilos = getSampleStyleSheet()
-    elementos = []
-
-    # =============================
-    # CAPA
-    # =============================
-    elementos.append(Paragraph("Relatório de Avaliação Psicossocial", estilos["Title"]))
-    elementos.append(Spacer(1, 20))
-    elementos.append(Paragraph(f"<b>Empresa:</b> {empresa}", estilos["Normal"]))
-    elementos.append(Paragraph(f"<b>Participantes:</b> {total}", estilos["Normal"]))
-    elementos.append(Spacer(1, 30))
-
-    # =============================
-    # DIMENSÕES COM PONTUAÇÃO
-    # =============================
-    for dim, media in resultados.items():
-        elementos.append(Paragraph(dim, estilos["Heading2"]))
-        elementos.append(Spacer(1, 8))
-
-        elementos.append(
-            Paragraph(f"<b>Média da dimensão:</b> {media}", estilos["Normal"])
+        c.executemany(
+            "INSERT INTO resposta (participante_id, pergunta_id, valor) VALUES (?, ?, ?)",
+            linhas_resposta
         )
+    c.executemany(
+        "INSERT INTO evento_origem (participante_id, pergunta_id, origem) VALUES (?, ?, ?)",
+        linhas_evento
+    )
+    atualizar_agregados(
+        c, empresa_id, [submissao[0] for submissao in submissoes], pontuacao.periodo_de(data)
+    )
+    atualizar_eventos(c, empresa_id, [submissao[1] for submissao in submissoes])
+    return ids
+
+# =========================
+# AGREGADOS POR DIMENSÃO
+# =========================
+def atualizar_agregados(c, empresa_id, respostas_por_participante, periodo):
+    """
+    Soma a contribuição de novos participantes de um mesmo período em
+    agregado_dimensao, agregado_distribuicao, agregado_periodo e
+    agregado_carteira.
+    """
+    catalogo = carregar_catalogo()
+    delta = {}
+    distribuicao = {}
+
+    for respostas in respostas_por_participante:
+        por_dimensao = {}
+        for pergunta_id, valor in respostas:
+            dimensao_id = catalogo[pergunta_id][0]
+            soma_n = por_dimensao.setdefault(dimensao_id, [0, 0])
+            soma_n[0] += valor
+            soma_n[1] += 1
+            distribuicao[dimensao_id, valor] = distribuicao.get((dimensao_id, valor), 0) + 1
+
+        for dimensao_id, (soma, n) in por_dimensao.items():
+            d = delta.setdefault(dimensao_id, [0, 0.0, 0, 0])
+            d[0] += 1
+            d[1] += soma / n
+            d[2] += soma
+            d[3] += n
+
+    c.executemany("""
+        INSERT INTO agregado_dimensao
+            (empresa_id, dimensao_id, participantes, soma_medias, soma_valores, respostas)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (empresa_id, dimensao_id) DO UPDATE SET
+            participantes = participantes + excluded.participantes,
+            soma_medias = soma_medias + excluded.soma_medias,
+            soma_valores = soma_valores + excluded.soma_valores,
+            respostas = respostas + excluded.respostas
+    """, [(empresa_id, dimensao_id, *d) for dimensao_id, d in delta.items()])
+
+    c.executemany("""
+        INSERT INTO agregado_periodo
+            (empresa_id, periodo, dimensao_id, participantes, soma_medias, soma_valores, respostas)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (empresa_id, periodo, dimensao_id) DO UPDATE SET
+            participantes = participantes + excluded.participantes,
+            soma_medias = soma_medias + excluded.soma_medias,
+            soma_valores = soma_valores + excluded.soma_valores,
+            respostas = respostas + excluded.respostas
+    """, [(empresa_id, periodo, dimensao_id, *d) for dimensao_id, d in delta.items()])
+
+    c.executemany("""
+        INSERT INTO agregado_carteira
+            (periodo, dimensao_id, participantes, soma_medias, soma_valores, respostas)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (periodo, dimensao_id) DO UPDATE SET
+            participantes = participantes + excluded.participantes,
+            soma_medias = soma_medias + excluded.soma_medias,
+            soma_valores = soma_valores + excluded.soma_valores,
+            respostas = respostas + excluded.respostas
+    """, [(periodo, dimensao_id, *d) for dimensao_id, d in delta.items()])
+
+    c.executemany("""
+        INSERT INTO agregado_distribuicao (empresa_id, dimensao_id, valor, respostas)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (empresa_id, dimensao_id, valor) DO UPDATE SET
+            respostas = respostas + excluded.respostas
+    """, [(empresa_id, dimensao_id, valor, n) for (dimensao_id, valor), n in distribuicao.items()])
+
+def atualizar_eventos(c, empresa_id, eventos_por_participante):
+    """Soma os eventos de novos participantes em agregado_evento."""
+    contagens = {}
+    for eventos in eventos_por_participante:
+        # validar_respostas já descarta origens repetidas na mesma pergunta
+        for pergunta_id, origem in eventos:
+            if origem:
+                contagens[pergunta_id, origem] = contagens.get((pergunta_id, origem), 0) + 1
+        # origem '': quem respondeu "Sim"; registros antigos do diário,
+        # sem a linha '', contam pelas origens
+        for pergunta_id in {pergunta_id for pergunta_id, _ in eventos}:
+            contagens[pergunta_id, ""] = contagens.get((pergunta_id, ""), 0) + 1
+
+    c.executemany("""
+        INSERT INTO agregado_evento (empresa_id, pergunta_id, origem, participantes)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (empresa_id, pergunta_id, origem) DO UPDATE SET
+            participantes = participantes + excluded.participantes
+    """, [(empresa_id, pergunta_id, origem, n) for (pergunta_id, origem), n in contagens.items()])
+
+def reconstruir_eventos(c, empresa_id=None):
+    """Recalcula agregado_evento a partir de evento_origem. Não faz commit."""
+    filtro = "" if empresa_id is None else " WHERE empresa_id = ?"
+    params = () if empresa_id is None else (empresa_id,)
+    c.execute("DELETE FROM agregado_evento" + filtro, params)
+
+    filtro = "" if empresa_id is None else "AND pa.empresa_id = ?"
+    c.execute(f"""
+        INSERT INTO agregado_evento (empresa_id, pergunta_id, origem, participantes)
+        SELECT pa.empresa_id, eo.pergunta_id, eo.origem, COUNT(DISTINCT eo.participante_id)
+        FROM evento_origem eo
+        JOIN participante pa ON eo.participante_id = pa.id
+        WHERE eo.origem != '' {filtro}
+        GROUP BY pa.empresa_id, eo.pergunta_id, eo.origem
+        UNION ALL
+        SELECT pa.empresa_id, eo.pergunta_id, '', COUNT(DISTINCT eo.participante_id)
+        FROM evento_origem eo
+        JOIN participante pa ON eo.participante_id = pa.id
+        WHERE TRUE {filtro}
+        GROUP BY pa.empresa_id, eo.pergunta_id
+    """, params * 2)
+
+def reconstruir_agregados(conn, empresa_id=None):
+    """
+    Recalcula os agregados a partir das respostas brutas e de
+    evento_origem (todas as empresas, ou só empresa_id); agregado_carteira é sempre refeito
+    inteiro a partir de agregado_periodo. Não faz commit.
+    """
+    c = conn.cursor()
+    filtro = "" if empresa_id is None else " WHERE empresa_id = ?"
+    params = () if empresa_id is None else (empresa_id,)
+
+    c.execute("DELETE FROM agregado_dimensao" + filtro, params)
+    c.execute("DELETE FROM agregado_distribuicao" + filtro, params)
+    c.execute("DELETE FROM agregado_periodo" + filtro, params)
+
+    if respostas_compactas(c):
+        por_dimensao, distribuicao, por_periodo = agregar_respostas_compactas(c, empresa_id)
+        c.executemany("""
+            INSERT INTO agregado_dimensao
+                (empresa_id, dimensao_id, participantes, soma_medias, soma_valores, respostas)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, por_dimensao)
+        c.executemany("""
+            INSERT INTO agregado_distribuicao (empresa_id, dimensao_id, valor, respostas)
+            VALUES (?, ?, ?, ?)
+        """, distribuicao)
+        c.executemany("""
+            INSERT INTO agregado_periodo
+                (empresa_id, periodo, dimensao_id, participantes, soma_medias, soma_valores, respostas)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, por_periodo)
+    else:
+        sql, params = pontuacao.sql_medias_dimensao(empresa_id)
+        c.execute(f"""
+            INSERT INTO agregado_dimensao
+                (empresa_id, dimensao_id, participantes, soma_medias, soma_valores, respostas)
+            SELECT empresa_id, dimensao_id, participantes, soma_medias, soma_valores, respostas
+            FROM ({sql})
+        """, params)
+
+        sql, params = pontuacao.sql_distribuicao(empresa_id)
+        c.execute(f"""
+            INSERT INTO agregado_distribuicao (empresa_id, dimensao_id, valor, respostas)
+            SELECT empresa_id, dimensao_id, valor, respostas
+            FROM ({sql})
+        """, params)
+
+        sql, params = pontuacao.sql_medias_periodo(empresa_id)
+        c.execute(f"""
+            INSERT INTO agregado_periodo
+                (empresa_id, periodo, dimensao_id, participantes, soma_medias, soma_valores, respostas)
+            SELECT empresa_id, periodo, dimensao_id, participantes, soma_medias, soma_valores, respostas
+            FROM ({sql})
+        """, params)
+
+    reconstruir_eventos(c, empresa_id)
+
+    c.execute("DELETE FROM agregado_carteira")
+    c.execute("""
+        INSERT INTO agregado_carteira
+            (periodo, dimensao_id, participantes, soma_medias, soma_valores, respostas)
+        SELECT periodo, dimensao_id, SUM(participantes), SUM(soma_medias),
+               SUM(soma_valores), SUM(respostas)
+        FROM agregado_periodo
+        GROUP BY periodo, dimensao_id
+    """)
 
-        elementos.append(
-            Paragraph(classificar_risco(media), estilos["Normal"])
-        )
+SQL_MEDIAS_EMPRESA = """
+    SELECT d.nome, a.soma_medias / a.participantes
+    FROM agregado_dimensao a
+    JOIN dimensao d ON a.dimensao_id = d.id
+    WHERE a.empresa_id = ? AND a.participantes > 0
+    ORDER BY d.id
+"""
+
+SQL_DISTRIBUICAO_EMPRESA = """
+    SELECT d.nome, a.valor, a.respostas
+    FROM agregado_distribuicao a
+    JOIN dimensao d ON a.dimensao_id = d.id
+    WHERE a.empresa_id = ?
+    ORDER BY d.id, a.valor
+"""
+
+SQL_EVENTOS_EMPRESA = """
+    SELECT p.texto, a.origem, a.participantes
+    FROM agregado_evento a
+    JOIN pergunta p ON a.pergunta_id = p.id
+    WHERE a.empresa_id = ? AND a.participantes > 0
+    ORDER BY p.id
+"""
+
+def medias_empresa(c, empresa_id):
+    """{nome_dimensao: média} lida de agregado_dimensao, na ordem das dimensões."""
+    c.execute(SQL_MEDIAS_EMPRESA, (empresa_id,))
+    return {nome: round(media, 2) for nome, media in c.fetchall()}
+
+def distribuicao_empresa(c, empresa_id):
+    """
+    {nome_dimensao: (n1, n2, n3, n4, n5)}: respostas com cada valor,
+    lidas de agregado_distribuicao, na ordem das dimensões.
+    """
+    c.execute(SQL_DISTRIBUICAO_EMPRESA, (empresa_id,))
+    return _contagens_por_dimensao(c.fetchall())
+
+def eventos_empresa(c, empresa_id):
+    """
+    {texto_pergunta: (participantes, {origem: participantes})} lido de
+    agregado_evento, perguntas na ordem do id e origens na de ORIGENS_EVENTO.
+    """
+    c.execute(SQL_EVENTOS_EMPRESA, (empresa_id,))
+    return _tabela_eventos(c.fetchall())
+
+def _tabela_eventos(linhas):
+    eventos = {}
+    for texto, origem, participantes in linhas:
+        evento = eventos.setdefault(texto, [0, {}])
+        if origem:
+            evento[1][origem] = participantes
+        else:
+            evento[0] = participantes
+    for texto, (total, origens) in eventos.items():
+        # origens fora de ORIGENS_EVENTO (dados antigos) vão no fim
+        ordenadas = {origem: origens[origem] for origem in ORIGENS_EVENTO if origem in origens}
+        ordenadas.update(origens)
+        eventos[texto] = (total, ordenadas)
+    return eventos
+
+def _contagens_por_dimensao(linhas):
+    contagens = {}
+    for dimensao, valor, respostas in linhas:
+        contagens.setdefault(dimensao, [0] * len(VALORES_RESPOSTA))[valor - 1] = respostas
+    return {dimensao: tuple(n) for dimensao, n in contagens.items()}
+
+@app.cli.command("reconstruir-agregados")
+def reconstruir_agregados_cmd():
+    """Recalcula os agregados das respostas brutas e mostra divergências."""
+    conn = conectar_db()
+    c = conn.cursor()
+    c.execute("SELECT empresa_id, dimensao_id, participantes, soma_medias FROM agregado_dimensao")
+    antes = {(e, d): (n, s) for e, d, n, s in c.fetchall()}
+    c.execute("SELECT empresa_id, pergunta_id, origem, participantes FROM agregado_evento")
+    eventos_antes = {(e, p, o): n for e, p, o, n in c.fetchall()}
+
+    with conn:
+        reconstruir_agregados(conn)
+
+    c.execute("SELECT empresa_id, dimensao_id, participantes, soma_medias FROM agregado_dimensao")
+    depois = {(e, d): (n, s) for e, d, n, s in c.fetchall()}
+    c.execute("SELECT empresa_id, pergunta_id, origem, participantes FROM agregado_evento")
+    eventos_depois = {(e, p, o): n for e, p, o, n in c.fetchall()}
+    conn.close()
 
-        elementos.append(Spacer(1, 20))
+    divergentes = [
+        chave for chave in antes.keys() | depois.keys()
+        if chave not in antes or chave not in depois
+        or antes[chave][0] != depois[chave][0]
+        or abs(antes[chave][1] - depois[chave][1]) > 1e-6
+    ]
+    for empresa_id, dimensao_id in sorted(divergentes):
+        print(f"empresa {empresa_id} dimensão {dimensao_id}: "
+              f"{antes.get((empresa_id, dimensao_id))} -> {depois.get((empresa_id, dimensao_id))}")
+    print(f"{len(depois)} agregados reconstruídos, {len(divergentes)} divergentes")
+
+    eventos_divergentes = [
+        chave for chave in eventos_antes.keys() | eventos_depois.keys()
+        if eventos_antes.get(chave) != eventos_depois.get(chave)
+    ]
+    print(f"{len(eventos_depois)} contagens de eventos reconstruídas, "
+          f"{len(eventos_divergentes)} divergentes")
 
-    # =============================
-    # DIMENSÃO 11 — EVENTOS (SEMPRE EXIBIR)
-    # =============================
-    elementos.append(Spacer(1, 30))
-    elementos.append(
-        Paragraph("Comportamentos Ofensivos e Eventos Críticos", estilos["Heading1"])
+# ==================================================
+# RESPOSTAS COMPACTAS (opcional)
+# Em vez de uma linha de resposta por pergunta, um BLOB por
+# participante em resposta_compacta: um byte por pergunta
+# pontuada, na ordem do layout, 0 = sem resposta.
+# Ativado com `flask compactar-respostas` (app parado). O
+# layout gravado em controle não muda; perguntas criadas
+# depois entram no fim, na ordem do id.
+# ==================================================
+_layout_compacto = None
+
+# byte → 1 se houve resposta; soma as respostas por participante
+_RESPONDIDA = bytes([0] + [1] * 255)
+
+def respostas_compactas(c):
+    """True se o banco guarda as respostas em resposta_compacta."""
+    c.execute("SELECT 1 FROM controle WHERE chave = 'layout_respostas'")
+    return c.fetchone() is not None
+
+def layout_compacto():
+    """
+    Ids das perguntas na ordem dos bytes de resposta_compacta,
+    ou () se as respostas ficam em linhas na tabela resposta.
+    """
+    global _layout_compacto
+    catalogo = carregar_catalogo()
+    if _layout_compacto is None or _layout_compacto[0] is not catalogo:
+        conn = conectar_db()
+        c = conn.cursor()
+        c.execute("SELECT valor FROM controle WHERE chave = 'layout_respostas'")
+        row = c.fetchone()
+        conn.close()
+
+        layout = ()
+        if row is not None:
+            gravado = json.loads(row[0])
+            novas = sorted(
+                pid for pid, (_, escala) in catalogo.items()
+                if escala != "evento" and pid not in set(gravado)
+            )
+            layout = tuple(gravado + novas)
+        posicoes = {pid: i for i, pid in enumerate(layout)}
+        _layout_compacto = (catalogo, layout, posicoes)
+    return _layout_compacto[1]
+
+def empacotar_respostas(respostas):
+    """[(pergunta_id, valor)] → bytes no layout compacto."""
+    layout = layout_compacto()
+    posicoes = _layout_compacto[2]
+    valores = bytearray(len(layout))
+    for pergunta_id, valor in respostas:
+        valores[posicoes[pergunta_id]] = valor
+    return bytes(valores)
+
+def desempacotar_respostas(valores):
+    """bytes no layout compacto → [(pergunta_id, valor)], na ordem do layout."""
+    return [(pid, valor) for pid, valor in zip(layout_compacto(), valores) if valor]
+
+def agregar_respostas_compactas(c, empresa_id=None):
+    """
+    Linhas de agregado_dimensao, agregado_distribuicao e agregado_periodo
+    calculadas dos BLOBs. Os participantes de cada empresa e período viram
+    uma matriz de bytes (um participante por linha); cada pergunta é uma
+    fatia dessa matriz, e somas e contagens saem de map/zip/bytes.count
+    sobre as fatias. As linhas da empresa são a soma das dos períodos.
+    """
+    layout = layout_compacto()
+    catalogo = carregar_catalogo()
+    largura = len(layout)
+    posicoes_dimensao = {}
+    for i, pid in enumerate(layout):
+        if pid in catalogo:
+            posicoes_dimensao.setdefault(catalogo[pid][0], []).append(i)
+
+    filtro, params = ("", ()) if empresa_id is None else ("WHERE pa.empresa_id = ?", (empresa_id,))
+    c.execute(f"""
+        SELECT pa.empresa_id, {pontuacao.SQL_PERIODO}, rc.valores
+        FROM resposta_compacta rc
+        JOIN participante pa ON pa.id = rc.participante_id
+        {filtro}
+        ORDER BY pa.empresa_id, 2
+    """, params)
+
+    por_dimensao = {}
+    distribuicao = {}
+    por_periodo = []
+    for (empresa, periodo), linhas in groupby(c, key=lambda row: row[:2]):
+        # BLOBs gravados antes de uma pergunta nova são mais curtos
+        matriz = b"".join(valores.ljust(largura, b"\0") for _, _, valores in linhas)
+
+        for dimensao_id, posicoes in posicoes_dimensao.items():
+            colunas = [matriz[i::largura] for i in posicoes]
+            somas = list(map(sum, zip(*colunas)))
+            respondidas = list(map(sum, zip(*(col.translate(_RESPONDIDA) for col in colunas))))
+            medias = [soma / n for soma, n in zip(somas, respondidas) if n]
+            if medias:
+                linha = (len(medias), sum(medias), sum(somas), sum(respondidas))
+                por_periodo.append((empresa, periodo, dimensao_id, *linha))
+                total = por_dimensao.setdefault((empresa, dimensao_id), [0, 0.0, 0, 0])
+                for i, valor in enumerate(linha):
+                    total[i] += valor
+            for valor in VALORES_RESPOSTA:
+                total = sum(col.count(valor) for col in colunas)
+                if total:
+                    chave = (empresa, dimensao_id, valor)
+                    distribuicao[chave] = distribuicao.get(chave, 0) + total
+
+    return (
+        [(*chave, *total) for chave, total in por_dimensao.items()],
+        [(*chave, total) for chave, total in distribuicao.items()],
+        por_periodo,
     )
-    elementos.append(Spacer(1, 15))
 
-    elementos.append(
-        Paragraph(
-            "⚠️ Os itens abaixo representam ocorrência de eventos e "
-            "não geram pontuação ou classificação de risco.",
-            estilos["Italic"]
+def _tamanho_banco(c):
+    c.execute("PRAGMA page_count")
+    paginas = c.fetchone()[0]
+    c.execute("PRAGMA page_size")
+    return paginas * c.fetchone()[0]
+
+def compactar_respostas(conn, lote=5000):
+    """
+    Converte as linhas de resposta para resposta_compacta e grava o
+    layout em controle. Retorna o número de participantes convertidos.
+    """
+    global _layout_compacto
+    c = conn.cursor()
+    if respostas_compactas(c):
+        return 0
+
+    catalogo = carregar_catalogo()
+    layout = [pid for pid, (_, escala) in sorted(catalogo.items()) if escala != "evento"]
+    with conn:
+        c.execute("""
+            INSERT INTO controle (chave, valor, atualizado) VALUES ('layout_respostas', ?, ?)
+        """, (json.dumps(layout), datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")))
+        _layout_compacto = None
+
+        leitura = conn.cursor()
+        leitura.execute("SELECT participante_id, pergunta_id, valor FROM resposta ORDER BY participante_id")
+        convertidos = 0
+        linhas = []
+        for participante_id, respostas in groupby(leitura, key=lambda row: row[0]):
+            linhas.append((participante_id, empacotar_respostas(r[1:] for r in respostas)))
+            if len(linhas) >= lote:
+                c.executemany("INSERT INTO resposta_compacta (participante_id, valores) VALUES (?, ?)", linhas)
+                convertidos += len(linhas)
+                linhas = []
+        c.executemany("INSERT INTO resposta_compacta (participante_id, valores) VALUES (?, ?)", linhas)
+        convertidos += len(linhas)
+        c.execute("DELETE FROM resposta")
+    return convertidos
+
+def expandir_respostas(conn):
+    """Volta de resposta_compacta para linhas em resposta. Retorna participantes."""
+    global _layout_compacto
+    c = conn.cursor()
+    if not respostas_compactas(c):
+        return 0
+
+    with conn:
+        leitura = conn.cursor()
+        leitura.execute("SELECT participante_id, valores FROM resposta_compacta ORDER BY participante_id")
+        convertidos = 0
+        for participante_id, valores in leitura:
+            c.executemany(
+                "INSERT INTO resposta (participante_id, pergunta_id, valor) VALUES (?, ?, ?)",
+                [(participante_id, pid, valor) for pid, valor in desempacotar_respostas(valores)]
+            )
+            convertidos += 1
+        c.execute("DELETE FROM resposta_compacta")
+        c.execute("DELETE FROM controle WHERE chave = 'layout_respostas'")
+    _layout_compacto = None
+    return convertidos
+
+def _converter_respostas(conversao, nome):
+    conn = conectar_db()
+    c = conn.cursor()
+    antes = _tamanho_banco(c)
+    inicio = time.perf_counter()
+    convertidos = conversao(conn)
+    if convertidos:
+        c.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        c.execute("VACUUM")
+    depois = _tamanho_banco(c)
+    conn.close()
+    print(f"{convertidos} participantes {nome} em {time.perf_counter() - inicio:.1f}s; "
+          f"banco: {antes / 1024 / 1024:.1f} MiB → {depois / 1024 / 1024:.1f} MiB")
+
+@app.cli.command("compactar-respostas")
+def compactar_respostas_cmd():
+    """Passa as respostas para o formato compacto (rodar com o app parado)."""
+    _converter_respostas(compactar_respostas, "compactados")
+
+@app.cli.command("expandir-respostas")
+def expandir_respostas_cmd():
+    """Volta as respostas compactas para linhas em resposta (app parado)."""
+    _converter_respostas(expandir_respostas, "expandidos")
+
+# ==================================================
+# ANÁLISE POR PERGUNTA E DIMENSÃO
+# matriz participantes × perguntas montada uma vez por
+# empresa (ver analise.py); alimenta o PDF e /analise
+# ==================================================
+SQL_MATRIZ_COMPACTA = """
+    SELECT rc.valores, pa.setor, pa.turno, pa.cargo
+    FROM participante pa
+    JOIN resposta_compacta rc ON rc.participante_id = pa.id
+    WHERE pa.empresa_id = ?
+    ORDER BY pa.id
+"""
+
+SQL_MATRIZ_RESPOSTAS = """
+    SELECT r.participante_id, r.pergunta_id, r.valor, pa.setor, pa.turno, pa.cargo
+    FROM participante pa
+    JOIN resposta r ON r.participante_id = pa.id
+    WHERE pa.empresa_id = ?
+    ORDER BY pa.id
+"""
+
+def matriz_empresa(c, empresa_id):
+    """analise.Matriz dos participantes da empresa que responderam algo."""
+    layout = layout_compacto()
+    if layout:
+        largura = len(layout)
+        c.execute(SQL_MATRIZ_COMPACTA, (empresa_id,))
+        linhas = c.fetchall()
+        return analise.Matriz(
+            layout,
+            b"".join(valores.ljust(largura, b"\0") for valores, *_ in linhas),
+            [tuple(segmento) for _, *segmento in linhas],
         )
+
+    catalogo = carregar_catalogo()
+    perguntas = [pid for pid, (_, escala) in catalogo.items() if escala != "evento"]
+    posicoes = {pid: i for i, pid in enumerate(perguntas)}
+    c.execute(SQL_MATRIZ_RESPOSTAS, (empresa_id,))
+    dados = bytearray()
+    segmentos = []
+    for _, respostas in groupby(c, key=lambda row: row[0]):
+        linha = bytearray(len(perguntas))
+        for _, pergunta_id, valor, *segmento in respostas:
+            linha[posicoes[pergunta_id]] = valor
+        dados += linha
+        segmentos.append(tuple(segmento))
+    return analise.Matriz(perguntas, dados, segmentos)
+
+def dimensoes_matriz(c, matriz):
+    """[(nome da dimensão, [índices de coluna da matriz])], na ordem de dimensao.id."""
+    catalogo = carregar_catalogo()
+    c.execute("SELECT id, nome FROM dimensao ORDER BY id")
+    dimensoes = []
+    for dimensao_id, nome in c.fetchall():
+        indices = [
+            i for i, pid in enumerate(matriz.perguntas)
+            if pid in catalogo and catalogo[pid][0] == dimensao_id
+        ]
+        if indices:
+            dimensoes.append((nome, indices))
+    return dimensoes
+
+def analise_empresa(c, empresa_id):
+    """
+    analise.analisar da empresa, com nomes de dimensão e textos das
+    perguntas, e as médias por segmento (setor, turno, cargo).
+    """
+    matriz = matriz_empresa(c, empresa_id)
+    dimensoes = dimensoes_matriz(c, matriz)
+
+    resultado = analise.analisar(matriz, dimensoes)
+    resultado["segmentos"] = analise.medias_por_segmento(
+        matriz, dimensoes, ATRIBUTOS_SEGMENTO, SEGMENTO_MINIMO
     )
+    for por_atributo in resultado["segmentos"].values():
+        for segmento in por_atributo["segmentos"]:
+            segmento["faixas"] = {
+                dimensao: pontuacao.faixa_risco(media) for dimensao, media in segmento["medias"].items()
+            }
+
+    c.execute("SELECT p.id, p.texto, d.nome FROM pergunta p JOIN dimensao d ON p.dimensao_id = d.id")
+    textos = {pid: (texto, dimensao) for pid, texto, dimensao in c.fetchall()}
+    for pergunta in resultado["perguntas"]:
+        pergunta["texto"], pergunta["dimensao"] = textos.get(pergunta["pergunta_id"], ("", ""))
+    return resultado
 
-    elementos.append(Spacer(1, 10))
+# ==================================================
+# TENDÊNCIAS E CARTEIRA
+# séries por período e ranking entre empresas, lidos só de
+# agregado_periodo, agregado_carteira e agregado_dimensao:
+# o custo não cresce com o número de respostas
+# ==================================================
+def _series(linhas):
+    """[(dimensao, periodo, media)] → {dimensao: {periodo: media}}"""
+    series = {}
+    for dimensao, periodo, media in linhas:
+        series.setdefault(dimensao, {})[periodo] = round(media, 2)
+    return series
+
+SQL_TENDENCIA_EMPRESA = """
+    SELECT d.nome, a.periodo, a.soma_medias / a.participantes
+    FROM agregado_periodo a
+    JOIN dimensao d ON a.dimensao_id = d.id
+    WHERE a.empresa_id = ? AND a.participantes > 0
+    ORDER BY d.id, a.periodo
+"""
+
+def tendencia_empresa(c, empresa_id):
+    """{nome_dimensao: {periodo: média}} da empresa, na ordem das dimensões."""
+    c.execute(SQL_TENDENCIA_EMPRESA, (empresa_id,))
+    return _series(c.fetchall())
+
+def tendencia_carteira(c):
+    """{nome_dimensao: {periodo: média}} de todas as empresas juntas."""
+    c.execute("""
+        SELECT d.nome, a.periodo, a.soma_medias / a.participantes
+        FROM agregado_carteira a
+        JOIN dimensao d ON a.dimensao_id = d.id
+        WHERE a.participantes > 0
+        ORDER BY d.id, a.periodo
+    """)
+    return _series(c.fetchall())
 
-    if eventos:
-        for evento, total_eventos in eventos.items():
-            elementos.append(
-                Paragraph(
-                    f"• <b>{evento}</b>: {total_eventos} ocorrência(s)",
-                    estilos["Normal"]
-                )
-            )
+def sql_ranking(por_periodo):
+    """SQL de ranking_empresa: (empresa_id, periodo) se por_periodo, senão (empresa_id,)."""
+    if por_periodo:
+        tabela, filtro = "agregado_periodo", "AND a.periodo = ?"
+        mesmo_periodo = "AND {}.periodo = a.periodo"
     else:
-        elementos.append(
-            Paragraph(
-                "• Não foram registradas ocorrências de comportamentos ofensivos "
-                "ou eventos críticos no período avaliado.",
-                estilos["Normal"]
-            )
-        )
-    # =============================
-    # GERA PDF
-    # =============================
-    SimpleDocTemplate(caminho, pagesize=A4).build(elementos)
+        tabela, filtro, mesmo_periodo = "agregado_dimensao", "", ""
+    return f"""
+    SELECT
+        d.nome,
+        a.soma_medias / a.participantes,
+        (SELECT COUNT(*) FROM {tabela} o
+         WHERE o.dimensao_id = a.dimensao_id {mesmo_periodo.format("o")}
+           AND o.soma_medias / o.participantes < a.soma_medias / a.participantes),
+        (SELECT COUNT(*) FROM {tabela} o
+         WHERE o.dimensao_id = a.dimensao_id {mesmo_periodo.format("o")}
+           AND o.soma_medias / o.participantes IS NOT NULL),
+        (SELECT SUM(k.soma_medias) / SUM(k.participantes) FROM agregado_carteira k
+         WHERE k.dimensao_id = a.dimensao_id {mesmo_periodo.format("k")})
+    FROM {tabela} a
+    JOIN dimensao d ON a.dimensao_id = d.id
+    WHERE a.empresa_id = ? {filtro}
+      AND a.participantes > 0
+    ORDER BY d.id
+"""
+
+def ranking_empresa(c, empresa_id, periodo=None):
+    """
+    Posição da empresa entre as demais em cada dimensão, no período
+    dado ou em todos eles: [{dimensao, media, percentil, empresas,
+    media_carteira}]. percentil = % das outras empresas com média
+    menor; como média maior é mais risco, 90 é pior que 90% delas.
+    """
+    if periodo is None:
+        c.execute(sql_ranking(False), (empresa_id,))
+    else:
+        c.execute(sql_ranking(True), (empresa_id, periodo))
+
+    return [
+        {
+            "dimensao": dimensao,
+            "media": round(media, 2),
+            "percentil": round(100 * abaixo / (empresas - 1)) if empresas > 1 else None,
+            "empresas": empresas,
+            "media_carteira": round(media_carteira, 2),
+        }
+        for dimensao, media, abaixo, empresas, media_carteira in c.fetchall()
+    ]
+
+# FUNÇÕES AUXILIARES
+def nome_seguro(texto):
+    return re.sub(r"[^\w\-]", "_", texto.lower())
+
+def impressao_relatorio(empresa, total, resultados, eventos, distribuicao=None):
+    """Hash das entradas de gerar_pdf: mesmas entradas → mesmo PDF."""
+    conteudo = json.dumps(
+        [LAYOUT_RELATORIO, empresa, total, list(resultados.items()), sorted(eventos.items()),
+         list((distribuicao or {}).items())],
+        ensure_ascii=False
+    )
+    return hashlib.sha256(conteudo.encode("utf-8")).hexdigest()
+
+def caminho_relatorio(impressao):
+    """
+    Caminho do PDF relativo a PASTA_RELATORIOS (o que vai em
+    relatorio.caminho_pdf): o nome é a própria impressão.
+    """
+    return f"{impressao[:2]}/{impressao}.pdf"
+
+def arquivo_local(relativo):
+    """Caminho relativo a PASTA_RELATORIOS → caminho neste servidor."""
+    return os.path.join(PASTA_RELATORIOS, *relativo.split("/"))
+
+def gerar_pdf(empresa, total, resultados, eventos, distribuicao=None, tempos=None,
+              graficos=True, estatisticas=None):
+    """
+    Gera o PDF e devolve o caminho local. A duração das fases (montagem dos
+    elementos e SimpleDocTemplate.build) vai para `tempos`, se dado;
+    senão, direto para as métricas deste processo. graficos=False gera
+    só o texto (usado para comparação no benchmark). `estatisticas` é o
+    resultado de analise_empresa; sem elas, as seções estatísticas ficam
+    de fora.
+    """
+    import relatorio_pdf
+
+    inicio = time.perf_counter()
+    caminho = arquivo_local(caminho_relatorio(
+        impressao_relatorio(empresa, total, resultados, eventos, distribuicao)
+    ))
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    elementos = relatorio_pdf.elementos_relatorio(
+        empresa, total, resultados, eventos, distribuicao, graficos=graficos, estatisticas=estatisticas
+    )
+
+    # grava em arquivo temporário: um PDF pela metade nunca é servido do cache
+    temporario = f"{caminho}.{os.getpid()}.tmp"
+    montagem = time.perf_counter()
+    relatorio_pdf.salvar(temporario, elementos)
+    os.replace(temporario, caminho)
+
+    fases = {"montagem": montagem - inicio, "build": time.perf_counter() - montagem}
+    if tempos is None:
+        for fase, duracao in fases.items():
+            METRICA_RELATORIO_SEGUNDOS.observar(duracao, fase=fase)
+    else:
+        tempos.update(fases)
     return caminho
 # ==================================================
-# ROTAS
+# FILA DE RELATÓRIOS
+# /finalizar só registra o pedido em relatorio (status
+# 'pendente'); o PDF é gerado num pool de processos.
 # ==================================================
-@app.route("/", methods=["GET", "POST"])
-def empresa():
-    global empresa_id_atual
-    if request.method == "POST":
-        nome = request.form["empresa"]
-        conn = conectar_db()
-        c = conn.cursor()
-        c.execute("INSERT INTO empresa (nome, data) VALUES (?, ?)",
-                  (nome, datetime.now().strftime("%Y-%m-%d %H:%M")))
-        empresa_id_atual = c.lastrowid
-        conn.commit()
-        conn.close()
-        return redirect(url_for("questionario"))
-    return render_template("empresa.html")
+_pool_relatorios = None
+
+def preaquecer_worker_relatorio():
+    """Inicialização dos processos do pool: carrega o ReportLab antes do primeiro pedido."""
+    import relatorio_pdf  # noqa: F401
+
+def pool_relatorios():
+    """
+    Pool criado sob demanda. Os processos vêm do forkserver, não de fork:
+    este processo já tem threads (requisições, fila de envios, snapshot)
+    e um fork com o lock de uma métrica ou de _conexoes_lock tomado
+    deixaria o processo filho travado nele para sempre.
+    """
+    global _pool_relatorios
+    if _pool_relatorios is None:
+        _pool_relatorios = ProcessPoolExecutor(
+            max_workers=RELATORIO_WORKERS,
+            mp_context=multiprocessing.get_context("forkserver"),
+            initializer=preaquecer_worker_relatorio,
+        )
+    return _pool_relatorios
 
-@app.route("/novo")
-def novo():
-    return redirect(url_for("questionario"))
+def _registrar_tempos_relatorio(futuro):
+    """Traz para as métricas do processo web os tempos medidos no pool."""
+    if futuro.cancelled() or futuro.exception() is not None:
+        return
+    for fase, duracao in (futuro.result() or {}).items():
+        METRICA_RELATORIO_SEGUNDOS.observar(duracao, fase=fase)
+
+def enfileirar_relatorio(relatorio_id):
+    futuro = pool_relatorios().submit(processar_relatorio, relatorio_id)
+    futuro.add_done_callback(_registrar_tempos_relatorio)
+
+SQL_RELATORIOS_PENDENTES = """
+    SELECT id FROM relatorio
+    WHERE status = 'pendente' OR (status = 'gerando' AND iniciado < ?)
+    ORDER BY id
+"""
+
+def retomar_relatorios():
+    """Reenfileira pedidos pendentes ou abandonados (ex.: após reinício)."""
+    limite = (datetime.now() - timedelta(minutes=RELATORIO_TIMEOUT_MIN)).strftime("%Y-%m-%d %H:%M:%S")
+    conn = conectar_db()
+    c = conn.cursor()
+    c.execute(SQL_RELATORIOS_PENDENTES, (limite,))
+    pendentes = [row[0] for row in c.fetchall()]
+    conn.close()
 
+    for relatorio_id in pendentes:
+        enfileirar_relatorio(relatorio_id)
+    return pendentes
 
-@app.route("/questionario", methods=["GET", "POST"])
-def questionario():
+SQL_PARTICIPANTES_EMPRESA = "SELECT COUNT(*) FROM participante WHERE empresa_id = ?"
 
-    if request.method == "POST":
-        conn = conectar_db()
-        c = conn.cursor()
+def dados_relatorio(c, empresa_id):
+    """Entradas de gerar_pdf: (empresa, total, medias, eventos, distribuicao)."""
+    empresa_nome = empresa_ou_404(c, empresa_id)
+
+    c.execute(SQL_PARTICIPANTES_EMPRESA, (empresa_id,))
+    total_participantes = c.fetchone()[0]
+
+    medias_dimensao = medias_empresa(c, empresa_id)
+    eventos = eventos_empresa(c, empresa_id)
+
+    distribuicao = distribuicao_empresa(c, empresa_id)
+
+    return empresa_nome, total_participantes, medias_dimensao, eventos, distribuicao
+
+def concluir_relatorio(c, relatorio_id, empresa_id, dados, tempos):
+    """Gera o PDF de `dados` (se ainda não existe) e marca o pedido concluído."""
+    # as respostas podem ter mudado desde o pedido: a impressão vale
+    # para os dados efetivamente usados
+    impressao = impressao_relatorio(*dados)
+    caminho_pdf = caminho_relatorio(impressao)
+    if not os.path.exists(arquivo_local(caminho_pdf)):
+        # a análise só muda com novos participantes, que já mudam a impressão
+        leitura = conectar_leitura(empresa_id)
+        try:
+            resultado = analise_empresa(leitura.cursor(), empresa_id)
+        finally:
+            leitura.close()
+        gerar_pdf(*dados, tempos=tempos, estatisticas=resultado)
+
+    c.execute("""
+        UPDATE relatorio SET status = 'concluido', caminho_pdf = ?, data = ?, impressao = ?
+        WHERE id = ?
+    """, (caminho_pdf, datetime.now().strftime("%Y-%m-%d %H:%M"), impressao, relatorio_id))
+
+def processar_relatorio(relatorio_id):
+    """
+    Executado nos processos do pool. Gera o PDF de um pedido e devolve
+    a duração das fases ({} se o PDF já existia ou outro worker o pegou).
+    """
+    tempos = {}
+    agora = datetime.now()
+    limite = (agora - timedelta(minutes=RELATORIO_TIMEOUT_MIN)).strftime("%Y-%m-%d %H:%M:%S")
 
-        # Cria participante
+    conn = conectar_db()
+    c = conn.cursor()
+
+    # Reivindica o pedido; outro worker pode já estar nele
+    c.execute("""
+        UPDATE relatorio SET status = 'gerando', iniciado = ?
+        WHERE id = ? AND (status = 'pendente' OR (status = 'gerando' AND iniciado < ?))
+    """, (agora.strftime("%Y-%m-%d %H:%M:%S"), relatorio_id, limite))
+    conn.commit()
+    if c.rowcount == 0:
+        conn.close()
+        return tempos
+
+    try:
+        c.execute("SELECT empresa_id FROM relatorio WHERE id = ?", (relatorio_id,))
+        empresa_id = c.fetchone()[0]
+        conn.commit()
+        leitura = conectar_leitura(empresa_id)
+        try:
+            dados = dados_relatorio(leitura.cursor(), empresa_id)
+        finally:
+            leitura.close()
+        concluir_relatorio(c, relatorio_id, empresa_id, dados, tempos)
+    except Exception as e:
         c.execute(
-            "INSERT INTO participante (empresa_id, data) VALUES (?, ?)",
-            (empresa_id_atual, datetime.now().strftime("%Y-%m-%d %H:%M"))
+            "UPDATE relatorio SET status = 'erro', erro = ? WHERE id = ?",
+            (str(e), relatorio_id)
         )
-        participante_id = c.lastrowid
+    conn.commit()
+    conn.close()
 
-        for campo, valor in request.form.items():
+    limpar_cache_relatorios()
+    return tempos
+
+# =========================
+# CACHE DE RELATÓRIOS
+# =========================
+CACHE_RELATORIOS = {"acertos": 0, "falhas": 0}
+
+SQL_RELATORIO_EM_CACHE = """
+    SELECT id, status, caminho_pdf, arquivo FROM relatorio
+    WHERE empresa_id = ? AND impressao = ?
+      AND status IN ('pendente', 'gerando', 'concluido', 'arquivado')
+    ORDER BY id DESC
+    LIMIT 1
+"""
+
+def buscar_relatorio_em_cache(c, empresa_id, impressao):
+    """
+    Id de um relatório já pedido com as mesmas entradas, se o PDF ainda
+    existe (solto ou no zip) ou está em geração; senão None.
+    """
+    c.execute(SQL_RELATORIO_EM_CACHE, (empresa_id, impressao))
+    row = c.fetchone()
+    if row is None:
+        return None
+    relatorio_id, status, caminho_pdf, arquivo = row
+    if status == "concluido" and not os.path.exists(arquivo_local(caminho_pdf)):
+        return None
+    if status == "arquivado" and not os.path.exists(arquivo_local(arquivo)):
+        return None
+    return relatorio_id
+
+# =========================
+# ARQUIVO DE RELATÓRIOS
+# ficam soltos (servidos direto do disco) os PDFs mais recentes
+# de cada empresa; os demais vão para um zip por mês do pedido
+# em PASTA_RELATORIOS/arquivo (status 'arquivado'). Um processo
+# por vez: a vez fica em controle ('arquivamento'), com a mesma
+# expiração dos pedidos 'gerando'.
+# =========================
+def _reivindicar_arquivamento(c):
+    agora = datetime.now()
+    limite = (agora - timedelta(minutes=RELATORIO_TIMEOUT_MIN)).strftime("%Y-%m-%d %H:%M:%S")
+    agora = agora.strftime("%Y-%m-%d %H:%M:%S")
+    c.execute("INSERT INTO controle (chave) VALUES ('arquivamento') ON CONFLICT (chave) DO NOTHING")
+    c.execute("""
+        UPDATE controle SET valor = ?, atualizado = ?
+        WHERE chave = 'arquivamento' AND (valor IS NULL OR valor < ?)
+    """, (agora, agora, limite))
+    return c.rowcount == 1
+
+def _relatorios_a_arquivar(c):
+    """
+    {caminho_pdf: (mês, [ids])} dos PDFs que deixam de ficar soltos:
+    além dos RELATORIOS_POR_EMPRESA PDFs distintos mais recentes da
+    empresa e, entre os restantes, os mais antigos até caber em
+    RELATORIOS_MAX_DIAS e RELATORIOS_MAX_MB. PDFs já sumidos do disco
+    vão com mês None.
+    """
+    c.execute("""
+        SELECT id, empresa_id, caminho_pdf, data FROM relatorio
+        WHERE status = 'concluido'
+        ORDER BY id DESC
+    """)
+    # PDFs distintos mais recentes de cada empresa: vários pedidos
+    # com a mesma impressão ocupam uma vaga só
+    por_empresa = {}
+    pedidos = {}
+    mantidos = set()
+    for relatorio_id, empresa_id, caminho, data in c.fetchall():
+        ids, meses = pedidos.setdefault(caminho, ([], []))
+        ids.append(relatorio_id)
+        meses.append((data or "")[:7])
+        recentes = por_empresa.setdefault(empresa_id, set())
+        if caminho in recentes or len(recentes) < RELATORIOS_POR_EMPRESA:
+            recentes.add(caminho)
+            mantidos.add(caminho)
+
+    arquivar = {}
+    soltos = []
+    for caminho, (ids, meses) in pedidos.items():
+        try:
+            info = os.stat(arquivo_local(caminho))
+        except FileNotFoundError:
+            arquivar[caminho] = (None, ids)
+            continue
+        if caminho in mantidos:
+            soltos.append((info.st_mtime, info.st_size, caminho))
+        else:
+            arquivar[caminho] = (max(meses), ids)
+
+    soltos.sort()
+    limite_idade = datetime.now().timestamp() - RELATORIOS_MAX_DIAS * 86400
+    total = sum(tamanho for _, tamanho, _ in soltos)
+    limite_total = RELATORIOS_MAX_MB * 1024 * 1024
+    for modificado, tamanho, caminho in soltos:
+        if modificado >= limite_idade and total <= limite_total:
+            break
+        ids, meses = pedidos[caminho]
+        arquivar[caminho] = (max(meses), ids)
+        total -= tamanho
+    return arquivar
+
+def _guardar_no_zip(relativo, caminhos):
+    """
+    Acrescenta os PDFs ao zip. O zip é reescrito numa cópia e trocado
+    de uma vez: uma queda no meio não corrompe o que já estava nele.
+    """
+    destino = arquivo_local(relativo)
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    temporario = f"{destino}.{os.getpid()}.tmp"
+    if os.path.exists(destino):
+        shutil.copyfile(destino, temporario)
+    with zipfile.ZipFile(temporario, "a", zipfile.ZIP_DEFLATED) as arquivo:
+        existentes = set(arquivo.namelist())
+        for caminho in caminhos:
+            if caminho not in existentes:
+                arquivo.write(arquivo_local(caminho), arcname=caminho)
+    os.replace(temporario, destino)
+
+def _expirar_arquivos(conn):
+    """Apaga os zips além de RELATORIOS_ARQUIVO_MAX_MESES; seus relatórios viram 'expirado'."""
+    pasta = arquivo_local("arquivo")
+    if not RELATORIOS_ARQUIVO_MAX_MESES or not os.path.isdir(pasta):
+        return
+    hoje = datetime.now()
+    meses = hoje.year * 12 + hoje.month - 1 - RELATORIOS_ARQUIVO_MAX_MESES
+    limite = f"{meses // 12:04d}-{meses % 12 + 1:02d}"
+    for entrada in os.scandir(pasta):
+        if entrada.name.endswith(".zip") and entrada.name[:-len(".zip")] < limite:
+            with conn:
+                conn.execute(
+                    "UPDATE relatorio SET status = 'expirado' WHERE arquivo = ? AND status = 'arquivado'",
+                    (f"arquivo/{entrada.name}",)
+                )
+            os.remove(entrada.path)
+
+def limpar_cache_relatorios():
+    """
+    Arquiva os PDFs que não precisam mais ficar soltos (ver
+    _relatorios_a_arquivar) e apaga os zips expirados. Relatórios cujo
+    PDF sumiu passam a 'expirado'. Retorna quantos PDFs foram arquivados.
+    """
+    conn = conectar_db()
+    c = conn.cursor()
+    with conn:
+        vez = _reivindicar_arquivamento(c)
+    if not vez:
+        conn.close()
+        return 0
+
+    try:
+        arquivar = _relatorios_a_arquivar(c)
+        por_mes = {}
+        perdidos = []
+        for caminho, (mes, ids) in arquivar.items():
+            if mes is None:
+                perdidos.extend(ids)
+            else:
+                por_mes.setdefault(mes or "sem-data", []).append(caminho)
+
+        with conn:
+            c.executemany(
+                "UPDATE relatorio SET status = 'expirado' WHERE id = ?",
+                [(relatorio_id,) for relatorio_id in perdidos]
+            )
+        for mes, caminhos in sorted(por_mes.items()):
+            relativo = f"arquivo/{mes}.zip"
+            _guardar_no_zip(relativo, caminhos)
+            # o mesmo PDF pode ter sido pedido de novo enquanto isso: as
+            # linhas novas também passam a apontar para o zip
+            with conn:
+                c.executemany(
+                    "UPDATE relatorio SET status = 'arquivado', arquivo = ? "
+                    "WHERE caminho_pdf = ? AND status = 'concluido'",
+                    [(relativo, caminho) for caminho in caminhos]
+                )
+            for caminho in caminhos:
+                try:
+                    os.remove(arquivo_local(caminho))
+                except FileNotFoundError:
+                    pass
+        _expirar_arquivos(conn)
+    finally:
+        with conn:
+            c.execute("UPDATE controle SET valor = NULL WHERE chave = 'arquivamento'")
+        conn.close()
+    return sum(map(len, por_mes.values()))
 
-            if not campo.startswith("pergunta_"):
-                continue
+@app.cli.command("arquivar-relatorios")
+def arquivar_relatorios_cmd():
+    """Aplica agora a retenção de PDFs soltos e de zips."""
+    print(f"{limpar_cache_relatorios()} relatórios arquivados")
 
-            pergunta_id = int(campo.replace("pergunta_", ""))
-            resposta_valor = int(valor)
+# ==================================================
+# RELATÓRIOS EM LOTE
+# fechamento de rodada: vários relatórios de uma vez,
+# com os dados de todas as empresas lidos em poucas
+# consultas agrupadas e os PDFs gerados no pool
+# ==================================================
+def dados_relatorios(c, empresa_ids):
+    """
+    {empresa_id: (empresa, total, medias, eventos, distribuicao)} das empresas pedidas,
+    nos moldes de dados_relatorio. Cada parte sai de uma consulta agrupada
+    por empresa; ids inexistentes ficam de fora.
+    """
+    ids = json.dumps(sorted(set(empresa_ids)))
+
+    c.execute("""
+        SELECT e.id, e.nome, COUNT(pa.id)
+        FROM empresa e
+        LEFT JOIN participante pa ON pa.empresa_id = e.id
+        WHERE e.id IN (SELECT value FROM json_each(?))
+        GROUP BY e.id
+        ORDER BY e.id
+    """, (ids,))
+    dados = {empresa_id: (nome, total, {}, {}, {}) for empresa_id, nome, total in c.fetchall()}
 
-            # Descobre o tipo da pergunta
-            c.execute("SELECT escala FROM pergunta WHERE id = ?", (pergunta_id,))
-            escala = c.fetchone()[0]
+    c.execute("""
+        SELECT a.empresa_id, d.nome, a.soma_medias / a.participantes
+        FROM agregado_dimensao a
+        JOIN dimensao d ON a.dimensao_id = d.id
+        WHERE a.empresa_id IN (SELECT value FROM json_each(?)) AND a.participantes > 0
+        ORDER BY a.empresa_id, d.id
+    """, (ids,))
+    for empresa_id, dimensao, media in c.fetchall():
+        dados[empresa_id][2][dimensao] = round(media, 2)
+
+    c.execute("""
+        SELECT a.empresa_id, p.texto, a.origem, a.participantes
+        FROM agregado_evento a
+        JOIN pergunta p ON a.pergunta_id = p.id
+        WHERE a.empresa_id IN (SELECT value FROM json_each(?)) AND a.participantes > 0
+        ORDER BY a.empresa_id, p.id
+    """, (ids,))
+    for empresa_id, linhas in groupby(c.fetchall(), key=lambda row: row[0]):
+        dados[empresa_id][3].update(_tabela_eventos(row[1:] for row in linhas))
 
-            # =========================
-            # PERGUNTA NORMAL (COPSOQ)
-            # =========================
-            if escala != "evento":
+    c.execute("""
+        SELECT a.empresa_id, d.nome, a.valor, a.respostas
+        FROM agregado_distribuicao a
+        JOIN dimensao d ON a.dimensao_id = d.id
+        WHERE a.empresa_id IN (SELECT value FROM json_each(?))
+        ORDER BY a.empresa_id, d.id, a.valor
+    """, (ids,))
+    for empresa_id, linhas in groupby(c.fetchall(), key=lambda linha: linha[0]):
+        dados[empresa_id][4].update(_contagens_por_dimensao(linha[1:] for linha in linhas))
+
+    return dados
+
+def empresas_com_respostas_novas(c):
+    """
+    Empresas com participante registrado depois do último pedido de
+    relatório válido (ou que nunca tiveram relatório). Como as datas têm
+    resolução de minuto, o empate conta como novo; a impressão evita
+    gerar de novo um PDF idêntico.
+    """
+    c.execute("""
+        SELECT pa.empresa_id
+        FROM participante pa
+        GROUP BY pa.empresa_id
+        HAVING MAX(pa.data) >= COALESCE((
+            SELECT MAX(r.data) FROM relatorio r
+            WHERE r.empresa_id = pa.empresa_id
+              AND r.status IN ('pendente', 'gerando', 'concluido', 'arquivado')
+        ), '')
+        ORDER BY pa.empresa_id
+    """)
+    return [row[0] for row in c.fetchall()]
+
+def processar_relatorio_calculado(relatorio_id, empresa_id, dados):
+    """
+    Executado nos processos do pool para pedidos do lote: os dados já
+    vêm calculados e o pedido já foi reivindicado (status 'gerando').
+    """
+    tempos = {}
+    conn = conectar_db()
+    c = conn.cursor()
+    try:
+        concluir_relatorio(c, relatorio_id, empresa_id, dados, tempos)
+    except Exception as e:
+        c.execute(
+            "UPDATE relatorio SET status = 'erro', erro = ? WHERE id = ?",
+            (str(e), relatorio_id)
+        )
+    conn.commit()
+    conn.close()
+    return tempos
+
+def gerar_relatorios_em_lote(empresa_ids):
+    """
+    Pede o relatório de cada empresa. As que já têm PDF com a mesma
+    impressão reaproveitam o pedido; as demais vão para o pool.
+    Retorna [{empresa_id, empresa, participantes, relatorio_id, origem, futuro}]
+    com futuro=None para os acertos de cache.
+    """
+    # a rodada inteira lida de um mesmo snapshot, feito agora
+    if LEITURA_SNAPSHOT:
+        atualizar_snapshot()
+    leitura = conectar_leitura()
+    try:
+        dados = dados_relatorios(leitura.cursor(), empresa_ids)
+    finally:
+        leitura.close()
+
+    conn = conectar_db()
+    c = conn.cursor()
+    pedidos = []
+    try:
+        agora = datetime.now()
+        for empresa_id, dados_empresa in dados.items():
+            impressao = impressao_relatorio(*dados_empresa)
+            relatorio_id = buscar_relatorio_em_cache(c, empresa_id, impressao)
+            futuro = None
+
+            if relatorio_id is None:
                 c.execute(
                     """
-                    INSERT INTO resposta (participante_id, pergunta_id, valor)
-                    VALUES (?, ?, ?)
+                    INSERT INTO relatorio (empresa_id, caminho_pdf, data, status, iniciado, impressao)
+                    VALUES (?, '', ?, 'gerando', ?, ?)
                     """,
-                    (participante_id, pergunta_id, resposta_valor)
+                    (empresa_id, agora.strftime("%Y-%m-%d %H:%M"),
+                     agora.strftime("%Y-%m-%d %H:%M:%S"), impressao)
+                )
+                relatorio_id = c.lastrowid
+                conn.commit()
+                CACHE_RELATORIOS["falhas"] += 1
+                futuro = pool_relatorios().submit(
+                    processar_relatorio_calculado, relatorio_id, empresa_id, dados_empresa
                 )
+                futuro.add_done_callback(_registrar_tempos_relatorio)
+            else:
+                CACHE_RELATORIOS["acertos"] += 1
+
+            pedidos.append({
+                "empresa_id": empresa_id,
+                "empresa": dados_empresa[0],
+                "participantes": dados_empresa[1],
+                "relatorio_id": relatorio_id,
+                "origem": "cache" if futuro is None else "gerado",
+                "futuro": futuro,
+            })
+    finally:
+        conn.close()
+    return pedidos
+
+@app.cli.command("gerar-relatorios")
+@click.argument("empresa_ids", nargs=-1, type=int)
+@click.option("--novas", is_flag=True, help="Empresas com respostas desde o último relatório.")
+def gerar_relatorios_cmd(empresa_ids, novas):
+    """Gera os relatórios das empresas dadas e mostra o tempo de cada uma."""
+    if novas:
+        conn = conectar_db()
+        empresa_ids = tuple(empresa_ids) + tuple(empresas_com_respostas_novas(conn.cursor()))
+        conn.close()
+    if not empresa_ids:
+        raise click.UsageError("informe EMPRESA_IDS ou --novas")
 
-            # =========================
-            # EVENTO (registro apenas)
-            # =========================
-            elif resposta_valor > 0:
-                origens = request.form.getlist(f"origem_{pergunta_id}")
-                for origem in origens:
-                    c.execute(
-                        """
-                        INSERT INTO evento_origem
-                        (participante_id, pergunta_id, origem)
-                        VALUES (?, ?, ?)
-                        """,
-                        (participante_id, pergunta_id, origem)
-                    )
+    inicio = time.perf_counter()
+    pedidos = gerar_relatorios_em_lote(empresa_ids)
 
+    tempos = {pedido["relatorio_id"]: pedido["futuro"].result() if pedido["futuro"] else {} for pedido in pedidos}
+
+    conn = conectar_db()
+    c = conn.cursor()
+    c.execute(
+        "SELECT id, status FROM relatorio WHERE id IN (SELECT value FROM json_each(?))",
+        (json.dumps(list(tempos)),)
+    )
+    status = dict(c.fetchall())
+    conn.close()
+
+    print(f"{'empresa':>8}  {'particip.':>9}  {'relatório':>9}  {'origem':<7}  {'status':<9}  {'montagem':>8}  {'build':>7}")
+    for pedido in pedidos:
+        fases = tempos[pedido["relatorio_id"]]
+        print(
+            f"{pedido['empresa_id']:>8}  {pedido['participantes']:>9}  {pedido['relatorio_id']:>9}  "
+            f"{pedido['origem']:<7}  {status[pedido['relatorio_id']]:<9}  "
+            f"{fases.get('montagem', 0.0):>7.3f}s  {fases.get('build', 0.0):>6.3f}s"
+        )
+
+    ausentes = sorted(set(empresa_ids) - {pedido["empresa_id"] for pedido in pedidos})
+    if ausentes:
+        print(f"empresas inexistentes: {', '.join(map(str, ausentes))}")
+    print(f"{len(pedidos)} relatório(s) em {time.perf_counter() - inicio:.2f}s")
+
+@app.route("/admin/relatorios", methods=["POST"])
+def admin_gerar_relatorios():
+    """
+    Corpo JSON: {"empresas": [ids]} e/ou {"novas": true}. Não espera os
+    PDFs; o andamento de cada um fica em /relatorio/<id>.
+    """
+    corpo = request.get_json(silent=True) or {}
+    empresa_ids = corpo.get("empresas") or []
+    if not isinstance(empresa_ids, list) or not all(isinstance(i, int) for i in empresa_ids):
+        return jsonify({"erro": "empresas deve ser uma lista de ids"}), 400
+    if corpo.get("novas"):
+        conn = conectar_db()
+        empresa_ids = empresa_ids + empresas_com_respostas_novas(conn.cursor())
+        conn.close()
+
+    pedidos = gerar_relatorios_em_lote(empresa_ids)
+    return jsonify([
+        {
+            "empresa_id": pedido["empresa_id"],
+            "relatorio_id": pedido["relatorio_id"],
+            "origem": pedido["origem"],
+            "status": url_for("relatorio_status", relatorio_id=pedido["relatorio_id"]),
+        }
+        for pedido in pedidos
+    ])
+
+# ==================================================
+# INSTRUMENTAÇÃO
+# ==================================================
+metricas.Medidor(
+    "sqlite_conexoes", "Conexões do pool por thread",
+    lambda: {(estado,): valor for estado, valor in ESTATISTICAS_POOL.items()},
+    ("estado",)
+)
+metricas.Medidor(
+    "relatorios_cache_total", "Pedidos de relatório atendidos pelo cache ou não",
+    lambda: {(resultado,): valor for resultado, valor in CACHE_RELATORIOS.items()},
+    ("resultado",), tipo="counter"
+)
+metricas.Medidor(
+    "fila_envios_profundidade", "Envios aceitos pela fila e ainda não gravados no banco",
+    lambda: profundidade_fila_envios()
+)
+
+def _defasagem_snapshot():
+    defasagem = estado_snapshot()["defasagem_s"]
+    return {} if defasagem is None else defasagem
+
+metricas.Medidor(
+    "snapshot_defasagem_segundos", "Idade dos dados lidos por relatórios e análises (LEITURA_SNAPSHOT)",
+    _defasagem_snapshot
+)
+
+@app.before_request
+def iniciar_medicao():
+    g.inicio_requisicao = time.perf_counter()
+    g.perfil = None
+    if PERFIL_LIMIAR_MS > 0:
+        perfil = cProfile.Profile()
+        try:
+            perfil.enable()
+        except ValueError:
+            # outro perfilador já ativo (ex.: requisição simultânea no 3.12+)
+            return
+        g.perfil = perfil
+
+@app.after_request
+def registrar_medicao(resposta):
+    inicio = g.pop("inicio_requisicao", None)
+    if inicio is None:
+        return resposta
+    duracao = time.perf_counter() - inicio
+    rota = request.url_rule.rule if request.url_rule else "<sem rota>"
+
+    METRICA_REQUISICOES.inc(rota=rota, metodo=request.method, status=resposta.status_code)
+    METRICA_REQUISICAO_SEGUNDOS.observar(duracao, rota=rota, metodo=request.method)
+
+    dados_de = g.pop("dados_de", None)
+    if dados_de is not None:
+        resposta.headers["X-Dados-De"] = dados_de
+
+    perfil = g.pop("perfil", None)
+    if perfil is not None:
+        perfil.disable()
+        if duracao * 1000 >= PERFIL_LIMIAR_MS:
+            os.makedirs(PASTA_PERFIS, exist_ok=True)
+            nome = f"{datetime.now():%Y%m%d_%H%M%S_%f}_{request.method}_{nome_seguro(rota)}_{duracao * 1000:.0f}ms.prof"
+            perfil.dump_stats(os.path.join(PASTA_PERFIS, nome))
+    return resposta
+
+@app.route("/metrics")
+def metrics():
+    return Response(metricas.exportar(), mimetype="text/plain; version=0.0.4")
+
+# ==================================================
+# ROTAS
+# ==================================================
+@app.route("/", methods=["GET", "POST"])
+def empresa():
+    if request.method == "POST":
+        nome = request.form["empresa"]
+        conn = conectar_db()
+        c = conn.cursor()
+        c.execute("INSERT INTO empresa (nome, data) VALUES (?, ?)",
+                  (nome, datetime.now().strftime("%Y-%m-%d %H:%M")))
+        empresa_id = c.lastrowid
         conn.commit()
         conn.close()
-        return redirect(url_for("continuar"))
+        return redirect(url_for("questionario", empresa_id=empresa_id))
+    return render_template("empresa.html")
+
+@app.route("/novo")
+def novo():
+    return redirect(url_for("empresa"))
+
+
+# ==================================================
+# A empresa avaliada vem sempre na URL, para que várias
+# empresas possam ser avaliadas ao mesmo tempo em
+# qualquer worker/thread.
+# ==================================================
+def empresa_ou_404(c, empresa_id):
+    c.execute("SELECT nome FROM empresa WHERE id = ?", (empresa_id,))
+    row = c.fetchone()
+    if row is None:
+        abort(404)
+    return row[0]
+
+# =========================
+# PÁGINA DO QUESTIONÁRIO
+# o HTML não depende da empresa (o formulário envia para a
+# própria URL): é renderizado uma vez por versão das perguntas
+# =========================
+_pagina_questionario = None
+
+def pagina_questionario():
+    global _pagina_questionario
+    versao, atualizado = versao_perguntas()
+    pagina = _pagina_questionario
+    if pagina is not None and pagina["versao"] == versao:
+        return pagina
 
-    # ==========================
-    # GET → carrega perguntas
-    # ==========================
     conn = conectar_db()
     c = conn.cursor()
-
     c.execute("""
         SELECT id, texto, escala
         FROM pergunta
         ORDER BY id
     """)
     perguntas = c.fetchall()
-
     conn.close()
 
-    return render_template(
+    html = render_template(
         "questionario.html",
         perguntas=perguntas,
-        ESCALAS=ESCALAS
+        ESCALAS=ESCALAS,
+        TURNOS=TURNOS,
+        TAMANHO_SEGMENTO=TAMANHO_SEGMENTO,
     )
+    pagina = {
+        "versao": versao,
+        "html": html,
+        "etag": hashlib.sha256(html.encode("utf-8")).hexdigest()[:16],
+        "modificado": atualizado,
+    }
+    _pagina_questionario = pagina
+    return pagina
+
+# =========================
+# TOKENS DE ENVIO
+# cada carregamento do questionário gera um token no navegador
+# (a página continua igual para todos e vai do cache); um
+# reenvio com o mesmo token (duplo clique, nova tentativa da
+# conexão) recebe o redirecionamento original sem gravar nada
+# =========================
+PADRAO_TOKEN_ENVIO = re.compile(r"[0-9A-Fa-f-]{16,64}")
+
+_tokens_envio = {}
+_tokens_envio_lock = threading.Lock()
+_limpeza_tokens_envio = {"ultima": float("-inf")}
+
+def destino_token_envio(token):
+    """Redirecionamento já dado a este token neste processo, ou None."""
+    with _tokens_envio_lock:
+        registro = _tokens_envio.get(token)
+    if registro is None or registro[1] < time.monotonic():
+        return None
+    return registro[0]
+
+def lembrar_token_envio(token, destino):
+    with _tokens_envio_lock:
+        _tokens_envio[token] = (destino, time.monotonic() + TOKEN_ENVIO_TTL_HORAS * 3600)
+        while len(_tokens_envio) > TOKENS_ENVIO_EM_MEMORIA:
+            del _tokens_envio[next(iter(_tokens_envio))]
+
+SQL_LIMPAR_TOKENS_ENVIO = "DELETE FROM token_envio WHERE criado < ?"
+SQL_TOKEN_ENVIO = "SELECT empresa_id FROM token_envio WHERE token = ?"
+
+def consumir_token_envio(c, token, empresa_id):
+    """
+    Registra o token na transação corrente. Retorna None se ele é novo;
+    se já foi consumido (por este ou outro processo), a empresa do envio
+    original. Tokens mais velhos que TOKEN_ENVIO_TTL_HORAS são apagados
+    no máximo uma vez por minuto.
+    """
+    agora = datetime.now()
+    if time.monotonic() - _limpeza_tokens_envio["ultima"] >= 60:
+        _limpeza_tokens_envio["ultima"] = time.monotonic()
+        limite = agora - timedelta(hours=TOKEN_ENVIO_TTL_HORAS)
+        c.execute(SQL_LIMPAR_TOKENS_ENVIO, (limite.strftime("%Y-%m-%d %H:%M:%S"),))
 
-@app.route("/continuar")
-def continuar():
-    if empresa_id_atual is None:
-        return redirect(url_for("empresa"))
+    c.execute("""
+        INSERT INTO token_envio (token, empresa_id, criado) VALUES (?, ?, ?)
+        ON CONFLICT (token) DO NOTHING
+    """, (token, empresa_id, agora.strftime("%Y-%m-%d %H:%M:%S")))
+    if c.rowcount:
+        return None
+    c.execute(SQL_TOKEN_ENVIO, (token,))
+    return c.fetchone()[0]
+
+# =========================
+# FILA DE ENVIOS (opcional, FILA_ENVIOS=1)
+# em picos de acesso o envio validado é anexado a um diário
+# (uma linha JSON por envio, com fsync) e respondido na hora;
+# uma única thread grava o que se acumulou em transações de
+# muitos participantes. O diário só é zerado quando a fila
+# esvazia; o que restar dele após uma queda é regravado na
+# inicialização, e o token de cada envio impede que algo já
+# gravado entre de novo. Pensada para um único processo web.
+# =========================
+_fila_envios = {
+    "pendentes": collections.deque(),
+    "gravando": 0,
+    "diario": None,
+    "thread": None,
+    "parar": False,
+    "escritos": 0,
+    "sincronizados": 0,
+}
+_fila_envios_cond = threading.Condition()
+_fila_envios_fsync = threading.Lock()
+
+def ler_diario_envios(caminho=None):
+    """Envios do diário, na ordem; uma linha cortada por queda é ignorada."""
+    registros = []
+    try:
+        with open(caminho or ARQUIVO_FILA_ENVIOS, "rb") as arquivo:
+            for linha in arquivo:
+                try:
+                    registros.append(json.loads(linha))
+                except ValueError:
+                    continue
+    except FileNotFoundError:
+        pass
+    return registros
+
+def iniciar_fila_envios():
+    """
+    Põe na fila o que ficou no diário da execução anterior e inicia a
+    thread gravadora. Retorna quantos envios foram retomados.
+    """
+    with _fila_envios_cond:
+        if _fila_envios["thread"] is not None:
+            return 0
+        retomados = ler_diario_envios()
+        _fila_envios["pendentes"].extend(retomados)
+        diario = open(ARQUIVO_FILA_ENVIOS, "ab")
+        # linha cortada no fim: a próxima escrita começa numa linha nova
+        if diario.tell() and _ultimo_byte(ARQUIVO_FILA_ENVIOS) != b"\n":
+            diario.write(b"\n")
+        _fila_envios["diario"] = diario
+        _fila_envios["parar"] = False
+        thread = threading.Thread(target=_gravador_fila_envios, name="fila-envios", daemon=True)
+        _fila_envios["thread"] = thread
+        thread.start()
+    return len(retomados)
+
+def _ultimo_byte(caminho):
+    with open(caminho, "rb") as arquivo:
+        arquivo.seek(-1, os.SEEK_END)
+        return arquivo.read(1)
+
+def parar_fila_envios():
+    """Grava o que está na fila e encerra a thread (chamada na saída do processo)."""
+    with _fila_envios_cond:
+        thread = _fila_envios["thread"]
+        if thread is None:
+            return
+        _fila_envios["parar"] = True
+        _fila_envios_cond.notify_all()
+    thread.join()
+    with _fila_envios_cond:
+        _fila_envios["diario"].close()
+        _fila_envios["diario"] = None
+        _fila_envios["thread"] = None
+
+atexit.register(parar_fila_envios)
+
+_servico = {"iniciado": False}
+_servico_lock = threading.Lock()
+
+@app.before_request
+def iniciar_servico():
+    """
+    Na primeira requisição do processo servidor: reenfileira relatórios
+    interrompidos e retoma o diário de envios. Fica fora da importação
+    porque `flask <comando>` e os workers de relatório também importam
+    o módulo e não devem disputar a fila nem gerar PDFs.
+    """
+    if _servico["iniciado"]:
+        return
+    with _servico_lock:
+        if _servico["iniciado"]:
+            return
+        retomar_relatorios()
+        if FILA_ENVIOS:
+            iniciar_fila_envios()
+        _servico["iniciado"] = True
+
+def enfileirar_envio(token, empresa_id, respostas, eventos, segmento=None):
+    """
+    Anexa um envio validado ao diário e à fila. Ao retornar, o envio
+    está em disco. Envios simultâneos dividem o mesmo fsync.
+    """
+    if _fila_envios["thread"] is None:
+        iniciar_fila_envios()
+    registro = {
+        "token": token,
+        "empresa_id": empresa_id,
+        "data": datetime.now().strftime("%Y-%m-%d %H:%M"),
+        "respostas": respostas,
+        "eventos": eventos,
+        "segmento": segmento,
+    }
+    linha = json.dumps(registro, separators=(",", ":")).encode("utf-8") + b"\n"
+    with _fila_envios_cond:
+        diario = _fila_envios["diario"]
+        diario.write(linha)
+        diario.flush()
+        _fila_envios["escritos"] += 1
+        numero = _fila_envios["escritos"]
+        _fila_envios["pendentes"].append(registro)
+        _fila_envios_cond.notify_all()
+
+    with _fila_envios_fsync:
+        if _fila_envios["sincronizados"] < numero:
+            escritos = _fila_envios["escritos"]
+            os.fsync(diario.fileno())
+            _fila_envios["sincronizados"] = escritos
+
+def profundidade_fila_envios():
+    with _fila_envios_cond:
+        return len(_fila_envios["pendentes"]) + _fila_envios["gravando"]
+
+def aguardar_fila_envios(timeout=None):
+    """Espera a fila ser gravada no banco. False se o tempo acabou antes."""
+    with _fila_envios_cond:
+        return _fila_envios_cond.wait_for(
+            lambda: not _fila_envios["pendentes"] and not _fila_envios["gravando"], timeout
+        )
+
+def _gravar_envios(conn, registros):
+    """
+    Grava envios da fila na transação corrente, agrupados por empresa
+    e data. Envios cujo token já foi consumido são descartados.
+    """
+    c = conn.cursor()
+    grupos = {}
+    for registro in registros:
+        if consumir_token_envio(c, registro["token"], registro["empresa_id"]) is not None:
+            METRICA_ENVIOS_REPETIDOS.inc(origem="fila")
+            continue
+        grupos.setdefault((registro["empresa_id"], registro["data"]), []).append(registro)
+
+    for (empresa_id, data), grupo in grupos.items():
+        # diários anteriores aos segmentos não têm "segmento"
+        submissoes = [
+            (registro["respostas"], registro["eventos"], registro.get("segmento"))
+            for registro in grupo
+        ]
+        ids = gravar_participantes(conn, empresa_id, submissoes, data)
+        c.executemany(
+            "UPDATE token_envio SET participante_id = ? WHERE token = ?",
+            zip(ids, [registro["token"] for registro in grupo])
+        )
 
+def banco_ocupado(erro):
+    """True se o erro é lock do SQLite ("database is locked"/"is busy")."""
+    mensagem = str(erro).lower()
+    return isinstance(erro, sqlite3.OperationalError) and (
+        "database is locked" in mensagem or "database is busy" in mensagem
+    )
+
+def gravar_lote_envios(lote):
+    """
+    Grava um lote da fila numa única transação. Se o lote falha por
+    algo que não seja o banco ocupado, cada envio é regravado sozinho
+    e os que falharem vão para <diário>.rejeitados. Só o banco ocupado
+    é repassado a quem chama; outros OperationalError (tabela ausente,
+    erro de disco) são rejeitados como qualquer falha, senão a fila
+    tentaria o mesmo lote para sempre.
+
+    Os commits usam synchronous=FULL: o diário é truncado logo depois e,
+    com o NORMAL do WAL, um commit recente pode não sobreviver a uma
+    queda de energia, levando junto envios já confirmados.
+    """
+    conn = conectar_db()
+    conn.execute("PRAGMA synchronous = FULL")
+    try:
+        try:
+            with conn:
+                _gravar_envios(conn, lote)
+            return
+        except Exception as e:
+            if banco_ocupado(e):
+                raise
+            app.logger.exception("lote de %d envios falhou; gravando um a um", len(lote))
+
+        for registro in lote:
+            try:
+                with conn:
+                    _gravar_envios(conn, [registro])
+            except Exception as e:
+                if banco_ocupado(e):
+                    raise
+                app.logger.exception("envio %s rejeitado pela fila", registro["token"])
+                METRICA_FILA_REJEITADOS.inc()
+                with open(ARQUIVO_FILA_ENVIOS + ".rejeitados", "a", encoding="utf-8") as arquivo:
+                    arquivo.write(json.dumps(registro) + "\n")
+    finally:
+        conn.execute(f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS}")
+        conn.close()
+
+def _gravador_fila_envios():
+    espera = FILA_ENVIOS_ESPERA_MS / 1000
+    while True:
+        with _fila_envios_cond:
+            _fila_envios_cond.wait_for(lambda: _fila_envios["pendentes"] or _fila_envios["parar"])
+            if not _fila_envios["pendentes"]:
+                return
+            parar = _fila_envios["parar"]
+        if espera and not parar:
+            time.sleep(espera)
+
+        with _fila_envios_cond:
+            pendentes = _fila_envios["pendentes"]
+            lote = [pendentes.popleft() for _ in range(min(len(pendentes), FILA_ENVIOS_LOTE))]
+            _fila_envios["gravando"] = len(lote)
+
+        try:
+            gravar_lote_envios(lote)
+        except sqlite3.OperationalError:
+            # banco ocupado por muito tempo: o lote volta para o início da fila
+            app.logger.exception("fila de envios: banco indisponível")
+            with _fila_envios_cond:
+                _fila_envios["pendentes"].extendleft(reversed(lote))
+                _fila_envios["gravando"] = 0
+                if _fila_envios["parar"]:
+                    return
+            time.sleep(1)
+            continue
+        METRICA_FILA_LOTE.observar(len(lote))
+
+        with _fila_envios_cond:
+            _fila_envios["gravando"] = 0
+            if not _fila_envios["pendentes"]:
+                _fila_envios["diario"].truncate(0)
+            _fila_envios_cond.notify_all()
+
+@app.route("/empresa/<int:empresa_id>/questionario", methods=["GET", "POST"])
+def questionario(empresa_id):
+
+    if request.method == "POST":
+        # sem token: página antiga em cache de algum navegador
+        token = request.form.get("token_envio") or None
+        if token is not None:
+            if not PADRAO_TOKEN_ENVIO.fullmatch(token):
+                abort(400)
+            destino = destino_token_envio(token)
+            if destino is not None:
+                METRICA_ENVIOS_REPETIDOS.inc(origem="memoria")
+                return redirect(destino)
+
+        try:
+            respostas, eventos = validar_respostas(request.form)
+            segmento = validar_segmento(request.form)
+        except ValueError:
+            abort(400)
+
+        if FILA_ENVIOS:
+            conn = conectar_db()
+            try:
+                empresa_ou_404(conn.cursor(), empresa_id)
+            finally:
+                conn.close()
+            # sem token do navegador, um do servidor: a regravação do diário
+            # após uma queda não pode duplicar o participante
+            enfileirar_envio(token or uuid.uuid4().hex, empresa_id, respostas, eventos, segmento)
+            destino = url_for("continuar", empresa_id=empresa_id)
+            if token is not None:
+                lembrar_token_envio(token, destino)
+            return redirect(destino)
+
+        original = None
+        conn = conectar_db()
+        try:
+            with conn:
+                c = conn.cursor()
+                empresa_ou_404(c, empresa_id)
+                if token is not None:
+                    original = consumir_token_envio(c, token, empresa_id)
+                if original is None:
+                    ids = gravar_participantes(conn, empresa_id, [(respostas, eventos, segmento)])
+                    if token is not None:
+                        c.execute(
+                            "UPDATE token_envio SET participante_id = ? WHERE token = ?",
+                            (ids[0], token)
+                        )
+        finally:
+            conn.close()
+
+        destino = url_for("continuar", empresa_id=original or empresa_id)
+        if token is not None:
+            if original is not None:
+                METRICA_ENVIOS_REPETIDOS.inc(origem="banco")
+            lembrar_token_envio(token, destino)
+        return redirect(destino)
+
+    # ==========================
+    # GET → página em cache
+    # ==========================
+    pagina = pagina_questionario()
+    resposta = Response(pagina["html"], mimetype="text/html")
+    resposta.set_etag(pagina["etag"])
+    resposta.last_modified = pagina["modificado"]
+    # o navegador/proxy pode guardar, mas revalida (304) a cada acesso
+    resposta.cache_control.no_cache = True
+    return resposta.make_conditional(request)
+
+@app.route("/empresa/<int:empresa_id>/continuar")
+def continuar(empresa_id):
     conn = conectar_db()
     c = conn.cursor()
 
     # Busca nome da empresa
     c.execute(
         "SELECT nome FROM empresa WHERE id = ?",
-        (empresa_id_atual,)
+        (empresa_id,)
     )
     row = c.fetchone()
 
@@ -560,121 +2990,651 @@ def continuar():
     empresa = row[0]
 
     # Conta participantes
-    c.execute(
-        "SELECT COUNT(*) FROM participante WHERE empresa_id = ?",
-        (empresa_id_atual,)
-    )
+    c.execute(SQL_PARTICIPANTES_EMPRESA, (empresa_id,))
     total = c.fetchone()[0]
 
     conn.close()
 
     return render_template(
         "continuar.html",
+        empresa_id=empresa_id,
         empresa=empresa,
         total=total
     )
 
-@app.route("/finalizar")
-def finalizar():
-    conn = conectar_db()
+@app.route("/empresa/<int:empresa_id>/medias")
+def medias(empresa_id):
+    conn = conectar_leitura(empresa_id)
     c = conn.cursor()
+    try:
+        empresa_ou_404(c, empresa_id)
+        resultado = medias_empresa(c, empresa_id)
+    finally:
+        conn.close()
 
-    # =============================
-    # 1️⃣ Respostas COPSOQ
-    # =============================
-    c.execute("""
-        SELECT
-            pa.id,
-            d.nome,
-            r.valor
-        FROM resposta r
-        JOIN pergunta p ON r.pergunta_id = p.id
-        JOIN dimensao d ON p.dimensao_id = d.id
-        JOIN participante pa ON r.participante_id = pa.id
-        WHERE pa.empresa_id = ?
-        ORDER BY d.id, pa.id
-    """, (empresa_id_atual,))
-    dados = c.fetchall()
-
-    # =============================
-    # 2️⃣ Eventos
-    # =============================
-    c.execute("""
-        SELECT
-            p.texto,
-            COUNT(*) 
-        FROM evento_origem eo
-        JOIN pergunta p ON eo.pergunta_id = p.id
-        JOIN participante pa ON eo.participante_id = pa.id
-        WHERE pa.empresa_id = ?
-        GROUP BY p.texto
-    """, (empresa_id_atual,))
-    eventos = dict(c.fetchall())
+    return jsonify(pontuacao.classificar(resultado))
 
-    # =============================
-    # 3️⃣ Empresa e participantes
-    # =============================
-    c.execute("SELECT nome FROM empresa WHERE id = ?", (empresa_id_atual,))
-    empresa_nome = c.fetchone()[0]
+@app.route("/empresa/<int:empresa_id>/analise")
+def analise_json(empresa_id):
+    conn = conectar_leitura(empresa_id)
+    c = conn.cursor()
+    try:
+        empresa_ou_404(c, empresa_id)
+        resultado = analise_empresa(c, empresa_id)
+    finally:
+        conn.close()
 
-    c.execute(
-        "SELECT COUNT(*) FROM participante WHERE empresa_id = ?",
-        (empresa_id_atual,)
-    )
-    total_participantes = c.fetchone()[0]
+    return jsonify(resultado)
 
-    conn.close()
+@app.route("/empresa/<int:empresa_id>/eventos")
+def eventos_json(empresa_id):
+    """
+    Eventos críticos da empresa: participantes que relataram cada um e
+    o cruzamento com a origem (um participante pode marcar várias).
+    """
+    conn = conectar_leitura(empresa_id)
+    c = conn.cursor()
+    try:
+        empresa_ou_404(c, empresa_id)
+        c.execute(SQL_PARTICIPANTES_EMPRESA, (empresa_id,))
+        total = c.fetchone()[0]
+        eventos = eventos_empresa(c, empresa_id)
+    finally:
+        conn.close()
 
-    # =============================
-    # 4️⃣ Agrupamento COPSOQ
-    # =============================
-    respostas_por_dimensao = {}
-
-    for participante_id, dimensao, valor in dados:
-        respostas_por_dimensao \
-            .setdefault(dimensao, {}) \
-            .setdefault(participante_id, []) \
-            .append(valor)
-
-    medias_dimensao = {}
-    for dimensao, participantes in respostas_por_dimensao.items():
-        medias_individuais = [
-            sum(respostas) / len(respostas)
-            for respostas in participantes.values()
-        ]
-        medias_dimensao[dimensao] = round(
-            sum(medias_individuais) / len(medias_individuais), 2
-        )
+    return jsonify({
+        "participantes": total,
+        "origens": list(ORIGENS_EVENTO),
+        "eventos": [
+            {
+                "evento": evento,
+                "participantes": participantes,
+                "fracao": round(participantes / total, 3) if total else None,
+                "origens": origens,
+            }
+            for evento, (participantes, origens) in eventos.items()
+        ],
+    })
+
+@app.route("/empresa/<int:empresa_id>/tendencia")
+def tendencia_json(empresa_id):
+    """Médias da empresa e da carteira por período: {dimensao: {periodo: media}}."""
+    conn = conectar_leitura(empresa_id)
+    c = conn.cursor()
+    try:
+        empresa_ou_404(c, empresa_id)
+        empresa = tendencia_empresa(c, empresa_id)
+        carteira = tendencia_carteira(c)
+    finally:
+        conn.close()
+
+    return jsonify({
+        "periodos": sorted({periodo for serie in empresa.values() for periodo in serie}),
+        "empresa": empresa,
+        "carteira": {dimensao: carteira.get(dimensao, {}) for dimensao in empresa},
+    })
 
-    # =============================
-    # 5️⃣ PDF
-    # =============================
-    caminho_pdf = gerar_pdf(
-        empresa_nome,
-        total_participantes,
-        medias_dimensao,
-        eventos
+@app.route("/empresa/<int:empresa_id>/ranking")
+def ranking_json(empresa_id):
+    """Percentil da empresa entre as demais; ?periodo=AAAA limita a uma rodada."""
+    conn = conectar_leitura(empresa_id)
+    c = conn.cursor()
+    try:
+        empresa_ou_404(c, empresa_id)
+        resultado = ranking_empresa(c, empresa_id, request.args.get("periodo"))
+    finally:
+        conn.close()
+
+    return jsonify(resultado)
+
+@app.route("/carteira")
+def carteira_json():
+    """Médias de todas as empresas juntas, por dimensão e período."""
+    conn = conectar_leitura()
+    c = conn.cursor()
+    try:
+        carteira = tendencia_carteira(c)
+    finally:
+        conn.close()
+
+    return jsonify({
+        "periodos": sorted({periodo for serie in carteira.values() for periodo in serie}),
+        "dimensoes": carteira,
+    })
+
+@app.route("/empresa/<int:empresa_id>/painel")
+def painel(empresa_id):
+    """Evolução da empresa entre as rodadas e posição na carteira na última (ou ?periodo=)."""
+    conn = conectar_leitura(empresa_id)
+    c = conn.cursor()
+    try:
+        empresa = empresa_ou_404(c, empresa_id)
+        tendencia = tendencia_empresa(c, empresa_id)
+        periodos = sorted({periodo for serie in tendencia.values() for periodo in serie})
+        periodo = request.args.get("periodo") or (periodos[-1] if periodos else None)
+        ranking = ranking_empresa(c, empresa_id, periodo) if periodo is not None else []
+    finally:
+        conn.close()
+
+    linhas = [
+        {
+            **posicao,
+            "serie": [tendencia[posicao["dimensao"]].get(p) for p in periodos],
+            "classificacao": classificar_risco(posicao["media"]),
+            "faixa": pontuacao.faixa_risco(posicao["media"]),
+        }
+        for posicao in ranking
+    ]
+    return render_template(
+        "painel.html",
+        empresa_id=empresa_id,
+        empresa=empresa,
+        periodos=periodos,
+        periodo=periodo,
+        linhas=linhas,
     )
 
-    # =============================
-    # 6️⃣ Salva relatório
-    # =============================
+@app.route("/empresa/<int:empresa_id>/finalizar")
+def finalizar(empresa_id):
+    leitura = conectar_leitura(empresa_id)
+    try:
+        impressao = impressao_relatorio(*dados_relatorio(leitura.cursor(), empresa_id))
+    finally:
+        leitura.close()
+
+    conn = conectar_db()
+    c = conn.cursor()
+    try:
+        relatorio_id = buscar_relatorio_em_cache(c, empresa_id, impressao)
+
+        if relatorio_id is None:
+            c.execute(
+                """
+                INSERT INTO relatorio (empresa_id, caminho_pdf, data, status, impressao)
+                VALUES (?, '', ?, 'pendente', ?)
+                """,
+                (empresa_id, datetime.now().strftime("%Y-%m-%d %H:%M"), impressao)
+            )
+            relatorio_id = c.lastrowid
+            conn.commit()
+            CACHE_RELATORIOS["falhas"] += 1
+            enfileirar_relatorio(relatorio_id)
+        else:
+            CACHE_RELATORIOS["acertos"] += 1
+    finally:
+        conn.close()
+
+    return render_template("encerramento.html", relatorio_id=relatorio_id)
+
+@app.route("/relatorio/<int:relatorio_id>")
+def relatorio_status(relatorio_id):
     conn = conectar_db()
     c = conn.cursor()
     c.execute(
-        """
-        INSERT INTO relatorio (empresa_id, caminho_pdf, data)
-        VALUES (?, ?, ?)
-        """,
-        (empresa_id_atual, caminho_pdf, datetime.now().strftime("%Y-%m-%d %H:%M"))
+        "SELECT empresa_id, status, data, erro FROM relatorio WHERE id = ?",
+        (relatorio_id,)
     )
-    conn.commit()
+    row = c.fetchone()
+    conn.close()
+    if row is None:
+        abort(404)
+
+    empresa_id, status, data, erro = row
+    return jsonify({
+        "id": relatorio_id,
+        "empresa_id": empresa_id,
+        "status": status,
+        "data": data,
+        "erro": erro,
+        "pdf": url_for("relatorio_pdf", relatorio_id=relatorio_id) if status in ("concluido", "arquivado") else None,
+    })
+
+@app.route("/relatorios/cache")
+def relatorios_cache():
+    soltos = []
+    arquivos = []
+    for pasta, _, nomes in os.walk(PASTA_RELATORIOS):
+        for nome in nomes:
+            if nome.endswith(".pdf"):
+                soltos.append(os.path.getsize(os.path.join(pasta, nome)))
+            elif nome.endswith(".zip"):
+                arquivos.append(os.path.getsize(os.path.join(pasta, nome)))
+    return jsonify({
+        **CACHE_RELATORIOS,
+        "arquivos": len(soltos),
+        "bytes": sum(soltos),
+        "zips": len(arquivos),
+        "bytes_zips": sum(arquivos),
+        "por_empresa": RELATORIOS_POR_EMPRESA,
+        "max_mb": RELATORIOS_MAX_MB,
+        "max_dias": RELATORIOS_MAX_DIAS,
+        "arquivo_max_meses": RELATORIOS_ARQUIVO_MAX_MESES,
+    })
+
+@app.route("/estatisticas/db")
+def estatisticas_db():
+    return jsonify(estatisticas_pool())
+
+@app.route("/relatorio/<int:relatorio_id>/pdf")
+def relatorio_pdf(relatorio_id):
+    """
+    PDF solto: send_file direto do disco (wsgi.file_wrapper, ou
+    X-Sendfile com RELATORIOS_X_SENDFILE), com ETag = impressão,
+    Range e 304. Arquivado: lido de dentro do zip do mês, também com
+    Range (o membro do zip aceita seek).
+    """
+    conn = conectar_db()
+    c = conn.cursor()
+    c.execute("""
+        SELECT r.status, r.caminho_pdf, r.impressao, r.arquivo, e.nome
+        FROM relatorio r
+        JOIN empresa e ON r.empresa_id = e.id
+        WHERE r.id = ? AND r.status IN ('concluido', 'arquivado')
+    """, (relatorio_id,))
+    row = c.fetchone()
+    conn.close()
+    if row is None:
+        abort(404)
+
+    status, caminho, impressao, arquivo, empresa = row
+    opcoes = dict(
+        mimetype="application/pdf",
+        as_attachment=True,
+        download_name=f"relatorio_{nome_seguro(empresa)}.pdf",
+        conditional=True,
+        etag=impressao,
+        max_age=86400,
+    )
+    if status == "concluido":
+        local = arquivo_local(caminho)
+        if not os.path.exists(local):
+            abort(404)
+        return send_file(local, **opcoes)
+
+    try:
+        with zipfile.ZipFile(arquivo_local(arquivo)) as zip_mes:
+            info = zip_mes.getinfo(caminho)
+            conteudo = zip_mes.open(info)
+    except (FileNotFoundError, KeyError):
+        abort(404)
+    # send_file não sabe o tamanho de um arquivo aberto: o pedido
+    # condicional (304, Range) é resolvido depois, com o do zip
+    opcoes["conditional"] = False
+    resposta = send_file(conteudo, last_modified=datetime(*info.date_time), **opcoes)
+    resposta.content_length = info.file_size
+    try:
+        return resposta.make_conditional(request.environ, accept_ranges=True,
+                                         complete_length=info.file_size)
+    except RequestedRangeNotSatisfiable:
+        conteudo.close()
+        raise
+
+# ==================================================
+# EXPORTAÇÃO
+# uma linha por participante, gerada sob demanda: o
+# cursor é percorrido sem carregar a empresa inteira
+# ==================================================
+class _LinhaCsv:
+    """Destino do csv.writer: devolve a linha em vez de gravá-la."""
+    def write(self, texto):
+        return texto
+
+SQL_EXPORTACAO_RESPOSTAS = """
+    SELECT pa.id, pa.data, r.pergunta_id, r.valor
+    FROM participante pa
+    LEFT JOIN resposta r ON r.participante_id = pa.id
+    WHERE pa.empresa_id = ?
+    ORDER BY pa.id
+"""
+
+SQL_EXPORTACAO_COMPACTA = """
+    SELECT pa.id, pa.data, rc.valores
+    FROM participante pa
+    LEFT JOIN resposta_compacta rc ON rc.participante_id = pa.id
+    WHERE pa.empresa_id = ?
+    ORDER BY pa.id
+"""
+
+SQL_EXPORTACAO_ORIGENS = """
+    SELECT eo.participante_id, eo.pergunta_id, eo.origem
+    FROM participante pa
+    JOIN evento_origem eo ON eo.participante_id = pa.id
+    WHERE pa.empresa_id = ? AND eo.origem != ''
+    ORDER BY pa.id
+"""
+
+def linhas_respostas(conn, empresa_id):
+    """
+    (participante_id, data, pergunta_id, valor) da empresa, ordenado por
+    participante; (participante_id, data, None, None) para quem não
+    respondeu nada. Mesmo formato nos dois modos de armazenamento.
+    """
+    c = conn.cursor()
+    if not layout_compacto():
+        c.execute(SQL_EXPORTACAO_RESPOSTAS, (empresa_id,))
+        yield from c
+        return
+
+    c.execute(SQL_EXPORTACAO_COMPACTA, (empresa_id,))
+    for participante_id, data, valores in c:
+        respostas = desempacotar_respostas(valores) if valores else []
+        if not respostas:
+            yield participante_id, data, None, None
+        for pergunta_id, valor in respostas:
+            yield participante_id, data, pergunta_id, valor
+
+def linhas_csv(empresa_id):
+    catalogo = carregar_catalogo()
+    perguntas = [pid for pid, (_, escala) in catalogo.items() if escala != "evento"]
+    eventos = [pid for pid, (_, escala) in catalogo.items() if escala == "evento"]
+
+    conn = conectar_leitura(empresa_id)
+    c = conn.cursor()
+    c.execute("SELECT id, nome FROM dimensao ORDER BY id")
+    dimensoes = [
+        (dimensao_id, nome) for dimensao_id, nome in c.fetchall()
+        if any(catalogo[pid][0] == dimensao_id for pid in perguntas)
+    ]
+
+    escritor = csv.writer(_LinhaCsv())
+    yield escritor.writerow(
+        ["participante_id", "data"]
+        + [f"pergunta_{pid}" for pid in perguntas]
+        + [f"media_{nome}" for _, nome in dimensoes]
+        + [f"origem_{pid}" for pid in eventos]
+    )
+
+    respostas = linhas_respostas(conn, empresa_id)
+
+    origens = conn.cursor()
+    origens.execute(SQL_EXPORTACAO_ORIGENS, (empresa_id,))
+    grupos_origem = groupby(origens, key=lambda row: row[0])
+    proximo_origem = next(grupos_origem, None)
+
+    try:
+        for participante_id, linhas in groupby(respostas, key=lambda row: row[0]):
+            valores = {}
+            data = None
+            for _, data, pergunta_id, valor in linhas:
+                if pergunta_id is not None:
+                    valores[pergunta_id] = valor
+
+            por_dimensao = {}
+            for pergunta_id, valor in valores.items():
+                por_dimensao.setdefault(catalogo[pergunta_id][0], []).append(valor)
+
+            # as duas consultas vêm ordenadas por participante
+            origens_participante = {}
+            while proximo_origem is not None and proximo_origem[0] <= participante_id:
+                if proximo_origem[0] == participante_id:
+                    for _, pergunta_id, origem in proximo_origem[1]:
+                        origens_participante.setdefault(pergunta_id, []).append(origem)
+                proximo_origem = next(grupos_origem, None)
+
+            yield escritor.writerow(
+                [participante_id, data]
+                + [valores.get(pid, "") for pid in perguntas]
+                + [
+                    round(sum(por_dimensao[did]) / len(por_dimensao[did]), 2)
+                    if did in por_dimensao else ""
+                    for did, _ in dimensoes
+                ]
+                + ["|".join(origens_participante.get(pid, [])) for pid in eventos]
+            )
+    finally:
+        conn.close()
+
+@app.route("/empresa/<int:empresa_id>/export.csv")
+def exportar_csv(empresa_id):
+    conn = conectar_leitura(empresa_id)
+    try:
+        empresa_ou_404(conn.cursor(), empresa_id)
+    finally:
+        conn.close()
+
+    return Response(
+        stream_with_context(linhas_csv(empresa_id)),
+        mimetype="text/csv",
+        headers={"Content-Disposition": f"attachment; filename=respostas_empresa_{empresa_id}.csv"}
+    )
+
+
+# ==================================================
+# IMPORTAÇÃO EM LOTE
+# questionários em papel / tablets offline. Aceita CSV
+# (o mesmo formato de export.csv) ou JSON (lista de
+# objetos). Colunas: pergunta_<id> ou o texto da
+# pergunta; origem_<id> com origens separadas por "|";
+# setor, turno e cargo opcionais.
+# Valores: número da escala ou o texto da opção.
+# ==================================================
+def _normalizar(texto):
+    return " ".join(str(texto).split()).casefold()
+
+def _mapas_importacao():
+    """(coluna normalizada → pergunta_id, escala → {rótulo normalizado: valor})."""
+    conn = conectar_db()
+    c = conn.cursor()
+    c.execute("SELECT id, texto FROM pergunta")
+    colunas = {}
+    for pergunta_id, texto in c.fetchall():
+        colunas[_normalizar(texto)] = pergunta_id
+        colunas[f"pergunta_{pergunta_id}"] = pergunta_id
+    conn.close()
+
+    rotulos = {
+        escala: {_normalizar(rotulo): valor for rotulo, valor in opcoes}
+        for escala, opcoes in ESCALAS.items()
+    }
+    return colunas, rotulos
+
+def _formulario_importado(registro, colunas, rotulos):
+    """Converte uma linha importada no formato do formulário web."""
+    catalogo = carregar_catalogo()
+    form = MultiDict()
+
+    for chave, valor in registro.items():
+        if chave is None or valor in (None, "", []):
+            continue
+        chave = _normalizar(chave)
+
+        if chave in ATRIBUTOS_SEGMENTO:
+            form.add(chave, str(valor))
+            continue
+
+        if chave.startswith("origem_"):
+            origens = valor if isinstance(valor, list) else str(valor).split("|")
+            for origem in map(str, origens):
+                if origem.strip():
+                    form.add(chave, origem.strip())
+            continue
+
+        pergunta_id = colunas.get(chave)
+        if pergunta_id is None:
+            continue  # participante_id, data, media_* etc.
+
+        escala = catalogo[pergunta_id][1]
+        texto = _normalizar(valor)
+        if texto in rotulos[escala]:
+            valor = rotulos[escala][texto]
+        form.add(f"pergunta_{pergunta_id}", str(valor))
+
+    return form
+
+def _registros(nome_arquivo, texto):
+    """Itera (número da linha, registro) de um arquivo CSV ou JSON."""
+    if nome_arquivo.lower().endswith(".json"):
+        dados = json.load(texto)
+        if isinstance(dados, dict):
+            dados = dados.get("respostas", [])
+        if not isinstance(dados, list):
+            raise ValueError("JSON deve ser uma lista de objetos")
+        yield from enumerate(dados, start=1)
+        return
+
+    primeira = texto.readline()
+    # planilhas em português costumam exportar com ";"
+    delimitador = ";" if primeira.count(";") > primeira.count(",") else ","
+    cabecalho = next(csv.reader([primeira], delimiter=delimitador), [])
+    leitor = csv.DictReader(texto, fieldnames=cabecalho, delimiter=delimitador)
+    # linha 1 é o cabeçalho
+    yield from enumerate(leitor, start=2)
+
+def importar_respostas(empresa_id, nome_arquivo, texto, lote=IMPORTACAO_LOTE):
+    """
+    Importa um arquivo para a empresa em transações de `lote` participantes.
+    Linhas inválidas não interrompem a importação: vão para o relatório.
+    Retorna {"arquivo", "importados", "erros": [(linha, mensagem)]}.
+    """
+    colunas, rotulos = _mapas_importacao()
+    relatorio = {"arquivo": nome_arquivo, "importados": 0, "erros": []}
+    pendentes = []
+
+    conn = conectar_db()
+    empresa_ou_404(conn.cursor(), empresa_id)
+
+    def gravar():
+        with conn:
+            gravar_participantes(conn, empresa_id, pendentes)
+        relatorio["importados"] += len(pendentes)
+        pendentes.clear()
+
+    try:
+        for linha, registro in _registros(nome_arquivo, texto):
+            try:
+                if not isinstance(registro, dict):
+                    raise ValueError("registro não é um objeto")
+                form = _formulario_importado(registro, colunas, rotulos)
+                respostas, eventos = validar_respostas(form)
+                if not respostas:
+                    raise ValueError("nenhuma resposta reconhecida")
+                segmento = validar_segmento(form)
+            except ValueError as e:
+                relatorio["erros"].append((linha, str(e)))
+                continue
+
+            pendentes.append((respostas, eventos, segmento))
+            if len(pendentes) >= lote:
+                gravar()
+
+        if pendentes:
+            gravar()
+    except (ValueError, csv.Error) as e:
+        # arquivo ilegível como um todo (JSON inválido, CSV corrompido)
+        relatorio["erros"].append((0, str(e)))
+    finally:
+        conn.close()
+
+    return relatorio
+
+@app.cli.command("importar-respostas")
+@click.argument("empresa_id", type=int)
+@click.argument("arquivos", nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+def importar_respostas_cmd(empresa_id, arquivos):
+    """Importa arquivos CSV/JSON de respostas para EMPRESA_ID."""
+    conn = conectar_db()
+    existe = conn.execute("SELECT 1 FROM empresa WHERE id = ?", (empresa_id,)).fetchone()
+    conn.close()
+    if not existe:
+        raise click.ClickException(f"empresa {empresa_id} não encontrada")
+
+    for caminho in arquivos:
+        with open(caminho, encoding="utf-8-sig", newline="") as texto:
+            relatorio = importar_respostas(empresa_id, caminho, texto)
+
+        print(f"{caminho}: {relatorio['importados']} importados, {len(relatorio['erros'])} erros")
+        if relatorio["erros"]:
+            caminho_erros = f"{caminho}.erros.csv"
+            with open(caminho_erros, "w", encoding="utf-8", newline="") as saida:
+                escritor = csv.writer(saida)
+                escritor.writerow(["linha", "erro"])
+                escritor.writerows(relatorio["erros"])
+            print(f"  erros em {caminho_erros}")
+
+@app.route("/empresa/<int:empresa_id>/importar", methods=["POST"])
+def importar(empresa_id):
+    relatorios = []
+    for arquivo in request.files.getlist("arquivo"):
+        texto = io.TextIOWrapper(arquivo.stream, encoding="utf-8-sig", newline="")
+        relatorio = importar_respostas(empresa_id, arquivo.filename or "", texto)
+        relatorio["erros"] = [{"linha": linha, "erro": erro} for linha, erro in relatorio["erros"]]
+        relatorios.append(relatorio)
+    return jsonify(relatorios)
+
+
+# ==================================================
+# PLANOS DE CONSULTA
+# cada consulta quente deve usar índice; um SCAN de
+# tabela que cresce com as respostas é regressão. As
+# entradas são as mesmas constantes SQL que as funções
+# executam, para a verificação não divergir do código
+# ==================================================
+CONSULTAS_QUENTES = {
+    "continuar: participantes da empresa": SQL_PARTICIPANTES_EMPRESA,
+    "leitura: snapshot em dia com a empresa": SQL_SNAPSHOT_EM_DIA,
+    "relatório: eventos pré-calculados": SQL_EVENTOS_EMPRESA,
+    "relatório: médias pré-calculadas": SQL_MEDIAS_EMPRESA,
+    "relatório: distribuição pré-calculada": SQL_DISTRIBUICAO_EMPRESA,
+    "pontuação: médias das respostas brutas": pontuacao.sql_medias_dimensao(0)[0],
+    "cache: relatório pela impressão": SQL_RELATORIO_EM_CACHE,
+    "fila: relatórios pendentes": SQL_RELATORIOS_PENDENTES,
+    "exportação: respostas por participante": SQL_EXPORTACAO_RESPOSTAS,
+    "exportação: respostas compactas": SQL_EXPORTACAO_COMPACTA,
+    "exportação: origens dos eventos": SQL_EXPORTACAO_ORIGENS,
+    "análise: respostas da empresa": SQL_MATRIZ_RESPOSTAS,
+    "análise: respostas compactas da empresa": SQL_MATRIZ_COMPACTA,
+    "painel: tendência da empresa": SQL_TENDENCIA_EMPRESA,
+    "painel: ranking no período": sql_ranking(True),
+    "painel: ranking em todos os períodos": sql_ranking(False),
+    "envio: token consumido": SQL_TOKEN_ENVIO,
+    "envio: limpeza de tokens": SQL_LIMPAR_TOKENS_ENVIO,
+}
+
+# Tabelas de catálogo, e agregado_carteira (uma linha por período e
+# dimensão): poucas linhas, varrê-las é aceitável
+TABELAS_PEQUENAS = {"pergunta", "dimensao", "controle", "agregado_carteira"}
+
+def verificar_planos(conn):
+    """
+    Roda EXPLAIN QUERY PLAN em CONSULTAS_QUENTES.
+    Retorna [(consulta, detalhe)] com as varreduras completas.
+    """
+    c = conn.cursor()
+    c.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    tabelas = {nome for (nome,) in c.fetchall()}
+
+    problemas = []
+    for nome, sql in CONSULTAS_QUENTES.items():
+        c.execute("EXPLAIN QUERY PLAN " + sql, (0,) * sql.count("?"))
+        for _, _, _, detalhe in c.fetchall():
+            # SCAN, mesmo "USING COVERING INDEX", percorre a tabela inteira
+            if not detalhe.startswith("SCAN "):
+                continue
+            alvo = detalhe.split()[1]
+            # subconsultas materializadas não são tabelas; CONSTANT ROW é SELECT sem FROM
+            if alvo.startswith("(") or detalhe == "SCAN CONSTANT ROW":
+                continue
+            apelidos = re.findall(rf"(\w+)\s+{alvo}\b", sql)
+            tabela = alvo if alvo in tabelas else next((t for t in apelidos if t in tabelas), alvo)
+            if tabela not in TABELAS_PEQUENAS:
+                problemas.append((nome, detalhe))
+    return problemas
+
+@app.cli.command("verificar-indices")
+def verificar_indices_cmd():
+    """Falha se alguma consulta quente fizer varredura completa de tabela."""
+    conn = conectar_db()
+    problemas = verificar_planos(conn)
     conn.close()
 
-    return render_template("encerramento.html")
+    for nome, detalhe in problemas:
+        print(f"SCAN  {nome}: {detalhe}")
+    print(f"{len(CONSULTAS_QUENTES)} consultas verificadas, {len(problemas)} com varredura completa")
+    if problemas:
+        raise SystemExit(1)
 
 
-criar_tabelas()
-migrar_perguntas()
+preparar_banco()
+carregar_catalogo()
 if __name__ == "__main__":
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,1773 @@
+"""
+Benchmarks do questionário psicossocial.
+
+Roda contra um banco e uma pasta de relatórios temporários
+(AVALIACOES_DB, RELATORIOS_DIR), nunca contra avaliacoes.db.
+
+Uso:
+    python benchmark.py submissao [--n 500] [--threads 8]
+    python benchmark.py empresas [--empresas 8] [--n 50] [--threads 16]
+    python benchmark.py carga [--n 400] [--escritores 8] [--leitores 4]
+    python benchmark.py pontuacao [--empresas 5] [--participantes 5000]
+    python benchmark.py questionario [--n 2000]
+    python benchmark.py pdf [--empresas 6] [--participantes 300] [--repeticoes 5]
+    python benchmark.py compacto [--empresas 4] [--participantes 5000] [--repeticoes 20]
+    python benchmark.py analise [--participantes 100000]
+    python benchmark.py token [--threads 32] [--rodadas 20]
+    python benchmark.py fila [--n 2000] [--threads 32]
+    python benchmark.py painel [--empresas 200] [--participantes 100] [--periodos 3]
+    python benchmark.py arquivo [--empresas 4] [--relatorios 6] [--manter 2]
+    python benchmark.py eventos [--empresas 20] [--participantes 2000] [--repeticoes 5]
+    python benchmark.py snapshot [--base 20000] [--n 400] [--threads 8] [--leitores 2]
+    python benchmark.py segmentos [--participantes 20000] [--setores 30] [--repeticoes 5]
+    python benchmark.py inicio [--repeticoes 10] [--salvar benchmark_inicio.json]
+                               [--comparar benchmark_inicio.json]
+    python benchmark.py fluxo [--participantes 200] [--concorrencia 16] [--base 1000]
+                              [--servidor] [--salvar benchmark_base.json]
+                              [--comparar benchmark_base.json]
+"""
+import argparse
+import http.client
+import json
+import logging
+import multiprocessing
+import os
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlencode, urlsplit
+
+_tmp = tempfile.mkdtemp(prefix="bench_avaliacoes_")
+os.environ.setdefault("AVALIACOES_DB", os.path.join(_tmp, "avaliacoes.db"))
+os.environ.setdefault("RELATORIOS_DIR", os.path.join(_tmp, "relatorios"))
+os.environ.setdefault("FILA_ENVIOS_ARQUIVO", os.path.join(_tmp, "fila_envios.jsonl"))
+
+from flask import got_request_exception, request  # noqa: E402
+from werkzeug.datastructures import MultiDict  # noqa: E402
+from werkzeug.serving import make_server  # noqa: E402
+
+import analise  # noqa: E402
+import app  # noqa: E402
+import pontuacao  # noqa: E402
+import relatorio_pdf  # noqa: E402
+
+ORIGENS = ["colega", "gestor", "subordinado", "cliente"]
+
+
+# ==================================================
+# DADOS SINTÉTICOS
+# ==================================================
+def formulario_aleatorio(rng):
+    """Gera um formulário completo, como enviado pelo navegador."""
+    form = MultiDict()
+    for pergunta_id, (_, escala) in app.carregar_catalogo().items():
+        valor = rng.choice(app.ESCALAS[escala])[1]
+        form.add(f"pergunta_{pergunta_id}", str(valor))
+        if escala == "evento" and valor > 0:
+            for origem in rng.sample(ORIGENS, rng.randint(1, 2)):
+                form.add(f"origem_{pergunta_id}", origem)
+    return form
+
+def criar_empresa(nome):
+    conn = app.conectar_db()
+    c = conn.cursor()
+    c.execute("INSERT INTO empresa (nome, data) VALUES (?, ?)",
+              (nome, datetime.now().strftime("%Y-%m-%d %H:%M")))
+    empresa_id = c.lastrowid
+    conn.commit()
+    conn.close()
+    return empresa_id
+
+
+# ==================================================
+# SUBMISSÃO: por campo (antigo) x em lote (atual)
+# ==================================================
+def submeter_por_campo(empresa_id, form):
+    """Reprodução do caminho antigo: um SELECT e um INSERT por campo."""
+    conn = sqlite3.connect(app.DB_NAME)
+    c = conn.cursor()
+    c.execute(
+        "INSERT INTO participante (empresa_id, data) VALUES (?, ?)",
+        (empresa_id, datetime.now().strftime("%Y-%m-%d %H:%M"))
+    )
+    participante_id = c.lastrowid
+    for campo, valor in form.items():
+        if not campo.startswith("pergunta_"):
+            continue
+        pergunta_id = int(campo.replace("pergunta_", ""))
+        resposta_valor = int(valor)
+        c.execute("SELECT escala FROM pergunta WHERE id = ?", (pergunta_id,))
+        escala = c.fetchone()[0]
+        if escala != "evento":
+            c.execute(
+                "INSERT INTO resposta (participante_id, pergunta_id, valor) VALUES (?, ?, ?)",
+                (participante_id, pergunta_id, resposta_valor)
+            )
+        elif resposta_valor > 0:
+            for origem in form.getlist(f"origem_{pergunta_id}"):
+                c.execute(
+                    "INSERT INTO evento_origem (participante_id, pergunta_id, origem) VALUES (?, ?, ?)",
+                    (participante_id, pergunta_id, origem)
+                )
+    conn.commit()
+    conn.close()
+
+def submeter_em_lote(empresa_id, form):
+    respostas, eventos = app.validar_respostas(form)
+    conn = app.conectar_db()
+    with conn:
+        app.gravar_participantes(conn, empresa_id, [(respostas, eventos)])
+    conn.close()
+
+def _medir(funcao, empresa_id, formularios, threads):
+    """Submissões por segundo, com `threads` clientes simultâneos."""
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(lambda form: funcao(empresa_id, form), formularios))
+    return len(formularios) / (time.perf_counter() - inicio)
+
+def bench_submissao(args):
+    rng = random.Random(42)
+    formularios = [formulario_aleatorio(rng) for _ in range(args.n)]
+
+    antes = _medir(submeter_por_campo, criar_empresa("bench por campo"), formularios, args.threads)
+    depois = _medir(submeter_em_lote, criar_empresa("bench em lote"), formularios, args.threads)
+
+    print(f"submissões: {args.n}  clientes simultâneos: {args.threads}")
+    print(f"  por campo: {antes:8.1f} submissões/s")
+    print(f"  em lote:   {depois:8.1f} submissões/s  ({depois / antes:.1f}x)")
+
+
+# ==================================================
+# VÁRIAS EMPRESAS EM PARALELO
+# cada empresa responde com um padrão próprio; ao final,
+# nenhuma resposta pode estar gravada na empresa errada
+# ==================================================
+def formulario_da_empresa(indice):
+    form = MultiDict()
+    for pergunta_id, (_, escala) in app.carregar_catalogo().items():
+        opcoes = app.ESCALAS[escala]
+        form.add(f"pergunta_{pergunta_id}", str(opcoes[indice % len(opcoes)][1]))
+    return form
+
+def bench_empresas(args):
+    empresas = [criar_empresa(f"bench empresa {i}") for i in range(args.empresas)]
+    formularios = {eid: formulario_da_empresa(i) for i, eid in enumerate(empresas)}
+    tarefas = [eid for eid in empresas for _ in range(args.n)]
+    random.Random(42).shuffle(tarefas)
+
+    def enviar(empresa_id):
+        cliente = app.app.test_client()
+        r = cliente.post(f"/empresa/{empresa_id}/questionario", data=formularios[empresa_id])
+        return r.status_code
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        status = list(pool.map(enviar, tarefas))
+    duracao = time.perf_counter() - inicio
+
+    conn = app.conectar_db()
+    c = conn.cursor()
+    erros = 0
+    for eid in empresas:
+        esperado = {int(campo[len("pergunta_"):]): int(valor)
+                    for campo, valor in formularios[eid].items()}
+        c.execute("""
+            SELECT r.pergunta_id, r.valor
+            FROM resposta r
+            JOIN participante pa ON r.participante_id = pa.id
+            WHERE pa.empresa_id = ?
+        """, (eid,))
+        erros += sum(1 for pid, valor in c.fetchall() if esperado[pid] != valor)
+        c.execute("SELECT COUNT(*) FROM participante WHERE empresa_id = ?", (eid,))
+        if c.fetchone()[0] != args.n:
+            erros += 1
+    conn.close()
+
+    print(f"empresas: {args.empresas}  submissões: {len(tarefas)}  threads: {args.threads}")
+    print(f"  {len(tarefas) / duracao:8.1f} submissões/s  status != 302: {sum(s != 302 for s in status)}")
+    print(f"  respostas na empresa errada: {erros}")
+    if erros:
+        raise SystemExit(1)
+
+
+# ==================================================
+# CARGA: submissões concorrentes x leituras de relatório
+# roda uma vez com journal DELETE e outra com WAL
+# ==================================================
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    if not ordenados:
+        return 0.0
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p / 100))]
+
+def _ler_respostas(empresa_id):
+    """Leitura pesada, como a de um relatório ou exportação."""
+    conn = app.conectar_db()
+    c = conn.cursor()
+    c.execute("""
+        SELECT pa.id, p.dimensao_id, r.valor
+        FROM resposta r
+        JOIN pergunta p ON r.pergunta_id = p.id
+        JOIN participante pa ON r.participante_id = pa.id
+        WHERE pa.empresa_id = ?
+    """, (empresa_id,))
+    c.fetchall()
+    conn.close()
+
+def bench_carga(args):
+    if not args.interno:
+        for modo in ("DELETE", "WAL"):
+            env = dict(
+                os.environ,
+                SQLITE_JOURNAL_MODE=modo,
+                AVALIACOES_DB=os.path.join(tempfile.mkdtemp(prefix="bench_carga_"), "avaliacoes.db"),
+            )
+            subprocess.run(
+                [sys.executable, __file__, "carga", "--interno",
+                 "--n", str(args.n), "--escritores", str(args.escritores),
+                 "--leitores", str(args.leitores), "--base", str(args.base)],
+                env=env, check=True
+            )
+        return
+
+    rng = random.Random(42)
+    empresa_id = criar_empresa("bench carga")
+    conn = app.conectar_db()
+    with conn:
+        app.gravar_participantes(conn, empresa_id, [
+            app.validar_respostas(formulario_aleatorio(rng)) for _ in range(args.base)
+        ])
+    conn.close()
+    formularios = [formulario_aleatorio(rng) for _ in range(args.n)]
+
+    latencias = []
+    erros = {"escrita": 0, "leitura": 0}
+    leituras = [0]
+    fim = threading.Event()
+
+    def escrever(form):
+        inicio = time.perf_counter()
+        try:
+            submeter_em_lote(empresa_id, form)
+        except sqlite3.OperationalError:
+            erros["escrita"] += 1
+            return
+        latencias.append(time.perf_counter() - inicio)
+
+    def ler():
+        while not fim.is_set():
+            try:
+                _ler_respostas(empresa_id)
+                leituras[0] += 1
+            except sqlite3.OperationalError:
+                erros["leitura"] += 1
+
+    leitores = [threading.Thread(target=ler) for _ in range(args.leitores)]
+    for t in leitores:
+        t.start()
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.escritores) as pool:
+        list(pool.map(escrever, formularios))
+    duracao = time.perf_counter() - inicio
+    fim.set()
+    for t in leitores:
+        t.join()
+
+    print(f"journal_mode={app.SQLITE_JOURNAL_MODE}  escritores={args.escritores}  "
+          f"leitores={args.leitores}  base={args.base} participantes")
+    print(f"  submissões: {len(latencias) / duracao:8.1f}/s  "
+          f"p50 {percentil(latencias, 50) * 1000:6.1f} ms  p95 {percentil(latencias, 95) * 1000:6.1f} ms")
+    print(f"  leituras:   {leituras[0] / duracao:8.1f}/s")
+    print(f"  erros 'database is locked': escrita {erros['escrita']}  leitura {erros['leitura']}")
+
+
+# ==================================================
+# PONTUAÇÃO: Python (finalizar antigo) x SQL x agregados
+# ==================================================
+def popular(empresa_id, participantes, rng, lote=1000):
+    """Grava participantes sintéticos em transações grandes."""
+    conn = app.conectar_db()
+    for inicio in range(0, participantes, lote):
+        with conn:
+            app.gravar_participantes(conn, empresa_id, [
+                app.validar_respostas(formulario_aleatorio(rng))
+                for _ in range(min(lote, participantes - inicio))
+            ])
+    conn.close()
+
+def medias_em_python(conn, empresa_id):
+    """Implementação antiga de finalizar(): tudo em memória."""
+    c = conn.cursor()
+    c.execute("""
+        SELECT pa.id, d.nome, r.valor
+        FROM resposta r
+        JOIN pergunta p ON r.pergunta_id = p.id
+        JOIN dimensao d ON p.dimensao_id = d.id
+        JOIN participante pa ON r.participante_id = pa.id
+        WHERE pa.empresa_id = ?
+        ORDER BY d.id, pa.id
+    """, (empresa_id,))
+    respostas_por_dimensao = {}
+    for participante_id, dimensao, valor in c.fetchall():
+        respostas_por_dimensao \
+            .setdefault(dimensao, {}) \
+            .setdefault(participante_id, []) \
+            .append(valor)
+
+    medias = {}
+    for dimensao, participantes in respostas_por_dimensao.items():
+        individuais = [sum(r) / len(r) for r in participantes.values()]
+        medias[dimensao] = round(sum(individuais) / len(individuais), 2)
+    return medias
+
+def bench_pontuacao(args):
+    rng = random.Random(42)
+    empresas = []
+    for i in range(args.empresas):
+        empresa_id = criar_empresa(f"bench pontuação {i}")
+        popular(empresa_id, args.participantes, rng)
+        empresas.append(empresa_id)
+
+    conn = app.conectar_db()
+    metodos = {
+        "python": lambda eid: medias_em_python(conn, eid),
+        "sql": lambda eid: pontuacao.medias_dimensao(conn, eid),
+        "agregados": lambda eid: app.medias_empresa(conn.cursor(), eid),
+    }
+    tempos = {}
+    resultados = {}
+    for nome, funcao in metodos.items():
+        inicio = time.perf_counter()
+        resultados[nome] = [funcao(eid) for eid in empresas]
+        tempos[nome] = (time.perf_counter() - inicio) / len(empresas)
+
+    inicio = time.perf_counter()
+    todas = pontuacao.medias_por_empresa(conn)
+    tempo_todas = time.perf_counter() - inicio
+    conn.close()
+
+    divergencias = 0
+    for i, eid in enumerate(empresas):
+        referencia = resultados["python"][i]
+        for nome in ("sql", "agregados"):
+            if resultados[nome][i] != referencia:
+                divergencias += 1
+                print(f"  divergência empresa {eid} ({nome}): {resultados[nome][i]} != {referencia}")
+        if todas[eid] != referencia:
+            divergencias += 1
+
+    print(f"empresas: {args.empresas} x {args.participantes} participantes")
+    for nome, tempo in tempos.items():
+        print(f"  {nome:<10} {tempo * 1000:9.1f} ms por empresa")
+    print(f"  {'sql todas':<10} {tempo_todas * 1000:9.1f} ms no total (uma consulta agrupada)")
+    print(f"  divergências: {divergencias}")
+    if divergencias:
+        raise SystemExit(1)
+
+
+# ==================================================
+# GET /questionario: renderização a cada acesso x cache x 304
+# ==================================================
+def _questionario_sem_cache(empresa_id):
+    """Reprodução da rota antiga: consulta e renderiza a cada acesso."""
+    conn = sqlite3.connect(app.DB_NAME)
+    c = conn.cursor()
+    c.execute("SELECT id, texto, escala FROM pergunta ORDER BY id")
+    perguntas = c.fetchall()
+    conn.close()
+    return app.render_template("questionario.html", perguntas=perguntas, ESCALAS=app.ESCALAS)
+
+def bench_questionario(args):
+    app.app.add_url_rule(
+        "/bench/<int:empresa_id>/questionario", "bench_questionario", _questionario_sem_cache
+    )
+    empresa_id = criar_empresa("bench questionário")
+    cliente = app.app.test_client()
+    url = f"/empresa/{empresa_id}/questionario"
+    etag = cliente.get(url).headers["ETag"]
+
+    cenarios = {
+        "sem cache": (f"/bench/{empresa_id}/questionario", {}),
+        "cache (200)": (url, {}),
+        "revalidação (304)": (url, {"If-None-Match": etag}),
+    }
+    print(f"GET /questionario  requisições: {args.n}")
+    for nome, (caminho, cabecalhos) in cenarios.items():
+        inicio = time.perf_counter()
+        for _ in range(args.n):
+            cliente.get(caminho, headers=cabecalhos)
+        duracao = time.perf_counter() - inicio
+        print(f"  {nome:<18} {args.n / duracao:8.1f} req/s")
+
+
+# ==================================================
+# PDF: só texto x com gráficos (cache frio e quente)
+# ==================================================
+def bench_pdf(args):
+    rng = random.Random(42)
+    conn = app.conectar_db()
+    dados = []
+    for i in range(args.empresas):
+        empresa_id = criar_empresa(f"bench pdf {i}")
+        popular(empresa_id, args.participantes, rng)
+        dados.append(app.dados_relatorio(conn.cursor(), empresa_id))
+    conn.close()
+
+    def limpar_graficos():
+        relatorio_pdf._formas_semaforo.cache_clear()
+        relatorio_pdf._formas_distribuicao.cache_clear()
+
+    cenarios = {
+        "só texto": (False, None),
+        "gráficos, cache frio": (True, limpar_graficos),
+        "gráficos, cache quente": (True, None),
+    }
+    print(f"gerar_pdf: {args.empresas} empresas x {args.participantes} participantes, "
+          f"{args.repeticoes} repetições")
+    referencia = None
+    for nome, (graficos, antes) in cenarios.items():
+        if graficos:
+            # aquece o cache para o cenário quente; o frio limpa a cada relatório
+            for d in dados:
+                app.gerar_pdf(*d, tempos={}, graficos=True)
+        duracoes = []
+        tamanhos = []
+        for _ in range(args.repeticoes):
+            for d in dados:
+                if antes:
+                    antes()
+                tempos = {}
+                caminho = app.gerar_pdf(*d, tempos=tempos, graficos=graficos)
+                duracoes.append(tempos["montagem"] + tempos["build"])
+                tamanhos.append(os.path.getsize(caminho))
+        media = sum(duracoes) / len(duracoes)
+        referencia = referencia or media
+        print(f"  {nome:<24} {media * 1000:8.1f} ms/relatório  p95 {percentil(duracoes, 95) * 1000:8.1f} ms"
+              f"  {sum(tamanhos) / len(tamanhos) / 1024:7.1f} KiB  ({media / referencia:.2f}x)")
+    info = relatorio_pdf._formas_distribuicao.cache_info()
+    print(f"  cache de histogramas: {info.hits} acertos, {info.misses} falhas")
+
+
+# ==================================================
+# RESPOSTAS: linhas em resposta x BLOB compacto
+# tamanho do banco, /finalizar, exportação e reconstrução
+# dos agregados (decodifica as empresas inteiras)
+# ==================================================
+def _medir_armazenamento(empresas, repeticoes):
+    # nenhuma conexão fica emprestada durante as requisições do test client:
+    # o teardown da requisição zera os empréstimos da thread
+    conn = app.conectar_db()
+    c = conn.cursor()
+    c.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    c.execute("VACUUM")
+    tamanho = app._tamanho_banco(c)
+    conn.close()
+
+    cliente = app.app.test_client()
+    finalizar = []
+    for _ in range(repeticoes):
+        for empresa_id in empresas:
+            conn = app.conectar_db()
+            with conn:
+                conn.execute("DELETE FROM relatorio")
+            conn.close()
+            inicio = time.perf_counter()
+            cliente.get(f"/empresa/{empresa_id}/finalizar")
+            finalizar.append(time.perf_counter() - inicio)
+
+    inicio = time.perf_counter()
+    csvs = [b"".join(cliente.get(f"/empresa/{empresa_id}/export.csv").response) for empresa_id in empresas]
+    exportacao = (time.perf_counter() - inicio) / len(empresas)
+
+    conn = app.conectar_db()
+    c = conn.cursor()
+    inicio = time.perf_counter()
+    with conn:
+        app.reconstruir_agregados(conn)
+    reconstrucao = time.perf_counter() - inicio
+
+    c.execute("SELECT * FROM agregado_dimensao ORDER BY empresa_id, dimensao_id")
+    dimensoes = c.fetchall()
+    c.execute("SELECT * FROM agregado_distribuicao ORDER BY empresa_id, dimensao_id, valor")
+    distribuicao = c.fetchall()
+    c.execute("SELECT * FROM agregado_periodo ORDER BY empresa_id, periodo, dimensao_id")
+    periodos = c.fetchall()
+    conn.close()
+    return {
+        "tamanho": tamanho, "finalizar": finalizar, "exportacao": exportacao,
+        "reconstrucao": reconstrucao, "csvs": csvs,
+        "agregados": (dimensoes, distribuicao, periodos),
+    }
+
+def _mesmas_somas(a, b, coluna_media):
+    """Linhas iguais, exceto a soma de médias (float), comparada com tolerância."""
+    return len(a) == len(b) and all(
+        x[:coluna_media] == y[:coluna_media] and x[coluna_media + 1:] == y[coluna_media + 1:]
+        and abs(x[coluna_media] - y[coluna_media]) < 1e-6
+        for x, y in zip(a, b)
+    )
+
+def _mesmos_agregados(a, b):
+    (dim_a, dist_a, per_a), (dim_b, dist_b, per_b) = a, b
+    return dist_a == dist_b and _mesmas_somas(dim_a, dim_b, 3) and _mesmas_somas(per_a, per_b, 4)
+
+def bench_compacto(args):
+    rng = random.Random(42)
+    empresas = []
+    for i in range(args.empresas):
+        empresa_id = criar_empresa(f"bench compacto {i}")
+        popular(empresa_id, args.participantes, rng)
+        empresas.append(empresa_id)
+    # só a requisição interessa; os PDFs ficariam disputando a CPU
+    app.enfileirar_relatorio = lambda relatorio_id: None
+
+    linhas = _medir_armazenamento(empresas, args.repeticoes)
+    conn = app.conectar_db()
+    inicio = time.perf_counter()
+    convertidos = app.compactar_respostas(conn)
+    conversao = time.perf_counter() - inicio
+    conn.close()
+    compacto = _medir_armazenamento(empresas, args.repeticoes)
+
+    print(f"armazenamento: {args.empresas} empresas x {args.participantes} participantes "
+          f"({convertidos} convertidos em {conversao:.1f}s)")
+    print(f"  {'':<12}{'banco MiB':>10}{'finalizar p50':>15}{'p95 ms':>9}{'export ms':>11}{'reconstr. ms':>14}")
+    for nome, r in (("linhas", linhas), ("compacto", compacto)):
+        print(f"  {nome:<12}{r['tamanho'] / 1024 / 1024:>10.1f}"
+              f"{percentil(r['finalizar'], 50) * 1000:>15.2f}{percentil(r['finalizar'], 95) * 1000:>9.2f}"
+              f"{r['exportacao'] * 1000:>11.1f}{r['reconstrucao'] * 1000:>14.1f}")
+    print(f"  tamanho: {compacto['tamanho'] / linhas['tamanho']:.0%} do original")
+
+    divergencias = []
+    if compacto["csvs"] != linhas["csvs"]:
+        divergencias.append("exportação CSV")
+    if not _mesmos_agregados(compacto["agregados"], linhas["agregados"]):
+        divergencias.append("agregados reconstruídos")
+    for divergencia in divergencias:
+        print(f"  DIVERGÊNCIA {divergencia}")
+    if divergencias:
+        raise SystemExit(1)
+
+
+# ==================================================
+# ANÁLISE: montagem da matriz e cálculo, nos dois
+# formatos de armazenamento; confere com statistics
+# ==================================================
+def _conferir_analise(matriz, resultado, catalogo):
+    """Refaz desvio padrão, mediana e alfa da 1ª dimensão com statistics."""
+    dimensao_id = catalogo[matriz.perguntas[0]][0]
+    indices = [i for i, pid in enumerate(matriz.perguntas) if catalogo[pid][0] == dimensao_id]
+    linhas = list(zip(*(matriz.coluna(i) for i in indices)))
+    medias = [sum(t) / sum(1 for v in t if v) for t in linhas if any(t)]
+    completos = [t for t in linhas if all(t)]
+    k = len(indices)
+    alfa = k / (k - 1) * (1 - sum(statistics.variance(c) for c in zip(*completos))
+                          / statistics.variance([sum(t) for t in completos]))
+    esperado = (round(statistics.stdev(medias), 2), round(statistics.median(medias), 2), round(alfa, 3))
+    dimensao = resultado["dimensoes"][0]
+    obtido = (dimensao["desvio_padrao"], dimensao["percentis"]["p50"], dimensao["alfa_cronbach"])
+    return esperado == obtido, esperado, obtido
+
+def bench_analise(args):
+    empresa_id = criar_empresa("bench análise")
+    popular(empresa_id, args.participantes, random.Random(42))
+
+    print(f"análise: {args.participantes} participantes")
+    conn = app.conectar_db()
+    c = conn.cursor()
+    for formato in ("linhas", "compacto"):
+        if formato == "compacto":
+            app.compactar_respostas(conn)
+        inicio = time.perf_counter()
+        matriz = app.matriz_empresa(c, empresa_id)
+        montagem = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        resultado = app.analise_empresa(c, empresa_id)
+        total = time.perf_counter() - inicio
+        print(f"  {formato:<10} matriz {montagem * 1000:8.1f} ms   "
+              f"análise completa {total * 1000:8.1f} ms ({len(matriz.dados) / 1024:.0f} KiB)")
+
+    ok, esperado, obtido = _conferir_analise(matriz, resultado, app.carregar_catalogo())
+    conn.close()
+    print(f"  conferência com statistics (dp, mediana, alfa): {obtido} {'ok' if ok else f'!= {esperado}'}")
+
+    # 60 itens de valor 5: somas acima de 255, que não cabem num byte
+    colunas = [bytes([5, 0, 3]) * 100 for _ in range(60)]
+    somas_ok = list(analise.somar_colunas(colunas)) == [sum(t) for t in zip(*colunas)]
+    print(f"  somar_colunas com somas acima de 255: {'ok' if somas_ok else 'DIVERGENTE'}")
+    if not ok or not somas_ok:
+        raise SystemExit(1)
+
+
+# ==================================================
+# TOKEN DE ENVIO: o mesmo envio disparado por várias
+# threads ao mesmo tempo grava um único participante
+# ==================================================
+def bench_token(args):
+    empresa_id = criar_empresa("bench token")
+    rng = random.Random(42)
+    url = f"/empresa/{empresa_id}/questionario"
+    barreira = threading.Barrier(args.threads)
+    locais = threading.local()
+
+    def enviar(form):
+        if not hasattr(locais, "cliente"):
+            locais.cliente = app.app.test_client()
+        barreira.wait()
+        r = locais.cliente.post(url, data=form)
+        return r.status_code, r.location
+
+    def participantes():
+        conn = app.conectar_db()
+        c = conn.cursor()
+        c.execute("SELECT COUNT(*) FROM participante WHERE empresa_id = ?", (empresa_id,))
+        total = c.fetchone()[0]
+        conn.close()
+        return total
+
+    falhas = []
+    duracoes = []
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        for rodada in range(args.rodadas):
+            form = formulario_aleatorio(rng)
+            form.add("token_envio", uuid.uuid4().hex)
+            antes = participantes()
+            inicio = time.perf_counter()
+            respostas = list(pool.map(enviar, [form] * args.threads))
+            duracoes.append(time.perf_counter() - inicio)
+            gravados = participantes() - antes
+            if gravados != 1 or len(set(respostas)) != 1 or respostas[0][0] != 302:
+                falhas.append(f"rodada {rodada}: {gravados} participantes, respostas {set(respostas)}")
+
+    # reenvio tardio: resolvido em memória, sem abrir conexão
+    inicio = time.perf_counter()
+    for _ in range(200):
+        app.app.test_client().post(url, data=form)
+    memoria = (time.perf_counter() - inicio) / 200
+
+    print(f"token de envio: {args.rodadas} rodadas x {args.threads} envios simultâneos do mesmo token")
+    print(f"  participantes gravados: {participantes()} (esperado {args.rodadas})")
+    print(f"  rodada p50 {percentil(duracoes, 50) * 1000:.1f} ms   reenvio resolvido em memória "
+          f"{memoria * 1000:.2f} ms")
+    for falha in falhas:
+        print(f"  FALHA {falha}")
+    if falhas:
+        raise SystemExit(1)
+
+
+# ==================================================
+# FILA DE ENVIOS
+# a mesma rajada de POSTs gravada direto e pela fila com
+# diário; depois, uma queda simulada: o diário é regravado
+# e os envios que já estavam no banco não se repetem
+# ==================================================
+def _contar_participantes(empresa_id):
+    conn = app.conectar_db()
+    c = conn.cursor()
+    c.execute("SELECT COUNT(*) FROM participante WHERE empresa_id = ?", (empresa_id,))
+    total = c.fetchone()[0]
+    conn.close()
+    return total
+
+def _rajada(empresa_id, formularios, threads):
+    """(latências de cada POST, duração até o último ser respondido, status != 302)"""
+    url = f"/empresa/{empresa_id}/questionario"
+    locais = threading.local()
+
+    def enviar(form):
+        if not hasattr(locais, "cliente"):
+            locais.cliente = app.app.test_client()
+        inicio = time.perf_counter()
+        r = locais.cliente.post(url, data=form)
+        return time.perf_counter() - inicio, r.status_code
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        resultados = list(pool.map(enviar, formularios))
+    duracao = time.perf_counter() - inicio
+    return [r[0] for r in resultados], duracao, sum(r[1] != 302 for r in resultados)
+
+def bench_fila(args):
+    rng = random.Random(42)
+    formularios = [formulario_aleatorio(rng) for _ in range(args.n)]
+
+    print(f"rajada: {args.n} envios, {args.threads} clientes simultâneos")
+    falhas = []
+    for modo in ("direto", "fila"):
+        app.FILA_ENVIOS = modo == "fila"
+        if app.FILA_ENVIOS:
+            app.iniciar_fila_envios()
+        empresa_id = criar_empresa(f"bench fila {modo}")
+        for form in formularios:
+            form.setlist("token_envio", [uuid.uuid4().hex])
+        inicio = time.perf_counter()
+        latencias, duracao, erros = _rajada(empresa_id, formularios, args.threads)
+        app.aguardar_fila_envios()
+        ate_gravar = time.perf_counter() - inicio
+        total = _contar_participantes(empresa_id)
+        print(f"  {modo:6}  {args.n / duracao:8.1f} envios/s respondidos   "
+              f"p50 {percentil(latencias, 50) * 1000:6.1f} ms  p95 {percentil(latencias, 95) * 1000:6.1f} ms"
+              f"   tudo no banco em {ate_gravar:.2f} s   status != 302: {erros}")
+        if total != args.n or erros:
+            falhas.append(f"{modo}: {total} gravados, {erros} erros")
+
+    for _, soma, transacoes in app.METRICA_FILA_LOTE._series.values():
+        print(f"  fila: {transacoes} transações, média de {soma / transacoes:.1f} envios por transação")
+
+    # queda simulada: diário com envios já gravados, um novo e uma linha cortada
+    app.parar_fila_envios()
+    empresa_id = criar_empresa("bench fila diario")
+    respostas, eventos = app.validar_respostas(formularios[0])
+    gravado = uuid.uuid4().hex
+    conn = app.conectar_db()
+    with conn:
+        app.consumir_token_envio(conn.cursor(), gravado, empresa_id)
+        app.gravar_participantes(conn, empresa_id, [(respostas, eventos)])
+    conn.close()
+    data = datetime.now().strftime("%Y-%m-%d %H:%M")
+    with open(app.ARQUIVO_FILA_ENVIOS, "w", encoding="utf-8") as diario:
+        for token in (gravado, uuid.uuid4().hex):
+            diario.write(json.dumps({"token": token, "empresa_id": empresa_id, "data": data,
+                                     "respostas": respostas, "eventos": eventos}) + "\n")
+        diario.write('{"token": "cortad')
+    retomados = app.iniciar_fila_envios()
+    app.aguardar_fila_envios()
+    total = _contar_participantes(empresa_id)
+    print(f"  diário após queda: {retomados} envios retomados, participantes {total} (esperado 2)")
+    if total != 2:
+        falhas.append(f"diário: {total} participantes")
+    app.parar_fila_envios()
+    app.FILA_ENVIOS = False
+
+    for falha in falhas:
+        print(f"  FALHA {falha}")
+    if falhas:
+        raise SystemExit(1)
+
+
+# ==================================================
+# PAINEL: tendências e ranking lidos dos agregados por
+# período x as mesmas contas sobre as respostas brutas;
+# os agregados incrementais devem bater com a reconstrução
+# ==================================================
+def _ler_agregados_periodo():
+    conn = app.conectar_db()
+    c = conn.cursor()
+    c.execute("SELECT * FROM agregado_periodo ORDER BY empresa_id, periodo, dimensao_id")
+    periodo = c.fetchall()
+    c.execute("SELECT * FROM agregado_carteira ORDER BY periodo, dimensao_id")
+    carteira = c.fetchall()
+    conn.close()
+    return periodo, carteira
+
+def _percentis_brutos(empresa_id, periodo):
+    """Percentil de cada dimensão recalculado das respostas, em Python."""
+    conn = app.conectar_db()
+    c = conn.cursor()
+    sql, params = pontuacao.sql_medias_periodo()
+    c.execute(f"""
+        SELECT m.empresa_id, d.nome, m.soma_medias / m.participantes
+        FROM ({sql}) m JOIN dimensao d ON m.dimensao_id = d.id
+        WHERE m.periodo = ?
+    """, (*params, periodo))
+    medias = {}
+    for empresa, dimensao, media in c.fetchall():
+        medias.setdefault(dimensao, {})[empresa] = media
+    conn.close()
+    return {
+        dimensao: round(100 * sum(m < por_empresa[empresa_id] for m in por_empresa.values())
+                        / (len(por_empresa) - 1))
+        for dimensao, por_empresa in medias.items() if empresa_id in por_empresa
+    }
+
+def bench_painel(args):
+    rng = random.Random(42)
+    ano = datetime.now().year
+    periodos = [str(ano - i) for i in reversed(range(args.periodos))]
+    empresas = [criar_empresa(f"bench painel {i}") for i in range(args.empresas)]
+    conn = app.conectar_db()
+    inicio = time.perf_counter()
+    for empresa_id in empresas:
+        with conn:
+            for periodo in periodos:
+                app.gravar_participantes(conn, empresa_id, [
+                    app.validar_respostas(formulario_aleatorio(rng))
+                    for _ in range(args.participantes)
+                ], f"{periodo}-03-01 10:00")
+    carga = time.perf_counter() - inicio
+    conn.close()
+
+    incrementais = _ler_agregados_periodo()
+    conn = app.conectar_db()
+    with conn:
+        app.reconstruir_agregados(conn)
+    conn.close()
+    reconstruidos = _ler_agregados_periodo()
+    divergencias = []
+    if not (_mesmas_somas(incrementais[0], reconstruidos[0], 4)
+            and _mesmas_somas(incrementais[1], reconstruidos[1], 3)):
+        divergencias.append("agregados incrementais x reconstrução")
+
+    alvo = empresas[len(empresas) // 2]
+    cliente = app.app.test_client()
+    rotas = {
+        "tendência": f"/empresa/{alvo}/tendencia",
+        "ranking": f"/empresa/{alvo}/ranking?periodo={periodos[-1]}",
+        "ranking geral": f"/empresa/{alvo}/ranking",
+        "carteira": "/carteira",
+        "painel": f"/empresa/{alvo}/painel",
+    }
+    total = args.empresas * args.participantes * args.periodos
+    print(f"painel: {args.empresas} empresas x {args.periodos} períodos x {args.participantes} "
+          f"participantes ({total} participantes gravados em {carga:.1f}s)")
+    for nome, url in rotas.items():
+        latencias = []
+        for _ in range(args.repeticoes):
+            inicio = time.perf_counter()
+            r = cliente.get(url)
+            latencias.append(time.perf_counter() - inicio)
+            if r.status_code != 200:
+                divergencias.append(f"{url}: status {r.status_code}")
+                break
+        print(f"  {nome:<15} p50 {percentil(latencias, 50) * 1000:7.2f} ms   "
+              f"p95 {percentil(latencias, 95) * 1000:7.2f} ms")
+
+    inicio = time.perf_counter()
+    brutos = _percentis_brutos(alvo, periodos[-1])
+    recalculo = time.perf_counter() - inicio
+    ranking = cliente.get(rotas["ranking"]).get_json()
+    print(f"  mesmo ranking recalculado das respostas: {recalculo * 1000:.0f} ms")
+    if {linha["dimensao"]: linha["percentil"] for linha in ranking} != brutos:
+        divergencias.append("percentis do ranking")
+
+    for divergencia in divergencias:
+        print(f"  DIVERGÊNCIA {divergencia}")
+    if divergencias:
+        raise SystemExit(1)
+
+
+# ==================================================
+# ARQUIVO DE RELATÓRIOS
+# retenção por empresa, zips por mês e download (Range,
+# 304) de PDFs soltos e arquivados
+# ==================================================
+def _pdfs_por_relatorio():
+    conn = app.conectar_db()
+    c = conn.cursor()
+    c.execute("SELECT id, empresa_id, status, caminho_pdf, arquivo FROM relatorio ORDER BY id")
+    linhas = c.fetchall()
+    conn.close()
+    return linhas
+
+def _baixar(cliente, relatorio_id, **cabecalhos):
+    inicio = time.perf_counter()
+    r = cliente.get(f"/relatorio/{relatorio_id}/pdf", headers=cabecalhos)
+    return r, time.perf_counter() - inicio
+
+def bench_arquivo(args):
+    rng = random.Random(42)
+    empresas = [criar_empresa(f"bench arquivo {i}") for i in range(args.empresas)]
+    meses = [f"{2000 + i // 12:04d}-{i % 12 + 1:02d}" for i in range(args.relatorios)]
+
+    # gera tudo sem retenção; as datas dos pedidos são espalhadas por mês depois
+    app.RELATORIOS_POR_EMPRESA = 10 ** 6
+    inicio = time.perf_counter()
+    for empresa_id in empresas:
+        for mes in meses:
+            popular(empresa_id, 3, rng)
+            conn = app.conectar_db()
+            with conn:
+                c = conn.cursor()
+                c.execute(
+                    "INSERT INTO relatorio (empresa_id, caminho_pdf, data, status) VALUES (?, '', ?, 'pendente')",
+                    (empresa_id, f"{mes}-15 10:00")
+                )
+                relatorio_id = c.lastrowid
+            conn.close()
+            app.processar_relatorio(relatorio_id)
+            conn = app.conectar_db()
+            with conn:
+                conn.execute("UPDATE relatorio SET data = ? WHERE id = ?", (f"{mes}-15 10:00", relatorio_id))
+            conn.close()
+    geracao = time.perf_counter() - inicio
+
+    # pedidos repetidos do PDF mais recente (mesma impressão): ocupam
+    # uma vaga só entre os RELATORIOS_POR_EMPRESA soltos
+    conn = app.conectar_db()
+    colunas = ", ".join(nome for _, nome, *_ in conn.execute("PRAGMA table_info(relatorio)") if nome != "id")
+    with conn:
+        for empresa_id in empresas:
+            for _ in range(args.manter):
+                conn.execute(f"""
+                    INSERT INTO relatorio ({colunas})
+                    SELECT {colunas} FROM relatorio WHERE empresa_id = ? ORDER BY id DESC LIMIT 1
+                """, (empresa_id,))
+    conn.close()
+
+    originais = {}
+    for relatorio_id, _, status, caminho, _ in _pdfs_por_relatorio():
+        with open(app.arquivo_local(caminho), "rb") as f:
+            originais[relatorio_id] = f.read()
+
+    app.RELATORIOS_POR_EMPRESA = args.manter
+    inicio = time.perf_counter()
+    arquivados = app.limpar_cache_relatorios()
+    arquivamento = time.perf_counter() - inicio
+    total = args.empresas * args.relatorios
+    print(f"arquivo: {args.empresas} empresas x {args.relatorios} relatórios ({total} PDFs "
+          f"gerados em {geracao:.1f}s), {args.manter} soltos por empresa")
+    print(f"  arquivamento: {arquivados} PDFs em {arquivamento * 1000:.0f} ms")
+
+    divergencias = []
+    linhas = _pdfs_por_relatorio()
+    por_empresa = {}
+    for relatorio_id, empresa_id, status, caminho, arquivo in linhas:
+        por_empresa.setdefault(empresa_id, []).append((relatorio_id, status, caminho, arquivo))
+    for empresa_id, relatorios in por_empresa.items():
+        soltos = {r[2] for r in relatorios if r[1] == "concluido"}
+        recentes = list(dict.fromkeys(r[2] for r in reversed(relatorios)))[:args.manter]
+        if soltos != set(recentes):
+            divergencias.append(f"empresa {empresa_id}: {len(soltos)} PDFs soltos, "
+                                f"esperados os {args.manter} mais recentes")
+        for relatorio_id, status, caminho, arquivo in relatorios:
+            if status == "arquivado" and os.path.exists(app.arquivo_local(caminho)):
+                divergencias.append(f"relatório {relatorio_id}: PDF arquivado continua solto")
+    if app.limpar_cache_relatorios() != 0:
+        divergencias.append("segundo arquivamento não foi vazio")
+
+    cliente = app.app.test_client()
+    estado = cliente.get("/relatorios/cache").get_json()
+    print(f"  soltos: {estado['arquivos']} PDFs, {estado['bytes'] / 1024:.0f} KiB   "
+          f"zips: {estado['zips']}, {estado['bytes_zips'] / 1024:.0f} KiB   "
+          f"(PDFs originais: {sum(map(len, originais.values())) / 1024:.0f} KiB)")
+
+    latencias = {"concluido": [], "arquivado": []}
+    for relatorio_id, _, status, _, _ in linhas:
+        r, duracao = _baixar(cliente, relatorio_id)
+        latencias[status].append(duracao)
+        if r.status_code != 200 or r.data != originais[relatorio_id]:
+            divergencias.append(f"download do relatório {relatorio_id} ({status})")
+            continue
+        etag = r.headers.get("ETag")
+        if _baixar(cliente, relatorio_id, **{"If-None-Match": etag})[0].status_code != 304:
+            divergencias.append(f"relatório {relatorio_id} ({status}): If-None-Match sem 304")
+        parcial = _baixar(cliente, relatorio_id, Range="bytes=100-199")[0]
+        if parcial.status_code != 206 or parcial.data != originais[relatorio_id][100:200]:
+            divergencias.append(f"relatório {relatorio_id} ({status}): Range sem 206")
+    for status, duracoes in latencias.items():
+        if duracoes:
+            print(f"  download {status:<10} p50 {percentil(duracoes, 50) * 1000:6.2f} ms   "
+                  f"p95 {percentil(duracoes, 95) * 1000:6.2f} ms")
+
+    # zips além da retenção somem; os relatórios deles expiram
+    app.RELATORIOS_ARQUIVO_MAX_MESES = 1
+    app.limpar_cache_relatorios()
+    app.RELATORIOS_ARQUIVO_MAX_MESES = 0
+    for relatorio_id, _, status, _, arquivo in _pdfs_por_relatorio():
+        if status not in ("concluido", "expirado"):
+            divergencias.append(f"relatório {relatorio_id}: {status} depois da expiração")
+        elif status == "expirado" and cliente.get(f"/relatorio/{relatorio_id}/pdf").status_code != 404:
+            divergencias.append(f"relatório {relatorio_id}: expirado ainda baixa")
+    if os.listdir(app.arquivo_local("arquivo")):
+        divergencias.append("zips expirados não foram apagados")
+
+    for divergencia in divergencias:
+        print(f"  DIVERGÊNCIA {divergencia}")
+    if divergencias:
+        raise SystemExit(1)
+
+
+# ==================================================
+# EVENTOS CRÍTICOS
+# contagem antiga (junção em evento_origem a cada relatório,
+# uma linha por origem) x agregado_evento mantido no envio
+# ==================================================
+SQL_EVENTOS_ANTIGO = """
+    SELECT p.texto, COUNT(*)
+    FROM evento_origem eo
+    JOIN pergunta p ON eo.pergunta_id = p.id
+    JOIN participante pa ON eo.participante_id = pa.id
+    WHERE pa.empresa_id = ? AND eo.origem != ''
+    GROUP BY p.texto
+"""
+
+def _ler_agregado_evento():
+    conn = app.conectar_db()
+    c = conn.cursor()
+    c.execute("SELECT empresa_id, pergunta_id, origem, participantes FROM agregado_evento")
+    linhas = {(e, p, o): n for e, p, o, n in c.fetchall() if n}
+    conn.close()
+    return linhas
+
+def _eventos_em_python():
+    """Participantes distintos por (empresa, pergunta, origem), direto de evento_origem."""
+    conn = app.conectar_db()
+    c = conn.cursor()
+    c.execute("""
+        SELECT pa.empresa_id, eo.pergunta_id, eo.origem, eo.participante_id
+        FROM evento_origem eo
+        JOIN participante pa ON eo.participante_id = pa.id
+    """)
+    conjuntos = {}
+    for empresa_id, pergunta_id, origem, participante_id in c.fetchall():
+        conjuntos.setdefault((empresa_id, pergunta_id, origem), set()).add(participante_id)
+        conjuntos.setdefault((empresa_id, pergunta_id, ""), set()).add(participante_id)
+    conn.close()
+    return {chave: len(participantes) for chave, participantes in conjuntos.items()}
+
+def _eventos_sem_origem():
+    """"Sim" sem origem marcada conta no total do evento, também após reconstruir."""
+    empresa_id = criar_empresa("bench eventos sem origem")
+    form = MultiDict()
+    for pergunta_id, (_, escala) in app.carregar_catalogo().items():
+        form.add(f"pergunta_{pergunta_id}", "1" if escala == "evento" else "3")
+    conn = app.conectar_db()
+    with conn:
+        app.gravar_participantes(conn, empresa_id, [app.validar_respostas(form)])
+    c = conn.cursor()
+    incremental = app.eventos_empresa(c, empresa_id)
+    with conn:
+        app.reconstruir_eventos(c, empresa_id)
+    reconstruido = app.eventos_empresa(c, empresa_id)
+    conn.close()
+
+    falhas = []
+    if not incremental or any(evento != (1, {}) for evento in incremental.values()):
+        falhas.append(f"sem origem: {incremental}")
+    if reconstruido != incremental:
+        falhas.append(f"sem origem reconstruído: {reconstruido}")
+    return falhas
+
+def bench_eventos(args):
+    rng = random.Random(42)
+    empresas = [criar_empresa(f"bench eventos {i}") for i in range(args.empresas)]
+    for empresa_id in empresas:
+        popular(empresa_id, args.participantes, rng)
+
+    divergencias = []
+    brutos = _eventos_em_python()
+    if _ler_agregado_evento() != brutos:
+        divergencias.append("agregado_evento incremental x evento_origem")
+    conn = app.conectar_db()
+    with conn:
+        app.reconstruir_eventos(conn.cursor())
+    conn.close()
+    if _ler_agregado_evento() != brutos:
+        divergencias.append("agregado_evento reconstruído x evento_origem")
+
+    conn = app.conectar_db()
+    c = conn.cursor()
+    tempos = {"junção em evento_origem": [], "agregado_evento": []}
+    linhas_origem = participantes = 0
+    for _ in range(args.repeticoes):
+        for empresa_id in empresas:
+            inicio = time.perf_counter()
+            c.execute(SQL_EVENTOS_ANTIGO, (empresa_id,))
+            antigo = dict(c.fetchall())
+            tempos["junção em evento_origem"].append(time.perf_counter() - inicio)
+
+            inicio = time.perf_counter()
+            novo = app.eventos_empresa(c, empresa_id)
+            tempos["agregado_evento"].append(time.perf_counter() - inicio)
+
+            if sum(antigo.values()) != sum(sum(origens.values()) for _, origens in novo.values()):
+                divergencias.append(f"empresa {empresa_id}: soma das origens")
+            linhas_origem += sum(antigo.values())
+            participantes += sum(total for total, _ in novo.values())
+
+    lote = app.dados_relatorios(c, empresas)
+    for empresa_id in empresas:
+        if lote[empresa_id][3] != app.eventos_empresa(c, empresa_id):
+            divergencias.append(f"empresa {empresa_id}: eventos do lote")
+    conn.close()
+    divergencias.extend(_eventos_sem_origem())
+
+    print(f"eventos: {args.empresas} empresas x {args.participantes} participantes")
+    referencia = None
+    for nome, duracoes in tempos.items():
+        p50 = percentil(duracoes, 50)
+        referencia = referencia or p50
+        print(f"  {nome:<25} p50 {p50 * 1000:7.3f} ms   p95 {percentil(duracoes, 95) * 1000:7.3f} ms"
+              f"   ({referencia / p50:.0f}x)")
+    print(f"  contagem antiga: {linhas_origem} ocorrências; participantes distintos: {participantes}")
+
+    for divergencia in divergencias:
+        print(f"  DIVERGÊNCIA {divergencia}")
+    if divergencias:
+        raise SystemExit(1)
+
+
+# ==================================================
+# SNAPSHOT DE LEITURA
+# latência dos POSTs do questionário numa empresa enquanto
+# outra tem relatório, análise e exportação lidos sem parar:
+# do banco vivo x do snapshot (LEITURA_SNAPSHOT). Os leitores são
+# processos, como os do pool de relatórios. Roda uma vez com
+# journal DELETE e outra com WAL
+# ==================================================
+# ==================================================
+# SEGMENTOS: médias por setor/turno/cargo numa passada
+# pela matriz x uma consulta por segmento; confere
+# valores e supressão dos grupos pequenos
+# ==================================================
+def _segmento_aleatorio(rng, setores):
+    """Setores de tamanhos bem diferentes (os últimos abaixo do mínimo); turno e cargo às vezes vazios."""
+    return {
+        "setor": rng.choices(setores, weights=[0.75 ** i for i in range(len(setores))])[0],
+        "turno": rng.choice(app.TURNOS + (None,)),
+        "cargo": rng.choice(["analista", "operador", "supervisor", None]),
+    }
+
+def _medias_por_consulta(c, empresa_id, atributo, valor):
+    """Médias das dimensões de um segmento, uma consulta SQL (o caminho evitado)."""
+    individuais = pontuacao.SQL_MEDIAS_INDIVIDUAIS.format(
+        filtro=f"WHERE pa.empresa_id = ? AND pa.{atributo} IS ?"
+    )
+    c.execute(f"""
+        SELECT d.nome, AVG(m.media)
+        FROM ({individuais}) m
+        JOIN dimensao d ON m.dimensao_id = d.id
+        GROUP BY d.id
+    """, (empresa_id, valor))
+    return {nome: round(media, 2) for nome, media in c.fetchall()}
+
+def bench_segmentos(args):
+    rng = random.Random(42)
+    setores = [f"setor {i}" for i in range(args.setores)]
+    empresa_id = criar_empresa("bench segmentos")
+    conn = app.conectar_db()
+    for inicio in range(0, args.participantes, 1000):
+        with conn:
+            app.gravar_participantes(conn, empresa_id, [
+                (*app.validar_respostas(formulario_aleatorio(rng)), _segmento_aleatorio(rng, setores))
+                for _ in range(min(1000, args.participantes - inicio))
+            ])
+    c = conn.cursor()
+
+    # referência: uma consulta nas respostas em linhas para cada segmento
+    tempos = []
+    for _ in range(args.repeticoes):
+        inicio = time.perf_counter()
+        esperado = {}
+        for atributo in app.ATRIBUTOS_SEGMENTO:
+            c.execute(f"SELECT {atributo}, COUNT(*) FROM participante WHERE empresa_id = ? GROUP BY 1",
+                      (empresa_id,))
+            for valor, n in c.fetchall():
+                esperado[atributo, valor] = (n, _medias_por_consulta(c, empresa_id, atributo, valor))
+        tempos.append(time.perf_counter() - inicio)
+
+    print(f"segmentos: {args.participantes} participantes, {args.setores} setores, "
+          f"mínimo {app.SEGMENTO_MINIMO}")
+    print(f"  {'uma consulta por segmento':<36} p50 {percentil(tempos, 50) * 1000:8.1f} ms"
+          f"   ({len(esperado)} consultas)")
+
+    divergencias = []
+    for formato in ("linhas", "compacto"):
+        if formato == "compacto":
+            app.compactar_respostas(conn)
+        matriz = app.matriz_empresa(c, empresa_id)
+        dimensoes = app.dimensoes_matriz(c, matriz)
+        tempos = []
+        for _ in range(args.repeticoes):
+            inicio = time.perf_counter()
+            segmentos = analise.medias_por_segmento(
+                matriz, dimensoes, app.ATRIBUTOS_SEGMENTO, app.SEGMENTO_MINIMO
+            )
+            tempos.append(time.perf_counter() - inicio)
+        print(f"  {'uma passada (' + formato + ')':<36} p50 {percentil(tempos, 50) * 1000:8.1f} ms")
+
+        # analise_empresa é a mesma passada, com a faixa de risco de cada média
+        completo = app.analise_empresa(c, empresa_id)["segmentos"]
+        for dados in completo.values():
+            for segmento in dados["segmentos"]:
+                if segmento.pop("faixas") != {d: pontuacao.faixa_risco(m) for d, m in segmento["medias"].items()}:
+                    divergencias.append(f"{formato}: faixas de {segmento['segmento']}")
+        if completo != segmentos:
+            divergencias.append(f"{formato}: analise_empresa x medias_por_segmento")
+
+        for atributo, dados in segmentos.items():
+            exibidos = {s["segmento"] for s in dados["segmentos"]}
+            pequenos = {v for (a, v), (n, _) in esperado.items() if a == atributo and n < app.SEGMENTO_MINIMO}
+            if pequenos & exibidos:
+                divergencias.append(f"{formato} {atributo}: exibidos abaixo do mínimo {pequenos & exibidos}")
+            ocultos = args.participantes - sum(s["participantes"] for s in dados["segmentos"])
+            if dados["segmentos"] and 0 < ocultos < app.SEGMENTO_MINIMO:
+                divergencias.append(f"{formato} {atributo}: {ocultos} participantes dedutíveis do total")
+            for segmento in dados["segmentos"]:
+                n, medias = esperado[atributo, segmento["segmento"]]
+                # a passada soma em Python e o SQL em AVG: diferença só no arredondamento
+                diferentes = [
+                    dimensao for dimensao, media in medias.items()
+                    if abs(segmento["medias"].get(dimensao, -1) - media) > 0.011
+                ]
+                if n != segmento["participantes"] or diferentes:
+                    divergencias.append(f"{formato} {atributo}={segmento['segmento']}: {diferentes}")
+            if formato == "compacto":
+                print(f"  {atributo:<6} {len(dados['segmentos'])} segmentos exibidos, "
+                      f"{dados['suprimidos']} suprimidos ({len(pequenos)} abaixo do mínimo)")
+    conn.close()
+
+    # vários grupos pequenos que juntos não chegam ao mínimo: o total
+    # menos os visíveis não pode revelar a média deles
+    for tamanhos, exibidos in (((10, 10, 1, 1), 1), ((10, 10, 1), 1), ((10, 10, 3, 3), 2),
+                               ((4, 1), 0), ((10, 10), 2)):
+        linhas = [(f"g{i}",) for i, n in enumerate(tamanhos) for _ in range(n)]
+        matriz = analise.Matriz([1], bytes([3]) * len(linhas), linhas)
+        dados = analise.medias_por_segmento(matriz, [("D", [0])], ("setor",), 5)["setor"]
+        if len(dados["segmentos"]) != exibidos:
+            divergencias.append(f"supressão {tamanhos}: {len(dados['segmentos'])} exibidos, "
+                                f"esperado {exibidos}")
+
+    for form, valido in (({"turno": "madrugada"}, False), ({"setor": "x" * 61}, False),
+                         ({"setor": "produção <b>"}, False), ({"cargo": "p&d"}, False),
+                         ({"setor": "  Produção   Leve "}, True)):
+        try:
+            segmento = app.validar_segmento(form)
+        except ValueError:
+            segmento = None
+        if (segmento is not None) != valido or (valido and segmento["setor"] != "produção leve"):
+            divergencias.append(f"validar_segmento({form})")
+
+    # segmentos gravados antes da validação de <>& ainda geram o PDF
+    segmentos = [{"segmento": "produção <b>", "participantes": 5, "medias": {"D": 3.0}},
+                 {"segmento": "p&d </para>", "participantes": 5, "medias": {"D": 2.0}}]
+    try:
+        relatorio_pdf.salvar(os.path.join(_tmp, "segmentos.pdf"),
+                             relatorio_pdf.tabelas_segmentos(segmentos, relatorio_pdf.getSampleStyleSheet()))
+    except ValueError as e:
+        divergencias.append(f"PDF com markup no nome do segmento: {e}")
+
+    for divergencia in divergencias:
+        print(f"  DIVERGÊNCIA {divergencia}")
+    if divergencias:
+        raise SystemExit(1)
+
+
+def _leitura_pesada(empresa_id):
+    """O que um relatório grande lê: dados do PDF, análise e a exportação inteira."""
+    conn = app.conectar_leitura(empresa_id)
+    try:
+        app.dados_relatorio(conn.cursor(), empresa_id)
+        app.analise_empresa(conn.cursor(), empresa_id)
+    finally:
+        conn.close()
+    for _ in app.linhas_csv(empresa_id):
+        pass
+
+def _ler_sem_parar(empresa_id, fim, leituras, erros):
+    # prioridade baixa: com poucos núcleos, separa a disputa por locks
+    # (o que o snapshot resolve) da disputa por CPU
+    os.nice(19)
+    while not fim.is_set():
+        try:
+            _leitura_pesada(empresa_id)
+        except sqlite3.OperationalError:
+            with erros.get_lock():
+                erros.value += 1
+            continue
+        with leituras.get_lock():
+            leituras.value += 1
+
+def bench_snapshot(args):
+    if not args.interno:
+        for modo in ("DELETE", "WAL"):
+            pasta = tempfile.mkdtemp(prefix="bench_snapshot_")
+            env = dict(
+                os.environ,
+                SQLITE_JOURNAL_MODE=modo,
+                AVALIACOES_DB=os.path.join(pasta, "avaliacoes.db"),
+                SNAPSHOT_ARQUIVO=os.path.join(pasta, "avaliacoes_leitura.db"),
+            )
+            subprocess.run(
+                [sys.executable, __file__, "snapshot", "--interno",
+                 "--base", str(args.base), "--n", str(args.n),
+                 "--threads", str(args.threads), "--leitores", str(args.leitores)],
+                env=env, check=True
+            )
+        return
+
+    # os envios que falham por lock entram na tabela; o traceback de cada um não
+    app.app.logger.setLevel(logging.CRITICAL)
+    rng = random.Random(42)
+    grande = criar_empresa("bench snapshot relatório")
+    popular(grande, args.base, rng)
+    alvo = criar_empresa("bench snapshot envios")
+
+    inicio = time.perf_counter()
+    app.atualizar_snapshot()
+    copia = time.perf_counter() - inicio
+
+    print(f"journal_mode={app.SQLITE_JOURNAL_MODE}  {args.n} envios, {args.threads} clientes, "
+          f"{args.leitores} leitores de um relatório de {args.base} participantes "
+          f"(cópia do snapshot: {copia * 1000:.0f} ms, "
+          f"{os.path.getsize(app.ARQUIVO_SNAPSHOT) / 1024 / 1024:.1f} MiB)")
+    print(f"  {'cenário':<22} {'envios/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'máx ms':>8}"
+          f" {'falhas':>7} {'leituras':>9} {'locked':>7}")
+    divergencias = []
+    for nome, leitores, snapshot in (
+        ("sem leituras", 0, False),
+        ("leituras no banco", args.leitores, False),
+        ("leituras no snapshot", args.leitores, True),
+    ):
+        app.LEITURA_SNAPSHOT = snapshot
+        formularios = [formulario_aleatorio(rng) for _ in range(args.n)]
+        fim = multiprocessing.Event()
+        leituras = multiprocessing.Value("i", 0)
+        erros = multiprocessing.Value("i", 0)
+        processos = [
+            multiprocessing.Process(target=_ler_sem_parar, args=(grande, fim, leituras, erros))
+            for _ in range(leitores)
+        ]
+        for processo in processos:
+            processo.start()
+        latencias, duracao, falhas = _rajada(alvo, formularios, args.threads)
+        fim.set()
+        for processo in processos:
+            processo.join()
+        # leituras no banco com journal DELETE travam envios: é o que se quer mostrar
+        if falhas and snapshot:
+            divergencias.append(f"{nome}: {falhas} envios sem redirecionamento")
+        print(f"  {nome:<22} {len(latencias) / duracao:9.1f} {percentil(latencias, 50) * 1000:8.1f} "
+              f"{percentil(latencias, 95) * 1000:8.1f} {percentil(latencias, 99) * 1000:8.1f} "
+              f"{max(latencias) * 1000:8.1f} {falhas:7d} {leituras.value:9d} {erros.value:7d}")
+
+    # o snapshot responde igual ao banco para a empresa que não mudou
+    app.LEITURA_SNAPSHOT = True
+    conn = app.conectar_leitura(grande)
+    do_snapshot = app.analise_empresa(conn.cursor(), grande)
+    conn.close()
+    conn = app.conectar_db()
+    do_banco = app.analise_empresa(conn.cursor(), grande)
+    conn.close()
+    if do_snapshot != do_banco:
+        divergencias.append("análise do snapshot x do banco")
+
+    # a empresa que recebeu envios depois da cópia é lida do banco
+    conn = app.conectar_leitura(alvo)
+    if not isinstance(conn, app.ConexaoReutilizavel):
+        divergencias.append("empresa com envios novos lida do snapshot")
+    conn.close()
+
+    cliente = app.app.test_client()
+    r = cliente.get(f"/empresa/{grande}/analise")
+    defasagem = cliente.get("/estatisticas/db").get_json()["leitura"]["defasagem_s"]
+    if "X-Dados-De" not in r.headers:
+        divergencias.append("resposta do snapshot sem X-Dados-De")
+    if "snapshot_defasagem_segundos " not in cliente.get("/metrics").get_data(as_text=True):
+        divergencias.append("/metrics sem snapshot_defasagem_segundos")
+    print(f"  defasagem do snapshot ao fim: {defasagem:.1f}s (X-Dados-De: {r.headers.get('X-Dados-De')})")
+
+    for divergencia in divergencias:
+        print(f"  DIVERGÊNCIA {divergencia}")
+    if divergencias:
+        raise SystemExit(1)
+
+
+# ==================================================
+# INICIALIZAÇÃO
+# processos novos medindo `import app` e a primeira requisição,
+# com um banco novo (cria e migra tudo) e com um banco em dia
+# (uma consulta em controle); -X importtime mostra quem pesa
+# na importação. `import app` não pode carregar o ReportLab.
+# ==================================================
+_SCRIPT_INICIO = """
+import json, sys, time
+inicio = time.perf_counter()
+import app
+importado = time.perf_counter()
+status = app.app.test_client().get("/").status_code
+print(json.dumps({
+    "import_ms": (importado - inicio) * 1000,
+    "primeira_requisicao_ms": (time.perf_counter() - importado) * 1000,
+    "status": status,
+    "reportlab": any(nome.startswith("reportlab") for nome in sys.modules),
+}))
+"""
+
+def _processo_app(banco, *opcoes):
+    ambiente = dict(os.environ, AVALIACOES_DB=banco)
+    return subprocess.run(
+        [sys.executable, *opcoes, "-c", _SCRIPT_INICIO],
+        cwd=os.path.dirname(os.path.abspath(app.__file__)),
+        env=ambiente, capture_output=True, text=True, check=True,
+    )
+
+def _tempos_importacao(stderr):
+    """Saída de -X importtime → {módulo: (próprio_ms, acumulado_ms)}."""
+    tempos = {}
+    for linha in stderr.splitlines():
+        if not linha.startswith("import time:") or "self [us]" in linha:
+            continue
+        proprio, acumulado, nome = linha[len("import time:"):].split("|")
+        tempos[nome.strip()] = (int(proprio) / 1000, int(acumulado) / 1000)
+    return tempos
+
+def bench_inicio(args):
+    pasta = tempfile.mkdtemp(prefix="bench_inicio_", dir=_tmp)
+    em_dia = os.path.join(pasta, "em_dia.db")
+    _processo_app(em_dia)  # cria e migra uma vez; aquece o cache de bytecode
+
+    casos = {"banco novo": [], "banco em dia": []}
+    for i in range(args.repeticoes):
+        casos["banco novo"].append(json.loads(_processo_app(os.path.join(pasta, f"novo_{i}.db")).stdout))
+        casos["banco em dia"].append(json.loads(_processo_app(em_dia).stdout))
+    tempos = _tempos_importacao(_processo_app(em_dia, "-X", "importtime").stderr)
+
+    resultado = {
+        "parametros": {"repeticoes": args.repeticoes},
+        "casos": {
+            caso: {
+                "import_ms": round(percentil([m["import_ms"] for m in medidas], 50), 1),
+                "primeira_requisicao_ms": round(
+                    percentil([m["primeira_requisicao_ms"] for m in medidas], 50), 1
+                ),
+            }
+            for caso, medidas in casos.items()
+        },
+        "reportlab_importado": any(m["reportlab"] for medidas in casos.values() for m in medidas),
+    }
+
+    print(f"inicialização: mediana de {args.repeticoes} processos")
+    print(f"  {'':<14}{'import app ms':>15}{'1ª requisição ms':>19}")
+    for caso, r in resultado["casos"].items():
+        print(f"  {caso:<14}{r['import_ms']:>15}{r['primeira_requisicao_ms']:>19}")
+    print(f"  -X importtime: app {tempos['app'][1]:.0f} ms acumulado, {tempos['app'][0]:.0f} ms próprio; "
+          f"mais pesados:")
+    for nome, (proprio, _) in sorted(tempos.items(), key=lambda t: -t[1][0])[:5]:
+        print(f"    {nome:<40}{proprio:>8.1f} ms")
+    print(f"  ReportLab carregado por import app: {'sim' if resultado['reportlab_importado'] else 'não'}")
+    status = {m["status"] for medidas in casos.values() for m in medidas}
+
+    if args.salvar:
+        with open(args.salvar, "w", encoding="utf-8") as arquivo:
+            json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+        print(f"  linha de base salva em {args.salvar}")
+
+    regressoes = []
+    if resultado["reportlab_importado"]:
+        regressoes.append("import app carregou o ReportLab")
+    if status != {200}:
+        regressoes.append(f"primeira requisição respondeu {sorted(status)}")
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as arquivo:
+            base = json.load(arquivo)
+        for caso, r in resultado["casos"].items():
+            anterior = base["casos"].get(caso, {})
+            for medida, valor in r.items():
+                if medida not in anterior:
+                    continue
+                limite = max(anterior[medida] * (1 + args.tolerancia), anterior[medida] + args.folga_ms)
+                if valor > limite:
+                    regressoes.append(f"{caso}, {medida}: {anterior[medida]} → {valor} ms")
+    for regressao in regressoes:
+        print(f"  REGRESSÃO {regressao}")
+    if regressoes:
+        raise SystemExit(1)
+    if args.comparar:
+        print(f"  sem regressões em relação a {args.comparar} (tolerância {args.tolerancia:.0%})")
+
+
+# ==================================================
+# FLUXO COMPLETO
+# N participantes simultâneos: questionário (GET/POST) →
+# continuar; cada empresa é aberta em / e fechada em
+# /finalizar. Latência p50/p95/p99, falhas e erros de lock
+# por rota, e vazão; a linha de base em JSON pega regressões.
+# ==================================================
+class ClienteTeste:
+    """Flask test client (sem rede)."""
+    def __init__(self):
+        self.cliente = app.app.test_client()
+
+    def get(self, caminho):
+        r = self.cliente.get(caminho)
+        return r.status_code, r.location
+
+    def post(self, caminho, form):
+        r = self.cliente.post(caminho, data=form)
+        return r.status_code, r.location
+
+class ClienteHttp:
+    """HTTP de verdade contra o servidor WSGI em segundo plano."""
+    def __init__(self, porta):
+        self.conexao = http.client.HTTPConnection("127.0.0.1", porta, timeout=60)
+
+    def _pedir(self, metodo, caminho, corpo=None, cabecalhos=None):
+        self.conexao.request(metodo, caminho, body=corpo, headers=cabecalhos or {})
+        r = self.conexao.getresponse()
+        r.read()
+        local = r.getheader("Location")
+        return r.status, urlsplit(local).path if local else None
+
+    def get(self, caminho):
+        return self._pedir("GET", caminho)
+
+    def post(self, caminho, form):
+        corpo = urlencode(list(form.items(multi=True)))
+        return self._pedir("POST", caminho, corpo,
+                           {"Content-Type": "application/x-www-form-urlencoded"})
+
+def _rota_atual():
+    """Nome da requisição em andamento como em medir(): "POST /questionario"."""
+    regra = request.url_rule.rule if request.url_rule else request.path
+    return f"{request.method} /{regra.rsplit('/', 1)[-1]}"
+
+def bench_fluxo(args):
+    rng = random.Random(42)
+    latencias = {}
+    falhas = {}
+    erros_lock = {}
+    lock = threading.Lock()
+
+    def contar_excecao(_remetente, exception, **_):
+        if app.banco_ocupado(exception):
+            rota = _rota_atual()
+            with lock:
+                erros_lock[rota] = erros_lock.get(rota, 0) + 1
+    got_request_exception.connect(contar_excecao, app.app)
+
+    def medir(rota, funcao, *params):
+        inicio = time.perf_counter()
+        status, local = funcao(*params)
+        duracao = time.perf_counter() - inicio
+        with lock:
+            latencias.setdefault(rota, []).append(duracao)
+            if status >= 400:
+                falhas[rota] = falhas.get(rota, 0) + 1
+        return local
+
+    servidor = None
+    if args.servidor:
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        servidor = make_server("127.0.0.1", 0, app.app, threaded=True)
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+        novo_cliente = lambda: ClienteHttp(servidor.server_port)  # noqa: E731
+    else:
+        novo_cliente = ClienteTeste
+
+    # empresas abertas por /, já com `base` participantes sintéticos
+    cliente = novo_cliente()
+    empresas = []
+    for i in range(args.empresas):
+        local = medir("POST /", cliente.post, "/", MultiDict({"empresa": f"bench fluxo {i}"}))
+        empresa_id = int(local.strip("/").split("/")[1])
+        popular(empresa_id, args.base, rng)
+        empresas.append(empresa_id)
+
+    formularios = [(rng.choice(empresas), formulario_aleatorio(rng)) for _ in range(args.participantes)]
+    locais = threading.local()
+
+    def participante(tarefa):
+        empresa_id, form = tarefa
+        if not hasattr(locais, "cliente"):
+            locais.cliente = novo_cliente()
+        c = locais.cliente
+        url = f"/empresa/{empresa_id}/questionario"
+        medir("GET /questionario", c.get, url)
+        local = medir("POST /questionario", c.post, url, form)
+        medir("GET /continuar", c.get, local or f"/empresa/{empresa_id}/continuar")
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concorrencia) as pool:
+        list(pool.map(participante, formularios))
+    duracao = time.perf_counter() - inicio
+
+    for empresa_id in empresas:
+        medir("GET /finalizar", cliente.get, f"/empresa/{empresa_id}/finalizar")
+
+    # o PDF sai da requisição (fila); mede gerar_pdf diretamente
+    conn = app.conectar_db()
+    for empresa_id in empresas:
+        dados = app.dados_relatorio(conn.cursor(), empresa_id)
+        medir("gerar_pdf()", lambda: (200, app.gerar_pdf(*dados)))
+    conn.close()
+
+    if servidor is not None:
+        servidor.shutdown()
+
+    resultado = {
+        "parametros": {
+            "participantes": args.participantes, "concorrencia": args.concorrencia,
+            "empresas": args.empresas, "base": args.base,
+            "servidor": bool(args.servidor),
+        },
+        "vazao_participantes_s": round(args.participantes / duracao, 1),
+        "rotas": {
+            rota: {
+                "n": len(valores),
+                "falhas": falhas.get(rota, 0),
+                "erros_lock": erros_lock.get(rota, 0),
+                "p50_ms": round(percentil(valores, 50) * 1000, 2),
+                "p95_ms": round(percentil(valores, 95) * 1000, 2),
+                "p99_ms": round(percentil(valores, 99) * 1000, 2),
+            }
+            for rota, valores in latencias.items()
+        },
+    }
+
+    modo = "servidor WSGI" if args.servidor else "test client"
+    print(f"fluxo ({modo}): {args.participantes} participantes, {args.concorrencia} simultâneos, "
+          f"{args.empresas} empresas x {args.base} participantes de base")
+    print(f"  vazão: {resultado['vazao_participantes_s']} participantes/s")
+    print(f"  {'rota':<22}{'n':>6}{'falhas':>8}{'lock':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for rota, r in resultado["rotas"].items():
+        print(f"  {rota:<22}{r['n']:>6}{r['falhas']:>8}{r['erros_lock']:>6}"
+              f"{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}")
+
+    if args.salvar:
+        with open(args.salvar, "w", encoding="utf-8") as arquivo:
+            json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+        print(f"  linha de base salva em {args.salvar}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as arquivo:
+            base = json.load(arquivo)
+        if base.get("parametros") != resultado["parametros"]:
+            print(f"  aviso: parâmetros diferentes da linha de base {base.get('parametros')}")
+        regressoes = []
+        for rota, r in resultado["rotas"].items():
+            anterior = base["rotas"].get(rota)
+            limite = max(anterior["p95_ms"] * (1 + args.tolerancia),
+                         anterior["p95_ms"] + args.folga_ms) if anterior else None
+            if anterior and r["p95_ms"] > limite:
+                regressoes.append(f"{rota}: p95 {anterior['p95_ms']} → {r['p95_ms']} ms")
+            locks_antes = (anterior or {}).get("erros_lock", 0)
+            if r["erros_lock"] > locks_antes:
+                regressoes.append(f"{rota}: erros de lock {locks_antes} → {r['erros_lock']}")
+        for regressao in regressoes:
+            print(f"  REGRESSÃO {regressao}")
+        if regressoes:
+            raise SystemExit(1)
+        print(f"  sem regressões em relação a {args.comparar} (tolerância {args.tolerancia:.0%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="cenario", required=True)
+
+    p = sub.add_parser("submissao", help="POST /questionario: por campo x em lote")
+    p.add_argument("--n", type=int, default=500)
+    p.add_argument("--threads", type=int, default=1)
+    p.set_defaults(funcao=bench_submissao)
+
+    p = sub.add_parser("empresas", help="várias empresas em paralelo, sem mistura de respostas")
+    p.add_argument("--empresas", type=int, default=8)
+    p.add_argument("--n", type=int, default=50)
+    p.add_argument("--threads", type=int, default=16)
+    p.set_defaults(funcao=bench_empresas)
+
+    p = sub.add_parser("carga", help="submissões e leituras concorrentes, DELETE x WAL")
+    p.add_argument("--n", type=int, default=400)
+    p.add_argument("--escritores", type=int, default=8)
+    p.add_argument("--leitores", type=int, default=4)
+    p.add_argument("--base", type=int, default=2000, help="participantes pré-carregados")
+    p.add_argument("--interno", action="store_true", help=argparse.SUPPRESS)
+    p.set_defaults(funcao=bench_carga)
+
+    p = sub.add_parser("pontuacao", help="equivalência e tempo: Python x SQL x agregados")
+    p.add_argument("--empresas", type=int, default=5)
+    p.add_argument("--participantes", type=int, default=5000)
+    p.set_defaults(funcao=bench_pontuacao)
+
+    p = sub.add_parser("questionario", help="GET do questionário: sem cache x cache x 304")
+    p.add_argument("--n", type=int, default=2000)
+    p.set_defaults(funcao=bench_questionario)
+
+    p = sub.add_parser("pdf", help="gerar_pdf: só texto x com gráficos")
+    p.add_argument("--empresas", type=int, default=6)
+    p.add_argument("--participantes", type=int, default=300)
+    p.add_argument("--repeticoes", type=int, default=5)
+    p.set_defaults(funcao=bench_pdf)
+
+    p = sub.add_parser("compacto", help="respostas em linhas x BLOB compacto")
+    p.add_argument("--empresas", type=int, default=4)
+    p.add_argument("--participantes", type=int, default=5000)
+    p.add_argument("--repeticoes", type=int, default=20)
+    p.set_defaults(funcao=bench_compacto)
+
+    p = sub.add_parser("analise", help="matriz participantes x perguntas e estatísticas")
+    p.add_argument("--participantes", type=int, default=100000)
+    p.set_defaults(funcao=bench_analise)
+
+    p = sub.add_parser("token", help="mesmo token de envio disparado por várias threads")
+    p.add_argument("--threads", type=int, default=32)
+    p.add_argument("--rodadas", type=int, default=20)
+    p.set_defaults(funcao=bench_token)
+
+    p = sub.add_parser("fila", help="rajada de envios: gravação direta x fila com diário")
+    p.add_argument("--n", type=int, default=2000)
+    p.add_argument("--threads", type=int, default=32)
+    p.set_defaults(funcao=bench_fila)
+
+    p = sub.add_parser("painel", help="tendências e ranking: agregados por período x respostas")
+    p.add_argument("--empresas", type=int, default=200)
+    p.add_argument("--participantes", type=int, default=100, help="por empresa e período")
+    p.add_argument("--periodos", type=int, default=3)
+    p.add_argument("--repeticoes", type=int, default=50)
+    p.set_defaults(funcao=bench_painel)
+
+    p = sub.add_parser("arquivo", help="retenção, zips por mês e download de relatórios")
+    p.add_argument("--empresas", type=int, default=4)
+    p.add_argument("--relatorios", type=int, default=6)
+    p.add_argument("--manter", type=int, default=2)
+    p.set_defaults(funcao=bench_arquivo)
+
+    p = sub.add_parser("eventos", help="eventos críticos: junção em evento_origem x agregado_evento")
+    p.add_argument("--empresas", type=int, default=20)
+    p.add_argument("--participantes", type=int, default=2000)
+    p.add_argument("--repeticoes", type=int, default=5)
+    p.set_defaults(funcao=bench_eventos)
+
+    p = sub.add_parser("snapshot", help="envios durante leituras pesadas: banco x snapshot, DELETE x WAL")
+    p.add_argument("--base", type=int, default=20000)
+    p.add_argument("--n", type=int, default=400)
+    p.add_argument("--threads", type=int, default=8)
+    p.add_argument("--leitores", type=int, default=2)
+    p.add_argument("--interno", action="store_true", help=argparse.SUPPRESS)
+    p.set_defaults(funcao=bench_snapshot)
+
+    p = sub.add_parser("segmentos", help="médias por setor/turno/cargo: uma passada x consulta por segmento")
+    p.add_argument("--participantes", type=int, default=20000)
+    p.add_argument("--setores", type=int, default=30)
+    p.add_argument("--repeticoes", type=int, default=5)
+    p.set_defaults(funcao=bench_segmentos)
+
+    p = sub.add_parser("inicio", help="import app e primeira requisição em processos novos")
+    p.add_argument("--repeticoes", type=int, default=10)
+    p.add_argument("--salvar", metavar="JSON")
+    p.add_argument("--comparar", metavar="JSON")
+    p.add_argument("--tolerancia", type=float, default=0.5, help="aumento aceito (0.5 = 50%%)")
+    p.add_argument("--folga-ms", type=float, default=20.0,
+                   help="aumento absoluto sempre aceito (ruído de máquina)")
+    p.set_defaults(funcao=bench_inicio)
+
+    p = sub.add_parser("fluxo", help="fluxo completo com participantes simultâneos")
+    p.add_argument("--participantes", type=int, default=200)
+    p.add_argument("--concorrencia", type=int, default=16)
+    p.add_argument("--empresas", type=int, default=4)
+    p.add_argument("--base", type=int, default=1000,
+                   help="participantes sintéticos por empresa (10 a 100000)")
+    p.add_argument("--servidor", action="store_true", help="usa um servidor WSGI real")
+    p.add_argument("--salvar", metavar="JSON")
+    p.add_argument("--comparar", metavar="JSON")
+    p.add_argument("--tolerancia", type=float, default=0.5, help="aumento aceito no p95 (0.5 = 50%%)")
+    p.add_argument("--folga-ms", type=float, default=5.0,
+                   help="aumento absoluto sempre aceito no p95 (ruído de rotas de ~1 ms)")
+    p.set_defaults(funcao=bench_fluxo)
+
+    args = parser.parse_args()
+    args.funcao(args)
+
+
+if __name__ == "__main__":
+    main()
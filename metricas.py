@@ -0,0 +1,127 @@
+"""
+Métricas no formato texto do Prometheus, sem dependências externas.
+
+Cada métrica é criada uma vez no carregamento do módulo que a usa e se
+registra em REGISTRO; exportar() gera o corpo de /metrics. Os valores
+ficam na memória do processo.
+"""
+import threading
+
+BALDES_PADRAO = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REGISTRO = []
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _rotulos(nomes, valores, extra=""):
+    pares = [f'{nome}="{_escapar(valor)}"' for nome, valor in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+def _numero(valor):
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class _Metrica:
+    tipo = ""
+
+    def __init__(self, nome, ajuda, rotulos=()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self._lock = threading.Lock()
+        REGISTRO.append(self)
+
+    def _chave(self, rotulos):
+        return tuple(rotulos.get(nome, "") for nome in self.rotulos)
+
+    def _cabecalho(self):
+        return [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} {self.tipo}"]
+
+
+class Contador(_Metrica):
+    tipo = "counter"
+
+    def __init__(self, nome, ajuda, rotulos=()):
+        super().__init__(nome, ajuda, rotulos)
+        self._valores = {}
+
+    def inc(self, valor=1, **rotulos):
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+    def exportar(self):
+        with self._lock:
+            valores = sorted(self._valores.items())
+        return self._cabecalho() + [
+            f"{self.nome}{_rotulos(self.rotulos, chave)} {_numero(valor)}"
+            for chave, valor in valores
+        ]
+
+
+class Histograma(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nome, ajuda, rotulos=(), baldes=BALDES_PADRAO):
+        super().__init__(nome, ajuda, rotulos)
+        self.baldes = tuple(baldes) + (float("inf"),)
+        self._series = {}
+
+    def observar(self, valor, **rotulos):
+        chave = self._chave(rotulos)
+        with self._lock:
+            serie = self._series.get(chave)
+            if serie is None:
+                serie = self._series[chave] = [[0] * len(self.baldes), 0.0, 0]
+            for i, limite in enumerate(self.baldes):
+                if valor <= limite:
+                    serie[0][i] += 1
+                    break
+            serie[1] += valor
+            serie[2] += 1
+
+    def exportar(self):
+        with self._lock:
+            series = sorted((chave, [list(s[0]), s[1], s[2]]) for chave, s in self._series.items())
+        linhas = self._cabecalho()
+        for chave, (contagens, soma, total) in series:
+            acumulado = 0
+            for limite, contagem in zip(self.baldes, contagens):
+                acumulado += contagem
+                le = 'le="' + _numero(limite) + '"'
+                linhas.append(f"{self.nome}_bucket{_rotulos(self.rotulos, chave, le)} {acumulado}")
+            linhas.append(f"{self.nome}_sum{_rotulos(self.rotulos, chave)} {_numero(soma)}")
+            linhas.append(f"{self.nome}_count{_rotulos(self.rotulos, chave)} {total}")
+        return linhas
+
+
+class Medidor(_Metrica):
+    """
+    Valor lido na hora da exportação: funcao() → número ou {(rótulos,): número}.
+    Use tipo="counter" quando funcao devolve um total que só cresce.
+    """
+    def __init__(self, nome, ajuda, funcao, rotulos=(), tipo="gauge"):
+        super().__init__(nome, ajuda, rotulos)
+        self.funcao = funcao
+        self.tipo = tipo
+
+    def exportar(self):
+        valor = self.funcao()
+        valores = valor.items() if isinstance(valor, dict) else [((), valor)]
+        return self._cabecalho() + [
+            f"{self.nome}{_rotulos(self.rotulos, chave)} {_numero(v)}"
+            for chave, v in sorted(valores)
+        ]
+
+
+def exportar():
+    linhas = []
+    for metrica in REGISTRO:
+        linhas.extend(metrica.exportar())
+    return "\n".join(linhas) + "\n"
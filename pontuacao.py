@@ -0,0 +1,169 @@
+"""
+Motor de pontuação COPSOQ.
+
+A média de uma dimensão é calculada em dois níveis, dentro do SQLite:
+1. média de cada participante nas perguntas da dimensão;
+2. média dessas médias individuais na empresa.
+
+Perguntas de evento crítico não entram no cálculo (não são gravadas em
+resposta). As funções recebem a conexão; quem chama controla a transação.
+"""
+
+# Limites da classificação de risco (média de 1 a 5)
+LIMITE_BAIXO_RISCO = 2.33
+LIMITE_RISCO_INTERMEDIARIO = 3.66
+
+# Uma linha por (empresa, dimensão, participante)
+SQL_MEDIAS_INDIVIDUAIS = """
+    SELECT
+        pa.empresa_id,
+        p.dimensao_id,
+        pa.id AS participante_id,
+        SUM(r.valor) AS soma,
+        COUNT(*) AS n,
+        AVG(r.valor) AS media
+    FROM resposta r
+    JOIN pergunta p ON r.pergunta_id = p.id
+    JOIN participante pa ON r.participante_id = pa.id
+    {filtro}
+    GROUP BY pa.empresa_id, p.dimensao_id, pa.id
+"""
+
+# Uma linha por (empresa, dimensão), nos moldes de agregado_dimensao
+SQL_MEDIAS_DIMENSAO = """
+    SELECT
+        empresa_id,
+        dimensao_id,
+        COUNT(*) AS participantes,
+        SUM(media) AS soma_medias,
+        SUM(soma) AS soma_valores,
+        SUM(n) AS respostas,
+        AVG(media) AS media
+    FROM ({individuais})
+    GROUP BY empresa_id, dimensao_id
+"""
+
+
+# Uma linha por (empresa, dimensão, valor): histograma das respostas
+SQL_DISTRIBUICAO = """
+    SELECT
+        pa.empresa_id,
+        p.dimensao_id,
+        r.valor,
+        COUNT(*) AS respostas
+    FROM resposta r
+    JOIN pergunta p ON r.pergunta_id = p.id
+    JOIN participante pa ON r.participante_id = pa.id
+    {filtro}
+    GROUP BY pa.empresa_id, p.dimensao_id, r.valor
+"""
+
+# Período de avaliação (rodada anual): o ano da data do participante
+SQL_PERIODO = "COALESCE(substr(pa.data, 1, 4), '')"
+
+# Uma linha por (empresa, período, dimensão), nos moldes de agregado_periodo
+SQL_MEDIAS_PERIODO = """
+    SELECT
+        empresa_id,
+        periodo,
+        dimensao_id,
+        COUNT(*) AS participantes,
+        SUM(media) AS soma_medias,
+        SUM(soma) AS soma_valores,
+        SUM(n) AS respostas
+    FROM (
+        SELECT
+            pa.empresa_id,
+            {periodo} AS periodo,
+            p.dimensao_id,
+            SUM(r.valor) AS soma,
+            COUNT(*) AS n,
+            AVG(r.valor) AS media
+        FROM resposta r
+        JOIN pergunta p ON r.pergunta_id = p.id
+        JOIN participante pa ON r.participante_id = pa.id
+        {filtro}
+        GROUP BY pa.empresa_id, p.dimensao_id, pa.id
+    )
+    GROUP BY empresa_id, periodo, dimensao_id
+"""
+
+
+def periodo_de(data):
+    """Período de um participante a partir de participante.data (igual a SQL_PERIODO)."""
+    return (data or "")[:4]
+
+def _filtro_empresa(empresa_id):
+    if empresa_id is None:
+        return "", ()
+    return "WHERE pa.empresa_id = ?", (empresa_id,)
+
+def sql_medias_dimensao(empresa_id=None):
+    """(sql, params) das médias por dimensão; todas as empresas se empresa_id é None."""
+    filtro, params = _filtro_empresa(empresa_id)
+    individuais = SQL_MEDIAS_INDIVIDUAIS.format(filtro=filtro)
+    return SQL_MEDIAS_DIMENSAO.format(individuais=individuais), params
+
+def sql_distribuicao(empresa_id=None):
+    """(sql, params) das contagens por valor de resposta em cada dimensão."""
+    filtro, params = _filtro_empresa(empresa_id)
+    return SQL_DISTRIBUICAO.format(filtro=filtro), params
+
+def sql_medias_periodo(empresa_id=None):
+    """(sql, params) das médias por período e dimensão."""
+    filtro, params = _filtro_empresa(empresa_id)
+    return SQL_MEDIAS_PERIODO.format(periodo=SQL_PERIODO, filtro=filtro), params
+
+def medias_individuais(conn, empresa_id=None):
+    """Itera (empresa_id, dimensao_id, participante_id, media)."""
+    filtro, params = _filtro_empresa(empresa_id)
+    c = conn.cursor()
+    c.execute(SQL_MEDIAS_INDIVIDUAIS.format(filtro=filtro), params)
+    for empresa, dimensao_id, participante_id, _, _, media in c:
+        yield empresa, dimensao_id, participante_id, media
+
+def medias_por_empresa(conn, empresa_id=None):
+    """
+    {empresa_id: {nome_dimensao: média}} numa única consulta agrupada,
+    dimensões na ordem de dimensao.id.
+    """
+    sql, params = sql_medias_dimensao(empresa_id)
+    c = conn.cursor()
+    c.execute(f"""
+        SELECT m.empresa_id, d.nome, m.media
+        FROM ({sql}) m
+        JOIN dimensao d ON m.dimensao_id = d.id
+        ORDER BY m.empresa_id, d.id
+    """, params)
+
+    resultado = {}
+    for empresa, dimensao, media in c:
+        resultado.setdefault(empresa, {})[dimensao] = round(media, 2)
+    return resultado
+
+def medias_dimensao(conn, empresa_id):
+    """{nome_dimensao: média} de uma empresa, a partir das respostas brutas."""
+    return medias_por_empresa(conn, empresa_id).get(empresa_id, {})
+
+def classificar_risco(media):
+    if media <= LIMITE_BAIXO_RISCO:
+        return "🟢 Situação Favorável - Baixo/Nenhum risco - Condição psicossocial boa. Manter boas práticas."
+    elif media <= LIMITE_RISCO_INTERMEDIARIO:
+        return "🟡 Risco Intermediário - Médio Risco - Moderado(pode indicar início de problemas. Monitorar, promover ações de suporte)."
+    else:
+        return "🔴 Risco para a Saúde - Alto risco - Intervenção imediata, revisão organizacional. Alto risco psicossocial."
+
+def faixa_risco(media):
+    """"baixo", "intermediario" ou "alto", nos mesmos limites de classificar_risco."""
+    if media <= LIMITE_BAIXO_RISCO:
+        return "baixo"
+    elif media <= LIMITE_RISCO_INTERMEDIARIO:
+        return "intermediario"
+    return "alto"
+
+def classificar(medias):
+    """{dimensao: média} → [{dimensao, media, classificacao}] na mesma ordem."""
+    return [
+        {"dimensao": dimensao, "media": media, "classificacao": classificar_risco(media)}
+        for dimensao, media in medias.items()
+    ]
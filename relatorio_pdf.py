@@ -0,0 +1,312 @@
+"""
+Montagem do PDF do relatório com ReportLab.
+
+Só é importado por quem gera PDFs (app.gerar_pdf e os processos do pool
+de relatórios, que o carregam ao iniciar): o ReportLab é a maior parte do
+tempo de importação do app e as requisições comuns não precisam dele.
+"""
+from functools import lru_cache
+from xml.sax.saxutils import escape
+
+from reportlab.graphics.shapes import Drawing, Group, Line, Polygon, Rect, String
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+
+import analise
+import pontuacao
+from pontuacao import classificar_risco
+
+
+# =========================
+# GRÁFICOS
+# as formas de cada gráfico são montadas uma vez por entrada
+# e reaproveitadas entre relatórios do mesmo processo do pool;
+# cada relatório recebe um Drawing novo (o platypus guarda
+# estado de paginação no flowable)
+# =========================
+CORES_RISCO = (colors.HexColor("#2e9d4f"), colors.HexColor("#f2c12e"), colors.HexColor("#d64541"))
+
+def cor_risco(valor):
+    if valor <= pontuacao.LIMITE_BAIXO_RISCO:
+        return CORES_RISCO[0]
+    elif valor <= pontuacao.LIMITE_RISCO_INTERMEDIARIO:
+        return CORES_RISCO[1]
+    return CORES_RISCO[2]
+
+@lru_cache(maxsize=512)
+def _formas_semaforo(media, largura, altura):
+    formas = Group()
+    x0, x1, y, h = 10, largura - 10, 16, 14
+    escala = (x1 - x0) / 4
+
+    def x(valor):
+        return x0 + (valor - 1) * escala
+
+    faixas = (1, pontuacao.LIMITE_BAIXO_RISCO, pontuacao.LIMITE_RISCO_INTERMEDIARIO, 5)
+    for cor, inicio, fim in zip(CORES_RISCO, faixas, faixas[1:]):
+        formas.add(Rect(x(inicio), y, x(fim) - x(inicio), h, fillColor=cor, strokeColor=None))
+    for valor in analise.VALORES:
+        formas.add(String(x(valor), 4, str(valor), fontSize=7, textAnchor="middle"))
+
+    marca = x(min(max(media, 1), 5))
+    formas.add(Rect(x0, y + h / 2 - 2, marca - x0, 4, fillColor=colors.black, strokeColor=None))
+    formas.add(Polygon([marca - 5, y + h + 8, marca + 5, y + h + 8, marca, y + h],
+                        fillColor=colors.black, strokeColor=None))
+    formas.add(String(marca, y + h + 10, f"{media:.2f}", fontSize=8, textAnchor="middle"))
+    return formas
+
+def grafico_semaforo(media, largura=420, altura=46):
+    """Régua de 1 a 5 com as três faixas de risco e a média marcada."""
+    return Drawing(largura, altura, _formas_semaforo(media, largura, altura))
+
+@lru_cache(maxsize=512)
+def _formas_distribuicao(contagens, largura, altura):
+    formas = Group()
+    x0, y0 = 10, 14
+    maximo = max(contagens) or 1
+    total = sum(contagens) or 1
+    passo = (largura - 2 * x0) / len(analise.VALORES)
+    altura_util = altura - y0 - 14
+
+    formas.add(Line(x0, y0, largura - x0, y0, strokeColor=colors.grey, strokeWidth=0.5))
+    for i, (valor, n) in enumerate(zip(analise.VALORES, contagens)):
+        centro = x0 + passo * (i + 0.5)
+        h = altura_util * n / maximo
+        formas.add(Rect(centro - passo * 0.35, y0, passo * 0.7, h,
+                         fillColor=cor_risco(valor), strokeColor=None))
+        formas.add(String(centro, y0 + h + 3, f"{n} ({n / total:.0%})", fontSize=7, textAnchor="middle"))
+        formas.add(String(centro, y0 - 10, str(valor), fontSize=7, textAnchor="middle"))
+    return formas
+
+def grafico_distribuicao(contagens, largura=420, altura=110):
+    """Barras com as respostas de cada valor (e %), na cor da faixa de risco."""
+    return Drawing(largura, altura, _formas_distribuicao(contagens, largura, altura))
+
+def linhas_estatisticas(resumo):
+    """Texto da seção estatística de uma dimensão (resumo de analise_empresa)."""
+    linhas = []
+    if resumo["desvio_padrao"] is not None:
+        percentis = resumo["percentis"]
+        linhas.append(
+            f"<b>Desvio padrão:</b> {resumo['desvio_padrao']} &nbsp; "
+            f"<b>Percentis 25/50/75:</b> {percentis['p25']} / {percentis['p50']} / {percentis['p75']}"
+        )
+    if resumo["faixas_risco"]:
+        faixas = resumo["faixas_risco"]
+        linhas.append(
+            f"<b>Participantes por faixa:</b> favorável {faixas['baixo']:.0%}, "
+            f"intermediário {faixas['intermediario']:.0%}, alto risco {faixas['alto']:.0%}"
+        )
+    if resumo["alfa_cronbach"] is not None:
+        linhas.append(f"<b>Alfa de Cronbach:</b> {resumo['alfa_cronbach']} ({resumo['itens']} itens)")
+    return linhas
+
+def tabela_perguntas(perguntas, estilos):
+    """Tabela pergunta × contagem de cada valor, com a média."""
+    celula = estilos["BodyText"].clone("celula", fontSize=7, leading=8)
+    linhas = [["Pergunta", *map(str, analise.VALORES), "Média"]]
+    for pergunta in perguntas:
+        linhas.append([
+            Paragraph(pergunta["texto"], celula),
+            *pergunta["distribuicao"],
+            "" if pergunta["media"] is None else pergunta["media"],
+        ])
+    tabela = Table(linhas, colWidths=[250] + [30] * len(analise.VALORES) + [40], repeatRows=1)
+    tabela.setStyle(TableStyle([
+        ("FONTSIZE", (0, 0), (-1, -1), 7),
+        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+        ("ALIGN", (1, 0), (-1, -1), "CENTER"),
+        ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+        ("LINEBELOW", (0, 0), (-1, 0), 0.5, colors.grey),
+        ("ROWBACKGROUNDS", (0, 1), (-1, -1), [colors.white, colors.HexColor("#f2f2f2")]),
+    ]))
+    return tabela
+
+def tabela_eventos(eventos, total, estilos):
+    """
+    Evento × origem: participantes que relataram cada evento e quantos
+    apontaram cada origem (um participante pode apontar várias).
+    """
+    celula = estilos["BodyText"].clone("celula_evento", fontSize=7, leading=8)
+    origens = list(dict.fromkeys(origem for _, por_origem in eventos.values() for origem in por_origem))
+    linhas = [["Evento", "Participantes", *(origem.capitalize() for origem in origens)]]
+    for evento, (participantes, por_origem) in eventos.items():
+        fracao = f" ({participantes / total:.0%})" if total else ""
+        linhas.append([
+            Paragraph(evento, celula),
+            f"{participantes}{fracao}",
+            *(por_origem.get(origem, 0) for origem in origens),
+        ])
+    tabela = Table(linhas, colWidths=[200, 60] + [45] * len(origens), repeatRows=1)
+    tabela.setStyle(TableStyle([
+        ("FONTSIZE", (0, 0), (-1, -1), 7),
+        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+        ("ALIGN", (1, 0), (-1, -1), "CENTER"),
+        ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+        ("LINEBELOW", (0, 0), (-1, 0), 0.5, colors.grey),
+        ("ROWBACKGROUNDS", (0, 1), (-1, -1), [colors.white, colors.HexColor("#f2f2f2")]),
+    ]))
+    return tabela
+
+# segmentos por tabela; os demais continuam numa tabela seguinte
+SEGMENTOS_POR_TABELA = 5
+ROTULOS_SEGMENTO = {"setor": "Setor", "turno": "Turno", "cargo": "Cargo"}
+
+def tabelas_segmentos(segmentos, estilos):
+    """
+    Dimensão × segmento de um atributo (analise_empresa["segmentos"][atributo]),
+    média na cor da faixa de risco. Uma tabela a cada SEGMENTOS_POR_TABELA
+    segmentos para caber na largura da página.
+    """
+    celula = estilos["BodyText"].clone("celula_segmento", fontSize=7, leading=8)
+    # o nome do segmento é texto livre do participante: escapado para o markup do Paragraph
+    dimensoes = list(dict.fromkeys(d for s in segmentos for d in s["medias"]))
+    tabelas = []
+    for inicio in range(0, len(segmentos), SEGMENTOS_POR_TABELA):
+        parte = segmentos[inicio:inicio + SEGMENTOS_POR_TABELA]
+        linhas = [[
+            "Dimensão",
+            *(Paragraph(escape(f"{(s['segmento'] or 'não informado').capitalize()} ({s['participantes']})"),
+                        celula)
+              for s in parte),
+        ]]
+        estilo = [
+            ("FONTSIZE", (0, 0), (-1, -1), 7),
+            ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+            ("ALIGN", (1, 0), (-1, -1), "CENTER"),
+            ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+            ("LINEBELOW", (0, 0), (-1, 0), 0.5, colors.grey),
+            ("ROWBACKGROUNDS", (0, 1), (-1, -1), [colors.white, colors.HexColor("#f2f2f2")]),
+        ]
+        for linha, dimensao in enumerate(dimensoes, start=1):
+            medias = [s["medias"].get(dimensao) for s in parte]
+            linhas.append([Paragraph(dimensao, celula), *("–" if m is None else m for m in medias)])
+            for coluna, media in enumerate(medias, start=1):
+                if media is not None:
+                    estilo.append(("TEXTCOLOR", (coluna, linha), (coluna, linha), cor_risco(media)))
+                    estilo.append(("FONTNAME", (coluna, linha), (coluna, linha), "Helvetica-Bold"))
+        tabela = Table(linhas, colWidths=[200] + [60] * len(parte), repeatRows=1)
+        tabela.setStyle(TableStyle(estilo))
+        tabelas.append(tabela)
+    return tabelas
+
+def elementos_relatorio(empresa, total, resultados, eventos, distribuicao=None,
+                        graficos=True, estatisticas=None):
+    """
+    Flowables do relatório, na ordem. graficos=False deixa só o texto;
+    `estatisticas` (resultado de analise_empresa) acrescenta as seções
+    estatísticas.
+    """
+    distribuicao = distribuicao or {}
+    por_dimensao = {d["dimensao"]: d for d in estatisticas["dimensoes"]} if estatisticas else {}
+
+    estilos = getSampleStyleSheet()
+    elementos = []
+
+    # =============================
+    # CAPA
+    # =============================
+    elementos.append(Paragraph("Relatório de Avaliação Psicossocial", estilos["Title"]))
+    elementos.append(Spacer(1, 20))
+    elementos.append(Paragraph(f"<b>Empresa:</b> {empresa}", estilos["Normal"]))
+    elementos.append(Paragraph(f"<b>Participantes:</b> {total}", estilos["Normal"]))
+    elementos.append(Spacer(1, 30))
+
+    # =============================
+    # DIMENSÕES COM PONTUAÇÃO
+    # =============================
+    for dim, media in resultados.items():
+        elementos.append(Paragraph(dim, estilos["Heading2"]))
+        elementos.append(Spacer(1, 8))
+
+        elementos.append(
+            Paragraph(f"<b>Média da dimensão:</b> {media}", estilos["Normal"])
+        )
+
+        elementos.append(
+            Paragraph(classificar_risco(media), estilos["Normal"])
+        )
+
+        if graficos:
+            elementos.append(Spacer(1, 6))
+            elementos.append(grafico_semaforo(media))
+            if dim in distribuicao:
+                elementos.append(Paragraph("Distribuição das respostas (1 a 5)", estilos["Italic"]))
+                elementos.append(grafico_distribuicao(distribuicao[dim]))
+
+        if dim in por_dimensao:
+            elementos.append(Spacer(1, 6))
+            for linha in linhas_estatisticas(por_dimensao[dim]):
+                elementos.append(Paragraph(linha, estilos["Normal"]))
+
+        elementos.append(Spacer(1, 20))
+
+    # =============================
+    # DISTRIBUIÇÃO POR PERGUNTA
+    # =============================
+    if estatisticas:
+        elementos.append(Paragraph("Distribuição das respostas por pergunta", estilos["Heading1"]))
+        elementos.append(Spacer(1, 10))
+        elementos.append(tabela_perguntas(estatisticas["perguntas"], estilos))
+
+    # =============================
+    # RESULTADOS POR SEGMENTO
+    # =============================
+    if estatisticas and estatisticas.get("segmentos"):
+        elementos.append(Spacer(1, 30))
+        elementos.append(Paragraph("Resultados por segmento", estilos["Heading1"]))
+        elementos.append(Spacer(1, 10))
+        elementos.append(
+            Paragraph(
+                "Médias das dimensões por setor, turno e cargo informados pelos "
+                "participantes (entre parênteses, quantos). Grupos pequenos não "
+                "são exibidos, para preservar o anonimato.",
+                estilos["Italic"]
+            )
+        )
+        for atributo, dados in estatisticas["segmentos"].items():
+            elementos.append(Paragraph(ROTULOS_SEGMENTO.get(atributo, atributo), estilos["Heading2"]))
+            if dados["suprimidos"]:
+                elementos.append(Paragraph(
+                    f"{dados['suprimidos']} grupo(s) omitido(s) por terem poucos participantes.",
+                    estilos["Normal"]
+                ))
+            for tabela in tabelas_segmentos(dados["segmentos"], estilos):
+                elementos.append(Spacer(1, 6))
+                elementos.append(tabela)
+
+    # =============================
+    # DIMENSÃO 11 — EVENTOS (SEMPRE EXIBIR)
+    # =============================
+    elementos.append(Spacer(1, 30))
+    elementos.append(
+        Paragraph("Comportamentos Ofensivos e Eventos Críticos", estilos["Heading1"])
+    )
+    elementos.append(Spacer(1, 15))
+
+    elementos.append(
+        Paragraph(
+            "⚠️ Os itens abaixo representam ocorrência de eventos e "
+            "não geram pontuação ou classificação de risco.",
+            estilos["Italic"]
+        )
+    )
+
+    elementos.append(Spacer(1, 10))
+
+    if eventos:
+        elementos.append(tabela_eventos(eventos, total, estilos))
+    else:
+        elementos.append(
+            Paragraph(
+                "• Não foram registradas ocorrências de comportamentos ofensivos "
+                "ou eventos críticos no período avaliado.",
+                estilos["Normal"]
+            )
+        )
+    return elementos
+
+def salvar(caminho, elementos):
+    SimpleDocTemplate(caminho, pagesize=A4).build(elementos)